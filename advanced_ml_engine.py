@@ -5,8 +5,13 @@ import logging
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 from models import EmailRecord, WhitelistDomain
+from keyword_matcher import get_matcher
+from session_snapshot import get_session_snapshot
+from result_cache import get_result_cache
+from stats_service import StatsService
 from app import db
 import re
+import hashlib
 
 logger = logging.getLogger(__name__)
 
@@ -16,52 +21,59 @@ class AdvancedMLEngine:
     def __init__(self):
         self.business_hours = (8, 18)  # 8 AM to 6 PM
         self.business_days = [0, 1, 2, 3, 4]  # Monday to Friday
+        self.stats_service = StatsService()
+        self.result_cache = get_result_cache()
     
     def analyze_bau_patterns(self, session_id):
         """Analyze Business As Usual communication patterns"""
         try:
-            # Check if we've already analyzed this session recently
-            if hasattr(self, '_bau_cache') and session_id in self._bau_cache:
-                return self._bau_cache[session_id]
-                
+            # Reuse the result computed for this version of the session's data
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('bau_patterns', session_id, data_version, self._whitelist_fingerprint())
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
             logger.info(f"Analyzing BAU patterns for session {session_id}")
             
-            # Get all records for the session
-            records = EmailRecord.query.filter_by(session_id=session_id).all()
+            # Shared columnar snapshot of the session's records
+            snapshot = get_session_snapshot(session_id)
             
-            if not records:
+            if not len(snapshot):
                 return {'error': 'No records found'}
             
             # Analyze sender-recipient domain patterns
-            domain_patterns = self._analyze_domain_patterns(records)
+            domain_patterns = self._analyze_domain_patterns(snapshot)
             
             # Identify high-volume communications
             high_volume_pairs = self._identify_high_volume_communications(domain_patterns)
             
             # Generate whitelist recommendations
-            whitelist_recommendations = self._generate_whitelist_recommendations(high_volume_pairs, records)
+            whitelist_recommendations = self._generate_whitelist_recommendations(high_volume_pairs, snapshot)
             
             # Analyze communication frequency
-            frequency_analysis = self._analyze_communication_frequency(records)
+            frequency_analysis = self._analyze_communication_frequency(snapshot)
+            
+            sender_domains = self._sender_domains(snapshot)[snapshot.present('sender')]
+            recipient_domains = snapshot['recipients_email_domain'][snapshot.present('recipients_email_domain')]
             
             analysis = {
-                'total_records_analyzed': len(records),
-                'unique_sender_domains': len(set(self._extract_domain(r.sender) for r in records if r.sender)),
-                'unique_recipient_domains': len(set(r.recipients_email_domain for r in records if r.recipients_email_domain)),
+                'total_records_analyzed': len(snapshot),
+                'unique_sender_domains': len(set(sender_domains)),
+                'unique_recipient_domains': len(set(recipient_domains)),
                 'domain_patterns': domain_patterns,
                 'high_volume_pairs': high_volume_pairs,
                 'whitelist_recommendations': whitelist_recommendations,
                 'frequency_analysis': frequency_analysis,
-                'bau_statistics': self._calculate_bau_statistics(records)
+                'bau_statistics': self._calculate_bau_statistics(snapshot, domain_patterns)
             }
             
-            # Cache the result
-            if not hasattr(self, '_bau_cache'):
-                self._bau_cache = {}
-            self._bau_cache[session_id] = analysis
+            # Cache the result unless the session changed while it was analyzed
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, analysis, session_id)
             
             return analysis
-            
+        
         except Exception as e:
             logger.error(f"Error analyzing BAU patterns: {str(e)}")
             return {'error': str(e)}
@@ -69,16 +81,19 @@ class AdvancedMLEngine:
     def analyze_attachment_risks(self, session_id):
         """Comprehensive attachment risk analysis"""
         try:
-            # Check if we've already analyzed this session recently
-            if hasattr(self, '_attachment_cache') and session_id in self._attachment_cache:
-                return self._attachment_cache[session_id]
+            # Reuse the result computed for this version of the session's data
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('attachment_risks', session_id, data_version)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
             logger.info(f"Analyzing attachment risks for session {session_id}")
             
-            # Get all records for the session
-            records = EmailRecord.query.filter_by(session_id=session_id).all()
+            # Shared columnar snapshot of the session's records
+            snapshot = get_session_snapshot(session_id)
             
-            if not records:
+            if not len(snapshot):
                 return {
                     'total_attachments': 0,
                     'risk_distribution': {
@@ -99,9 +114,9 @@ class AdvancedMLEngine:
             attachment_analysis = []
             risk_scores = []
             
-            for record in records:
-                if record.attachments and record.attachments.strip():
-                    attachment_info = self._analyze_single_attachment(record.attachments, record)
+            for attachments, record_id in snapshot.iter_rows('attachments', 'id'):
+                if attachments and attachments.strip():
+                    attachment_info = self._analyze_single_attachment(attachments, record_id)
                     if attachment_info:
                         attachment_analysis.append(attachment_info)
                         risk_scores.append(attachment_info.get('risk_score', 0))
@@ -129,50 +144,9 @@ class AdvancedMLEngine:
                 'recommendations': self._generate_attachment_recommendations(attachment_analysis)
             }
             
-            # Cache the result
-            if not hasattr(self, '_attachment_cache'):
-                self._attachment_cache = {}
-            self._attachment_cache[session_id] = analysis
-            
-            return analysis
-                
-            logger.info(f"Analyzing attachment risks for session {session_id}")
-            
-            records_with_attachments = EmailRecord.query.filter(
-                EmailRecord.session_id == session_id,
-                EmailRecord.attachments.isnot(None),
-                EmailRecord.attachments != ''
-            ).all()
-            
-            if not records_with_attachments:
-                return {'message': 'No attachments found in session'}
-            
-            # Risk categorization
-            risk_categories = self._categorize_attachment_risks(records_with_attachments)
-            
-            # Malware indicators
-            malware_indicators = self._detect_malware_indicators(records_with_attachments)
-            
-            # Data exfiltration patterns
-            exfiltration_patterns = self._detect_exfiltration_patterns(records_with_attachments)
-            
-            # Risk scoring distribution
-            risk_distribution = self._analyze_attachment_risk_distribution(records_with_attachments)
-            
-            analysis = {
-                'total_attachments': len(records_with_attachments),
-                'risk_categories': risk_categories,
-                'malware_indicators': malware_indicators,
-                'exfiltration_patterns': exfiltration_patterns,
-                'risk_distribution': risk_distribution,
-                'top_risk_attachments': self._get_top_risk_attachments(records_with_attachments),
-                'recommendations': self._generate_attachment_recommendations(records_with_attachments)
-            }
-            
-            # Cache the result
-            if not hasattr(self, '_attachment_cache'):
-                self._attachment_cache = {}
-            self._attachment_cache[session_id] = analysis
+            # Cache the result unless the session changed while it was analyzed
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, analysis, session_id)
             
             return analysis
             
@@ -195,7 +169,7 @@ class AdvancedMLEngine:
                 'error': str(e)
             }
     
-    def _analyze_single_attachment(self, attachment_str, record):
+    def _analyze_single_attachment(self, attachment_str, record_id='unknown'):
         """Analyze a single attachment string"""
         try:
             # Simple attachment analysis
@@ -207,22 +181,26 @@ class AdvancedMLEngine:
                 
                 # Check for high-risk file extensions
                 high_risk_extensions = ['.exe', '.scr', '.bat', '.cmd', '.com', '.pif', '.jar']
+                archive_extensions = ['.zip', '.rar', '.7z', '.tar', '.gz']
+                doc_extensions = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']
+                
+                # One scan finds every extension in the attachment string
+                found = get_matcher(high_risk_extensions + archive_extensions + doc_extensions).find_all(attachment_lower)
+                
                 for ext in high_risk_extensions:
-                    if ext in attachment_lower:
+                    if ext in found:
                         risk_score += 0.8
                         indicators.append(f'high_risk_extension_{ext[1:]}')
                 
                 # Check for archive files
-                archive_extensions = ['.zip', '.rar', '.7z', '.tar', '.gz']
                 for ext in archive_extensions:
-                    if ext in attachment_lower:
+                    if ext in found:
                         risk_score += 0.3
                         indicators.append(f'archive_{ext[1:]}')
                 
                 # Check for document files
-                doc_extensions = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']
                 for ext in doc_extensions:
-                    if ext in attachment_lower:
+                    if ext in found:
                         risk_score += 0.1
                         indicators.append(f'document_{ext[1:]}')
             
@@ -230,7 +208,7 @@ class AdvancedMLEngine:
                 'attachment': attachment_str,
                 'risk_score': min(risk_score, 1.0),  # Cap at 1.0
                 'indicators': indicators,
-                'record_id': getattr(record, 'id', 'unknown')
+                'record_id': record_id
             }
             
         except Exception as e:
@@ -310,81 +288,147 @@ class AdvancedMLEngine:
         
         return recommendations
     
-    def analyze_sender_behavior(self, session_id):
+    def analyze_sender_behavior(self, session_id, top_k=50):
         """Analyze individual sender behavior patterns"""
         try:
-            records = EmailRecord.query.filter_by(session_id=session_id).all()
-            
-            sender_analysis = defaultdict(lambda: {
-                'total_emails': 0,
-                'external_emails': 0,
-                'high_risk_emails': 0,
-                'attachments_sent': 0,
-                'risk_score_avg': 0,
-                'domains_contacted': set(),
-                'time_patterns': [],
-                'behavior_flags': []
+            # Reuse the result computed for this version of the session's data
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('sender_behavior', session_id, data_version, top_k)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            snapshot = get_session_snapshot(session_id)
+            
+            # Group records by lowercased sender; codes number senders in order of first appearance
+            sender_rows = np.flatnonzero(snapshot.present('sender'))
+            codes, senders = pd.factorize(self._sender_lower(snapshot)[sender_rows], sort=False)
+            frame = pd.DataFrame({
+                'sender': codes,
+                'external': self._external_mask(snapshot)[sender_rows],
+                'high_risk': snapshot['ml_risk_score'][sender_rows] > 0.6,
+                'attachment': snapshot.present('attachments')[sender_rows],
+                'domain': self._recipient_domains(snapshot)[sender_rows]
             })
+            grouped = frame.groupby('sender', sort=True)
+            
+            totals = grouped.size().to_numpy()
+            sender_stats = {
+                'total_emails': totals,
+                'external_emails': grouped['external'].sum().to_numpy(),
+                'high_risk_emails': grouped['high_risk'].sum().to_numpy(),
+                'attachments_sent': grouped['attachment'].sum().to_numpy(),
+                # Distinct recipient domains per sender; records without one are not counted
+                'domain_count': grouped['domain'].nunique().to_numpy(),
+                # bincount adds in record order, like the per-record running sum it replaces
+                'risk_score_avg': np.bincount(codes, weights=self._risk_scores(snapshot)[sender_rows],
+                                              minlength=len(senders)) / totals
+            }
+            sender_stats['external_ratio'] = sender_stats['external_emails'] / totals
             
-            for record in records:
-                if not record.sender:
-                    continue
-                
-                sender = record.sender.lower()
-                analysis = sender_analysis[sender]
-                
-                analysis['total_emails'] += 1
-                
-                # External communication analysis
-                if record.recipients_email_domain:
-                    analysis['domains_contacted'].add(record.recipients_email_domain.lower())
-                    if self._is_external_domain(record.recipients_email_domain):
-                        analysis['external_emails'] += 1
-                
-                # Risk analysis
-                if record.ml_risk_score and record.ml_risk_score > 0.6:
-                    analysis['high_risk_emails'] += 1
-                
-                if record.attachments:
-                    analysis['attachments_sent'] += 1
-                
-                # Time pattern analysis
-                if record.time:
-                    analysis['time_patterns'].append(record.time)
-                
-                # Accumulate risk scores
-                if record.ml_risk_score:
-                    analysis['risk_score_avg'] += record.ml_risk_score
-            
-            # Post-process analysis
-            for sender, data in sender_analysis.items():
-                if data['total_emails'] > 0:
-                    data['risk_score_avg'] /= data['total_emails']
-                    data['external_ratio'] = data['external_emails'] / data['total_emails']
-                    data['domains_contacted'] = list(data['domains_contacted'])
-                    
-                    # Generate behavior flags
-                    data['behavior_flags'] = self._generate_behavior_flags(data)
-            
-            # Sort by risk score
-            sorted_senders = sorted(sender_analysis.items(), 
-                                  key=lambda x: x[1]['risk_score_avg'], 
-                                  reverse=True)
+            # Top risky senders without sorting all of them
+            top = self._top_senders(sender_stats['risk_score_avg'], top_k)
+            sender_profiles = {}
+            for code, rows in zip(top, self._rows_by_sender(codes, sender_rows, top)):
+                sender_profiles[senders[code]] = self._sender_profile(snapshot, rows)
+                sender_profiles[senders[code]]['domain_count'] = int(sender_stats['domain_count'][code])
             
-            return {
-                'total_senders': len(sender_analysis),
-                'sender_profiles': dict(sorted_senders[:50]) if sorted_senders else {},  # Top 50 risky senders
-                'summary_statistics': self._calculate_sender_summary_stats(sender_analysis)
+            analysis = {
+                'total_senders': len(senders),
+                'sender_profiles': sender_profiles,
+                'summary_statistics': self._calculate_sender_summary_stats(sender_stats)
             }
             
+            # Cache the result unless the session changed while it was analyzed
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, analysis, session_id)
+            
+            return analysis
+        
         except Exception as e:
             logger.error(f"Error analyzing sender behavior: {str(e)}")
             return {'error': str(e)}
     
+    def get_sender_details(self, session_id, sender_email):
+        """Full behavior profile of one sender, including times, or None if the sender has no records"""
+        try:
+            sender = (sender_email or '').lower()
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('sender_details', session_id, data_version, sender)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            snapshot = get_session_snapshot(session_id)
+            rows = np.flatnonzero(self._sender_lower(snapshot) == sender) if sender else []
+            if not len(rows):
+                return None
+            
+            profile = self._sender_profile(snapshot, rows, include_times=True)
+            
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, profile, session_id)
+            
+            return profile
+        
+        except Exception as e:
+            logger.error(f"Error getting details for sender {sender_email}: {str(e)}")
+            raise
+    
+    def _sender_profile(self, snapshot, rows, include_times=False):
+        """Behavior profile of one sender from their record positions, in record order"""
+        domains = self._recipient_domains(snapshot)[rows]
+        risk_scores = self._risk_scores(snapshot)[rows]
+        total = len(rows)
+        
+        profile = {
+            'total_emails': total,
+            'external_emails': int(np.count_nonzero(self._external_mask(snapshot)[rows])),
+            'high_risk_emails': int(np.count_nonzero(snapshot['ml_risk_score'][rows] > 0.6)),
+            'attachments_sent': int(np.count_nonzero(snapshot.present('attachments')[rows])),
+            'risk_score_avg': sum(risk_scores.tolist()) / total,
+            'domains_contacted': list(set(domain for domain in domains if domain is not None))
+        }
+        if include_times:
+            profile['time_patterns'] = [time for time in snapshot['time'][rows] if time]
+        profile['external_ratio'] = profile['external_emails'] / total
+        
+        # Generate behavior flags
+        profile['behavior_flags'] = self._generate_behavior_flags(profile)
+        return profile
+    
+    def _top_senders(self, risk_averages, top_k):
+        """Codes of the top_k senders by average risk, highest first, ties in order of first appearance"""
+        count = len(risk_averages)
+        if count > top_k > 0:
+            # argpartition finds the cut-off score; every sender tied with it stays a candidate
+            cutoff = risk_averages[np.argpartition(-risk_averages, top_k - 1)[top_k - 1]]
+            candidates = np.flatnonzero(risk_averages >= cutoff)
+        else:
+            candidates = np.arange(count)
+        ordered = candidates[np.lexsort((candidates, -risk_averages[candidates]))]
+        return ordered[:max(top_k, 0)].tolist()
+    
+    def _rows_by_sender(self, codes, sender_rows, selected):
+        """Record positions of each selected sender, in record order"""
+        chosen = np.flatnonzero(np.isin(codes, selected))
+        chosen = chosen[np.argsort(codes[chosen], kind='stable')]
+        chosen_codes = codes[chosen]
+        starts = np.searchsorted(chosen_codes, selected, side='left')
+        ends = np.searchsorted(chosen_codes, selected, side='right')
+        return [sender_rows[chosen[start:end]] for start, end in zip(starts, ends)]
+    
     def analyze_temporal_patterns(self, session_id):
         """Analyze temporal patterns and detect anomalies"""
         try:
-            records = EmailRecord.query.filter_by(session_id=session_id).all()
+            # Reuse the result computed for this version of the session's data
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('temporal_patterns', session_id, data_version)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            snapshot = get_session_snapshot(session_id)
             
             time_analysis = {
                 'hourly_distribution': defaultdict(int),
@@ -398,8 +442,8 @@ class AdvancedMLEngine:
             total_with_time = 0
             business_hours_count = 0
             
-            for record in records:
-                if not record.time:
+            for record_id, sender, time, risk_score in snapshot.iter_rows('record_id', 'sender', 'time', 'ml_risk_score'):
+                if not time:
                     continue
                 
                 total_with_time += 1
@@ -407,7 +451,7 @@ class AdvancedMLEngine:
                 # Basic time parsing (enhance based on actual time format)
                 try:
                     # This is a simplified approach - enhance based on actual timestamp format
-                    time_str = str(record.time).lower()
+                    time_str = str(time).lower()
                     
                     # Extract hour if possible
                     hour_match = re.search(r'(\d{1,2}):(\d{2})', time_str)
@@ -426,17 +470,17 @@ class AdvancedMLEngine:
                         time_analysis['weekend_activity'] += 1
                         
                         # Flag as temporal anomaly if high risk
-                        if record.ml_risk_score and record.ml_risk_score > 0.7:
+                        if risk_score and risk_score > 0.7:
                             time_analysis['temporal_anomalies'].append({
-                                'record_id': record.record_id,
-                                'sender': record.sender,
-                                'time': record.time,
-                                'risk_score': record.ml_risk_score,
+                                'record_id': record_id,
+                                'sender': sender,
+                                'time': time,
+                                'risk_score': risk_score,
                                 'anomaly_type': 'weekend_high_risk'
                             })
                 
                 except Exception as e:
-                    logger.debug(f"Error parsing time for record {record.record_id}: {str(e)}")
+                    logger.debug(f"Error parsing time for record {record_id}: {str(e)}")
                     continue
             
             if total_with_time > 0:
@@ -445,6 +489,10 @@ class AdvancedMLEngine:
             # Identify unusual time patterns
             time_analysis['unusual_patterns'] = self._identify_unusual_time_patterns(time_analysis)
             
+            # Cache the result unless the session changed while it was analyzed
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, time_analysis, session_id)
+            
             return time_analysis
             
         except Exception as e:
@@ -454,28 +502,40 @@ class AdvancedMLEngine:
     def get_advanced_insights(self, session_id):
         """Get comprehensive advanced ML insights"""
         try:
+            # Reuse the result computed for this version of the session's data
+            data_version = self.stats_service.get_data_version(session_id)
+            cache_key = self.result_cache.make_key('advanced_insights', session_id, data_version)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # One snapshot feeds every analysis below
+            snapshot = get_session_snapshot(session_id)
+            
             insights = {
-                'network_analysis': self._analyze_communication_networks(session_id),
-                'justification_analysis': self._analyze_justifications(session_id),
-                'pattern_clusters': self._identify_pattern_clusters(session_id),
-                'risk_correlation': self._analyze_risk_correlations(session_id),
-                'behavioral_anomalies': self._detect_behavioral_anomalies(session_id)
+                'network_analysis': self._analyze_communication_networks(snapshot),
+                'justification_analysis': self._analyze_justifications(snapshot),
+                'pattern_clusters': self._identify_pattern_clusters(snapshot),
+                'risk_correlation': self._analyze_risk_correlations(snapshot),
+                'behavioral_anomalies': self._detect_behavioral_anomalies(snapshot)
             }
             
+            # Cache the result unless the session changed while it was analyzed
+            if snapshot.data_version == data_version:
+                self.result_cache.set(cache_key, insights, session_id)
+            
             return insights
             
         except Exception as e:
             logger.error(f"Error getting advanced insights: {str(e)}")
             return {'error': str(e)}
     
-    def _analyze_domain_patterns(self, records):
+    def _analyze_domain_patterns(self, snapshot):
         """Analyze sender-recipient domain communication patterns"""
         patterns = defaultdict(int)
         
-        for record in records:
-            sender_domain = self._extract_domain(record.sender)
-            recipient_domain = record.recipients_email_domain
-            
+        for sender_domain, recipient_domain in zip(self._sender_domains(snapshot).tolist(),
+                                                   snapshot.to_list('recipients_email_domain')):
             if sender_domain and recipient_domain:
                 pattern_key = f"{sender_domain} -> {recipient_domain.lower()}"
                 patterns[pattern_key] += 1
@@ -489,20 +549,65 @@ class AdvancedMLEngine:
             return None
         return email.split('@')[-1].lower()
     
+    def _sender_domains(self, snapshot):
+        """Lowercased sender domain per record (None without an address)"""
+        return snapshot.derive('sender_domain', lambda: np.array(
+            [self._extract_domain(sender) for sender in snapshot['sender']], dtype=object
+        ))
+    
+    def _external_mask(self, snapshot):
+        """Boolean mask of records sent to an external domain"""
+        def build():
+            # Check each distinct domain once; missing domains (code -1) are not external
+            codes, domains = pd.factorize(snapshot['recipients_email_domain'])
+            external = np.fromiter((self._is_external_domain(domain) for domain in domains),
+                                   dtype=bool, count=len(domains))
+            return np.append(external, False)[codes]
+        return snapshot.derive('external', build)
+    
+    def _risk_scores(self, snapshot):
+        """ml_risk_score with unscored records as 0"""
+        return snapshot.derive('risk_or_zero', lambda: np.nan_to_num(snapshot['ml_risk_score'], nan=0.0))
+    
+    def _sender_lower(self, snapshot):
+        """Lowercased sender per record (None without a sender)"""
+        return snapshot.derive('sender_lower', lambda: np.array(
+            [sender.lower() if sender else None for sender in snapshot['sender']], dtype=object
+        ))
+    
+    def _recipient_domains(self, snapshot):
+        """Lowercased recipient domain per record (None without one)"""
+        return snapshot.derive('recipient_domain_lower', lambda: np.array(
+            [domain.lower() if domain else None for domain in snapshot['recipients_email_domain']], dtype=object
+        ))
+    
+    def _whitelist_fingerprint(self):
+        """Digest of the active whitelist, which the whitelist recommendations depend on"""
+        domains = sorted(domain.lower() for (domain,) in
+                         db.session.query(WhitelistDomain.domain).filter(WhitelistDomain.is_active == True))
+        return hashlib.sha1('\n'.join(domains).encode()).hexdigest()
+    
     def _identify_high_volume_communications(self, domain_patterns):
         """Identify high-volume communication pairs"""
         # Consider patterns with more than 5 communications as high-volume
         threshold = 5
         return {pattern: count for pattern, count in domain_patterns.items() if count >= threshold}
     
-    def _generate_whitelist_recommendations(self, high_volume_pairs, records):
+    def _generate_whitelist_recommendations(self, high_volume_pairs, snapshot):
         """Generate domain whitelist recommendations based on BAU analysis"""
         recommendations = []
         
         # Get currently whitelisted domains
-        current_whitelist = set(domain.domain.lower() for domain in 
+        current_whitelist = set(domain.domain.lower() for domain in
                               WhitelistDomain.query.filter_by(is_active=True).all())
         
+        # Record positions per lowercased recipient domain, grouped in one pass
+        domain_rows = defaultdict(list)
+        for position, domain in enumerate(snapshot['recipients_email_domain']):
+            if domain:
+                domain_rows[domain.lower()].append(position)
+        risk_scores = self._risk_scores(snapshot)
+        
         for pattern, count in high_volume_pairs.items():
             if ' -> ' in pattern:
                 sender_domain, recipient_domain = pattern.split(' -> ')
@@ -510,13 +615,11 @@ class AdvancedMLEngine:
                 # Check if recipient domain is not already whitelisted
                 if recipient_domain not in current_whitelist:
                     # Analyze risk profile for this domain
-                    domain_records = [r for r in records if 
-                                    r.recipients_email_domain and 
-                                    r.recipients_email_domain.lower() == recipient_domain]
+                    domain_scores = risk_scores[domain_rows.get(recipient_domain, [])]
                     
-                    if domain_records:
-                        avg_risk = np.mean([r.ml_risk_score or 0 for r in domain_records])
-                        high_risk_count = sum(1 for r in domain_records if r.ml_risk_score and r.ml_risk_score > 0.6)
+                    if len(domain_scores):
+                        avg_risk = np.mean(domain_scores)
+                        high_risk_count = int(np.count_nonzero(domain_scores > 0.6))
                         
                         recommendation = {
                             'domain': recipient_domain,
@@ -531,16 +634,10 @@ class AdvancedMLEngine:
         
         return sorted(recommendations, key=lambda x: x['communication_count'], reverse=True)
     
-    def _analyze_communication_frequency(self, records):
+    def _analyze_communication_frequency(self, snapshot):
         """Analyze communication frequency patterns"""
-        sender_frequency = defaultdict(int)
-        domain_frequency = defaultdict(int)
-        
-        for record in records:
-            if record.sender:
-                sender_frequency[record.sender.lower()] += 1
-            if record.recipients_email_domain:
-                domain_frequency[record.recipients_email_domain.lower()] += 1
+        sender_frequency = Counter(sender.lower() for sender in snapshot['sender'] if sender)
+        domain_frequency = Counter(domain.lower() for domain in snapshot['recipients_email_domain'] if domain)
         
         return {
             'top_senders': dict(sorted(sender_frequency.items(), key=lambda x: x[1], reverse=True)[:10]),
@@ -552,27 +649,27 @@ class AdvancedMLEngine:
             }
         }
     
-    def _calculate_bau_statistics(self, records):
+    def _calculate_bau_statistics(self, snapshot, domain_patterns):
         """Calculate Business As Usual statistics"""
-        total_records = len(records)
+        total_records = len(snapshot)
         if total_records == 0:
             return {}
         
-        external_communications = sum(1 for r in records if self._is_external_domain(r.recipients_email_domain))
-        with_attachments = sum(1 for r in records if r.attachments)
-        high_risk = sum(1 for r in records if r.ml_risk_score and r.ml_risk_score > 0.6)
+        external_communications = int(np.count_nonzero(self._external_mask(snapshot)))
+        with_attachments = int(np.count_nonzero(snapshot.present('attachments')))
+        high_risk = int(np.count_nonzero(snapshot['ml_risk_score'] > 0.6))
         
         return {
             'total_communications': total_records,
             'external_ratio': external_communications / total_records,
             'attachment_ratio': with_attachments / total_records,
             'high_risk_ratio': high_risk / total_records,
-            'bau_score': self._calculate_bau_score(records)
+            'bau_score': self._calculate_bau_score(snapshot, domain_patterns)
         }
     
-    def _calculate_bau_score(self, records):
+    def _calculate_bau_score(self, snapshot, domain_patterns):
         """Calculate overall BAU score (0-100, higher = more routine)"""
-        if not records:
+        if not len(snapshot):
             return 0
         
         # Factors that indicate BAU
@@ -580,29 +677,25 @@ class AdvancedMLEngine:
         factors = 0
         
         # Low average risk score
-        avg_risk = np.mean([r.ml_risk_score or 0 for r in records])
+        avg_risk = np.mean(self._risk_scores(snapshot))
         if avg_risk < 0.3:
             total_score += 25
         factors += 1
         
         # High volume of repeated patterns
-        domain_patterns = self._analyze_domain_patterns(records)
         repeated_patterns = sum(1 for count in domain_patterns.values() if count > 3)
         if repeated_patterns > len(domain_patterns) * 0.3:
             total_score += 25
         factors += 1
         
         # Low proportion of high-risk communications
-        high_risk_ratio = sum(1 for r in records if r.ml_risk_score and r.ml_risk_score > 0.6) / len(records)
+        high_risk_ratio = int(np.count_nonzero(snapshot['ml_risk_score'] > 0.6)) / len(snapshot)
         if high_risk_ratio < 0.1:
             total_score += 25
         factors += 1
         
         # Consistent sender patterns
-        sender_counts = defaultdict(int)
-        for record in records:
-            if record.sender:
-                sender_counts[record.sender.lower()] += 1
+        sender_counts = Counter(sender.lower() for sender in snapshot['sender'] if sender)
         
         regular_senders = sum(1 for count in sender_counts.values() if count > 2)
         if regular_senders > len(sender_counts) * 0.5:
@@ -611,202 +704,6 @@ class AdvancedMLEngine:
         
         return total_score / factors if factors > 0 else 0
     
-    def _categorize_attachment_risks(self, records):
-        """Categorize attachment risks"""
-        categories = {
-            'executable': 0,
-            'archive': 0,
-            'document': 0,
-            'image': 0,
-            'other': 0,
-            'suspicious_naming': 0
-        }
-        
-        for record in records:
-            attachments_lower = record.attachments.lower()
-            
-            # Executable files
-            if any(ext in attachments_lower for ext in ['.exe', '.scr', '.bat', '.cmd', '.com']):
-                categories['executable'] += 1
-            
-            # Archive files
-            elif any(ext in attachments_lower for ext in ['.zip', '.rar', '.7z', '.tar']):
-                categories['archive'] += 1
-            
-            # Document files
-            elif any(ext in attachments_lower for ext in ['.doc', '.docx', '.pdf', '.xls', '.xlsx']):
-                categories['document'] += 1
-            
-            # Image files
-            elif any(ext in attachments_lower for ext in ['.jpg', '.png', '.gif', '.bmp']):
-                categories['image'] += 1
-            
-            else:
-                categories['other'] += 1
-            
-            # Suspicious naming patterns
-            if any(pattern in attachments_lower for pattern in ['urgent', 'confidential', 'invoice', 'payment']):
-                categories['suspicious_naming'] += 1
-        
-        return categories
-    
-    def _detect_malware_indicators(self, records):
-        """Detect potential malware indicators"""
-        indicators = {
-            'double_extensions': 0,
-            'executable_files': 0,
-            'suspicious_names': 0,
-            'large_files': 0
-        }
-        
-        suspicious_names = ['invoice', 'receipt', 'urgent', 'payment', 'statement', 'document']
-        
-        for record in records:
-            attachments_lower = record.attachments.lower()
-            
-            # Double extensions
-            if re.search(r'\.\w+\.\w+', attachments_lower):
-                indicators['double_extensions'] += 1
-            
-            # Executable files
-            if any(ext in attachments_lower for ext in ['.exe', '.scr', '.bat', '.cmd']):
-                indicators['executable_files'] += 1
-            
-            # Suspicious names
-            if any(name in attachments_lower for name in suspicious_names):
-                indicators['suspicious_names'] += 1
-            
-            # Large files (if size information available)
-            if 'large' in attachments_lower or 'mb' in attachments_lower:
-                indicators['large_files'] += 1
-        
-        return indicators
-    
-    def _detect_exfiltration_patterns(self, records):
-        """Detect potential data exfiltration patterns"""
-        patterns = {
-            'bulk_data_transfers': 0,
-            'sensitive_file_types': 0,
-            'external_personal_domains': 0,
-            'off_hours_transfers': 0
-        }
-        
-        sensitive_types = ['database', 'backup', 'export', 'dump', 'customer', 'employee']
-        personal_domains = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']
-        
-        for record in records:
-            attachments_lower = record.attachments.lower()
-            
-            # Bulk transfers (multiple files or large files)
-            if ',' in record.attachments or 'multiple' in attachments_lower:
-                patterns['bulk_data_transfers'] += 1
-            
-            # Sensitive file types
-            if any(stype in attachments_lower for stype in sensitive_types):
-                patterns['sensitive_file_types'] += 1
-            
-            # External personal domains
-            if record.recipients_email_domain and any(domain in record.recipients_email_domain.lower() 
-                                                     for domain in personal_domains):
-                patterns['external_personal_domains'] += 1
-            
-            # Off-hours (basic detection)
-            if record.time and any(indicator in record.time.lower() 
-                                 for indicator in ['night', 'weekend', 'holiday']):
-                patterns['off_hours_transfers'] += 1
-        
-        return patterns
-    
-    def _analyze_attachment_risk_distribution(self, records):
-        """Analyze the distribution of attachment risk scores"""
-        risk_scores = []
-        
-        for record in records:
-            # Calculate attachment-specific risk score
-            risk_score = self._calculate_detailed_attachment_risk(record.attachments)
-            risk_scores.append(risk_score)
-        
-        if not risk_scores:
-            return {}
-        
-        return {
-            'mean_risk': float(np.mean(risk_scores)),
-            'median_risk': float(np.median(risk_scores)),
-            'std_risk': float(np.std(risk_scores)),
-            'high_risk_count': sum(1 for score in risk_scores if score > 0.7),
-            'medium_risk_count': sum(1 for score in risk_scores if 0.4 <= score <= 0.7),
-            'low_risk_count': sum(1 for score in risk_scores if score < 0.4)
-        }
-    
-    def _calculate_detailed_attachment_risk(self, attachments):
-        """Calculate detailed attachment risk score"""
-        if not attachments:
-            return 0.0
-        
-        attachments_lower = attachments.lower()
-        risk_score = 0.0
-        
-        # File extension risks
-        if any(ext in attachments_lower for ext in ['.exe', '.scr', '.bat']):
-            risk_score += 0.8
-        elif any(ext in attachments_lower for ext in ['.zip', '.rar']):
-            risk_score += 0.4
-        elif any(ext in attachments_lower for ext in ['.doc', '.pdf']):
-            risk_score += 0.2
-        
-        # Naming patterns
-        if any(pattern in attachments_lower for pattern in ['urgent', 'confidential', 'invoice']):
-            risk_score += 0.3
-        
-        # Size indicators
-        if any(size in attachments_lower for size in ['large', 'big', 'huge']):
-            risk_score += 0.2
-        
-        return min(risk_score, 1.0)
-    
-    def _get_top_risk_attachments(self, records):
-        """Get top risky attachments with details"""
-        attachment_risks = []
-        
-        for record in records:
-            risk_score = self._calculate_detailed_attachment_risk(record.attachments)
-            if risk_score > 0.5:
-                attachment_risks.append({
-                    'record_id': record.record_id,
-                    'sender': record.sender,
-                    'recipient_domain': record.recipients_email_domain,
-                    'attachments': record.attachments,
-                    'risk_score': risk_score,
-                    'overall_risk_level': record.risk_level
-                })
-        
-        return sorted(attachment_risks, key=lambda x: x['risk_score'], reverse=True)[:20]
-    
-    def _generate_attachment_recommendations(self, records):
-        """Generate recommendations based on attachment analysis"""
-        recommendations = []
-        
-        # Count high-risk attachments
-        high_risk_count = sum(1 for r in records 
-                            if self._calculate_detailed_attachment_risk(r.attachments) > 0.7)
-        
-        if high_risk_count > 0:
-            recommendations.append(f"Immediately review {high_risk_count} high-risk attachments")
-        
-        # Executable file recommendations
-        exe_count = sum(1 for r in records 
-                      if any(ext in r.attachments.lower() for ext in ['.exe', '.scr', '.bat']))
-        if exe_count > 0:
-            recommendations.append(f"Block or quarantine {exe_count} executable files")
-        
-        # Archive file recommendations
-        archive_count = sum(1 for r in records 
-                          if any(ext in r.attachments.lower() for ext in ['.zip', '.rar']))
-        if archive_count > 5:
-            recommendations.append(f"Implement additional scanning for {archive_count} archive files")
-        
-        return recommendations
-    
     def _is_external_domain(self, domain):
         """Check if domain is external (not corporate)"""
         if not domain:
@@ -835,19 +732,18 @@ class AdvancedMLEngine:
         
         return flags
     
-    def _calculate_sender_summary_stats(self, sender_analysis):
+    def _calculate_sender_summary_stats(self, sender_stats):
         """Calculate summary statistics for sender analysis"""
-        if not sender_analysis:
+        if not len(sender_stats['total_emails']):
             return {}
         
-        all_senders = list(sender_analysis.values())
-        
         return {
-            'total_senders': len(all_senders),
-            'avg_emails_per_sender': np.mean([s['total_emails'] for s in all_senders]),
-            'high_risk_senders': len([s for s in all_senders if s['risk_score_avg'] > 0.6]),
-            'external_focused_senders': len([s for s in all_senders if s['external_ratio'] > 0.5]),
-            'attachment_senders': len([s for s in all_senders if s['attachments_sent'] > 0])
+            'total_senders': len(sender_stats['total_emails']),
+            'avg_emails_per_sender': np.mean(sender_stats['total_emails']),
+            'high_risk_senders': int(np.count_nonzero(sender_stats['risk_score_avg'] > 0.6)),
+            'external_focused_senders': int(np.count_nonzero(sender_stats['external_ratio'] > 0.5)),
+            'attachment_senders': int(np.count_nonzero(sender_stats['attachments_sent'] > 0)),
+            'avg_domains_per_sender': np.mean(sender_stats['domain_count'])
         }
     
     def _identify_unusual_time_patterns(self, time_analysis):
@@ -868,15 +764,13 @@ class AdvancedMLEngine:
         
         return patterns
     
-    def _analyze_communication_networks(self, session_id):
+    def _analyze_communication_networks(self, snapshot):
         """Analyze communication networks and relationships"""
         # Simplified network analysis
-        records = EmailRecord.query.filter_by(session_id=session_id).all()
-        
         sender_network = defaultdict(set)
-        for record in records:
-            if record.sender and record.recipients_email_domain:
-                sender_network[record.sender].add(record.recipients_email_domain)
+        for sender, domain in snapshot.iter_rows('sender', 'recipients_email_domain'):
+            if sender and domain:
+                sender_network[sender].add(domain)
         
         network_stats = {
             'total_nodes': len(sender_network),
@@ -886,15 +780,12 @@ class AdvancedMLEngine:
         
         return network_stats
     
-    def _analyze_justifications(self, session_id):
+    def _analyze_justifications(self, snapshot):
         """Analyze email justifications for sentiment and patterns"""
-        records = EmailRecord.query.filter(
-            EmailRecord.session_id == session_id,
-            EmailRecord.justification.isnot(None),
-            EmailRecord.justification != ''
-        ).all()
+        justifications = [justification for justification in snapshot['justification']
+                          if justification is not None and justification != '']
         
-        if not records:
+        if not justifications:
             return {'message': 'No justifications found'}
         
         # Simple sentiment analysis
@@ -902,8 +793,8 @@ class AdvancedMLEngine:
         negative_terms = ['mistake', 'error', 'unauthorized', 'personal', 'wrong']
         
         sentiment_scores = []
-        for record in records:
-            justification_lower = record.justification.lower()
+        for justification in justifications:
+            justification_lower = justification.lower()
             positive_count = sum(1 for term in positive_terms if term in justification_lower)
             negative_count = sum(1 for term in negative_terms if term in justification_lower)
             
@@ -915,30 +806,26 @@ class AdvancedMLEngine:
                 sentiment_scores.append(0)  # Neutral
         
         return {
-            'total_justifications': len(records),
+            'total_justifications': len(justifications),
             'positive_sentiment': sentiment_scores.count(1),
             'negative_sentiment': sentiment_scores.count(-1),
             'neutral_sentiment': sentiment_scores.count(0)
         }
     
-    def _identify_pattern_clusters(self, session_id):
+    def _identify_pattern_clusters(self, snapshot):
         """Identify clusters of similar communication patterns"""
         # Simplified clustering based on communication characteristics
-        records = EmailRecord.query.filter_by(session_id=session_id).all()
-        
         clusters = {
-            'high_risk_cluster': len([r for r in records if r.ml_risk_score and r.ml_risk_score > 0.7]),
-            'external_communication_cluster': len([r for r in records if self._is_external_domain(r.recipients_email_domain)]),
-            'attachment_cluster': len([r for r in records if r.attachments]),
-            'leaver_cluster': len([r for r in records if r.leaver and r.leaver.lower() in ['yes', 'true']])
+            'high_risk_cluster': int(np.count_nonzero(snapshot['ml_risk_score'] > 0.7)),
+            'external_communication_cluster': int(np.count_nonzero(self._external_mask(snapshot))),
+            'attachment_cluster': int(np.count_nonzero(snapshot.present('attachments'))),
+            'leaver_cluster': sum(1 for leaver in snapshot['leaver'] if leaver and leaver.lower() in ['yes', 'true'])
         }
         
         return clusters
     
-    def _analyze_risk_correlations(self, session_id):
+    def _analyze_risk_correlations(self, snapshot):
         """Analyze correlations between different risk factors"""
-        records = EmailRecord.query.filter_by(session_id=session_id).all()
-        
         correlations = {
             'attachment_risk_correlation': 0,
             'external_domain_risk_correlation': 0,
@@ -946,32 +833,31 @@ class AdvancedMLEngine:
         }
         
         # Calculate simple correlations
-        records_with_risk = [r for r in records if r.ml_risk_score is not None]
+        scored = ~np.isnan(snapshot['ml_risk_score'])
         
-        if records_with_risk:
+        if scored.any():
             # Attachment correlation
-            attachment_risks = [1 if r.attachments else 0 for r in records_with_risk]
-            risk_scores = [r.ml_risk_score for r in records_with_risk]
+            attachment_risks = snapshot.present('attachments')[scored].astype(int)
+            risk_scores = snapshot['ml_risk_score'][scored]
             
-            if len(set(attachment_risks)) > 1:
+            if len(set(attachment_risks.tolist())) > 1:
                 correlations['attachment_risk_correlation'] = np.corrcoef(attachment_risks, risk_scores)[0, 1]
         
         return correlations
     
-    def _detect_behavioral_anomalies(self, session_id):
+    def _detect_behavioral_anomalies(self, snapshot):
         """Detect behavioral anomalies at the session level"""
-        records = EmailRecord.query.filter_by(session_id=session_id).all()
-        
+        total_records = len(snapshot)
         anomalies = []
         
         # Unusual volume of high-risk communications
-        high_risk_count = sum(1 for r in records if r.ml_risk_score and r.ml_risk_score > 0.7)
-        if high_risk_count > len(records) * 0.2:
-            anomalies.append(f"Unusually high proportion of risky communications: {high_risk_count}/{len(records)}")
+        high_risk_count = int(np.count_nonzero(snapshot['ml_risk_score'] > 0.7))
+        if high_risk_count > total_records * 0.2:
+            anomalies.append(f"Unusually high proportion of risky communications: {high_risk_count}/{total_records}")
         
         # Unusual external communication patterns
-        external_count = sum(1 for r in records if self._is_external_domain(r.recipients_email_domain))
-        if external_count > len(records) * 0.8:
-            anomalies.append(f"Unusually high external communication: {external_count}/{len(records)}")
+        external_count = int(np.count_nonzero(self._external_mask(snapshot)))
+        if external_count > total_records * 0.8:
+            anomalies.append(f"Unusually high external communication: {external_count}/{total_records}")
         
         return anomalies
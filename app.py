@@ -47,3 +47,7 @@ with app.app_context():
     
     # Create all tables
     db.create_all()
+    
+    # Full-text case search index (FTS5 table or GIN index), which create_all does not manage
+    from search_index import SearchIndex
+    SearchIndex().ensure_schema()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Feature engineering benchmark for Email Guardian
+Measures MLEngine feature building and risk scoring throughput (rows/second)
+
+Usage:
+    python3 benchmark_features.py [rows ...]
+
+Defaults to 10k, 100k and 1M rows of synthetic records.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add current directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///benchmark_features.db')
+
+def build_frame(row_count):
+    """Synthetic records in the shape MLEngine._records_to_dataframe produces"""
+    rng = np.random.default_rng(42)
+    index = np.arange(row_count)
+
+    def pick(options):
+        return np.asarray(options, dtype=object)[rng.integers(0, len(options), row_count)]
+
+    return pd.DataFrame({
+        'record_id': [f'benchmark_{i}' for i in index],
+        'sender': pick([f'user{i}@company.com' for i in range(500)]),
+        'subject': pick(['quarterly report', 'project update', 'meeting agenda', 'urgent invoice', '']),
+        'attachments': pick(['', 'report.pdf', 'data.xlsx', 'setup.exe', 'archive.zip;notes.docx']),
+        'recipients': pick(['contact@partner.com', 'someone@gmail.com', 'team@company.com']),
+        'recipients_email_domain': pick(['partner.com', 'gmail.com', 'company.com', 'yahoo.com', 'corp.com']),
+        'wordlist_attachment': pick(['', '', '', 'confidential']),
+        'wordlist_subject': pick(['', '', 'payroll']),
+        'justification': pick(['', 'business requirement', 'urgent client request', 'sent by mistake']),
+        'time': [f'2025-01-{(i % 28) + 1:02d}t{i % 24:02d}:{i % 60:02d}:23' for i in index],
+        'leaver': pick(['no', 'no', 'no', 'yes']),
+        'department': pick(['finance', 'it', 'sales']),
+        'bunit': pick(['retail', 'corporate'])
+    })
+
+def benchmark(ml_engine, row_count):
+    """Time feature building and risk scoring for one frame size"""
+    df = build_frame(row_count)
+
+    start = time.perf_counter()
+    attachment_results = ml_engine._score_attachments(df['attachments'])
+    df['attachment_risk'] = [risk for risk, _ in attachment_results]
+    attachment_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    features = ml_engine._engineer_features(df)
+    feature_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ml_engine._calculate_risk_scores(df, np.zeros(row_count))
+    risk_seconds = time.perf_counter() - start
+
+    return {
+        'rows': row_count,
+        'attachment_rows_per_second': row_count / attachment_seconds if attachment_seconds > 0 else 0,
+        'feature_rows_per_second': row_count / feature_seconds if feature_seconds > 0 else 0,
+        'risk_rows_per_second': row_count / risk_seconds if risk_seconds > 0 else 0,
+        'matrix': f"{features.shape[0]}x{features.shape[1]} {features.dtype}"
+    }
+
+def main():
+    row_counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    from app import app
+    from ml_engine import MLEngine
+
+    with app.app_context():
+        ml_engine = MLEngine()
+        ml_engine.load_attachment_keywords(force=True)
+
+        print("=== Email Guardian Feature Engineering Benchmark ===")
+        print(f"{'rows':>10} {'attachments/s':>15} {'features/s':>15} {'risk scores/s':>15}  matrix")
+        print("-" * 75)
+        for row_count in row_counts:
+            result = benchmark(ml_engine, row_count)
+            print(f"{result['rows']:>10,} {result['attachment_rows_per_second']:>15,.0f} "
+                  f"{result['feature_rows_per_second']:>15,.0f} {result['risk_rows_per_second']:>15,.0f}  {result['matrix']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Index benchmark for Email Guardian
+Checks with EXPLAIN that the hot dashboard and case queries use the email_records
+indexes, and times them with and without those indexes
+
+Usage:
+    python3 benchmark_indexes.py [rows] [sessions]
+
+Runs against DATABASE_URL when set, otherwise a throwaway SQLite database.
+"""
+
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Add current directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///benchmark_indexes.db')
+
+def build_sessions(row_count, session_count):
+    """Insert synthetic processed sessions and return their ids"""
+    from sqlalchemy import insert
+    from app import db
+    from models import ProcessingSession, EmailRecord
+
+    session_ids = []
+    per_session = max(row_count // session_count, 1)
+    for _ in range(session_count):
+        session_id = str(uuid.uuid4())
+        session = ProcessingSession()
+        session.id = session_id
+        session.filename = 'benchmark_indexes.csv'
+        session.status = 'benchmark'
+        db.session.add(session)
+        session_ids.append(session_id)
+    db.session.commit()
+
+    risk_levels = ['Low', 'Low', 'Low', 'Medium', 'High', 'Critical']
+    for session_id in session_ids:
+        rows = []
+        for i in range(per_session):
+            rows.append({
+                'session_id': session_id,
+                'record_id': f'{session_id}_{i}',
+                'sender': f'user{i % 500}@company.com',
+                'subject': f'quarterly report {i}',
+                'recipients_email_domain': 'company.com' if i % 3 == 0 else f'partner{i % 40}.com',
+                'whitelisted': i % 3 == 0,
+                'excluded_by_rule': 'benchmark exclusion' if i % 10 == 1 else None,
+                'rule_matches': '[{"rule_name": "benchmark"}]' if i % 50 == 2 else None,
+                'ml_risk_score': (i * 7919 % 1000) / 1000,
+                'risk_level': risk_levels[i % len(risk_levels)],
+                'case_status': 'Escalated' if i % 200 == 5 else 'Active',
+                'escalated_at': datetime.utcnow() if i % 200 == 5 else None
+            })
+        db.session.execute(insert(EmailRecord.__table__), rows)
+        db.session.commit()
+
+    return session_ids
+
+def hot_queries(session_id):
+    """(name, query) pairs mirroring the dashboard, cases and escalation pages"""
+    from app import db
+    from models import EmailRecord
+
+    count = db.func.count(EmailRecord.id)
+    return [
+        ('excluded count', EmailRecord.query.with_entities(count).filter(
+            EmailRecord.session_id == session_id, EmailRecord.excluded_by_rule.isnot(None))),
+        ('whitelisted count', EmailRecord.query.with_entities(count).filter_by(
+            session_id=session_id, whitelisted=True)),
+        ('rule matches count', EmailRecord.query.with_entities(count).filter(
+            EmailRecord.session_id == session_id, EmailRecord.rule_matches.isnot(None))),
+        ('critical count', EmailRecord.query.with_entities(count).filter_by(
+            session_id=session_id, risk_level='Critical').filter(EmailRecord.whitelisted != True)),
+        ('active cases page', EmailRecord.query.filter(
+            EmailRecord.session_id == session_id,
+            EmailRecord.whitelisted != True,
+            EmailRecord.excluded_by_rule.is_(None)
+        ).order_by(EmailRecord.ml_risk_score.desc()).limit(50)),
+        ('high risk cases page', EmailRecord.query.filter_by(
+            session_id=session_id, risk_level='High').order_by(EmailRecord.ml_risk_score.desc()).limit(50)),
+        ('escalated cases', EmailRecord.query.filter_by(
+            session_id=session_id, case_status='Escalated').filter(
+            EmailRecord.whitelisted != True).order_by(EmailRecord.escalated_at.desc())),
+        ('case lookup', EmailRecord.query.filter_by(
+            session_id=session_id, record_id=f'{session_id}_42').limit(1))
+    ]
+
+def explain(query):
+    """Query plan text from EXPLAIN (PostgreSQL) or EXPLAIN QUERY PLAN (SQLite)"""
+    from app import db
+
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN'
+    rows = db.session.execute(db.text(f"{prefix} {sql}")).all()
+    return ' | '.join(str(row[-1]) for row in rows)
+
+def uses_index(plan):
+    """True when the plan reads email_records through an index instead of a full scan"""
+    return 'ix_email_records' in plan
+
+def time_queries(session_ids, repeat):
+    """Average seconds per query name over all sessions"""
+    timings = {}
+    for session_id in session_ids:
+        for name, query in hot_queries(session_id):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                query.all()
+            timings[name] = timings.get(name, 0) + (time.perf_counter() - start) / repeat
+    return {name: elapsed / len(session_ids) for name, elapsed in timings.items()}
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    session_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    from app import app, db
+    from models import EmailRecord, ProcessingSession
+
+    with app.app_context():
+        database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        print("=== Email Guardian Index Benchmark ===")
+        print(f"Database: {database_uri.split('@')[-1]}")
+        print(f"Rows: {row_count} across {session_count} sessions")
+        print("-" * 70)
+
+        session_ids = build_sessions(row_count, session_count)
+        db.session.execute(db.text("ANALYZE email_records"))
+        db.session.commit()
+
+        try:
+            # Plans with the indexes in place
+            missing = 0
+            for name, query in hot_queries(session_ids[0]):
+                plan = explain(query)
+                if not uses_index(plan):
+                    missing += 1
+                print(f"{'✓' if uses_index(plan) else '✗'} {name:<22} {plan}")
+            print("-" * 70)
+
+            indexed = time_queries(session_ids, repeat=5)
+
+            # Same queries with the email_records indexes dropped
+            indexes = list(EmailRecord.__table__.indexes)
+            for index in indexes:
+                index.drop(bind=db.engine)
+            try:
+                unindexed = time_queries(session_ids, repeat=5)
+            finally:
+                for index in indexes:
+                    index.create(bind=db.engine)
+
+            print(f"{'query':<24}{'no index ms':>14}{'indexed ms':>14}{'speedup':>10}")
+            for name, elapsed in indexed.items():
+                speedup = unindexed[name] / elapsed if elapsed > 0 else 0
+                print(f"{name:<24}{unindexed[name] * 1000:>14.2f}{elapsed * 1000:>14.2f}{speedup:>9.1f}x")
+
+            print("-" * 70)
+            if missing:
+                print(f"✗ {missing} hot queries do not use an email_records index")
+            else:
+                print("✓ All hot queries use an email_records index")
+        finally:
+            EmailRecord.query.filter(EmailRecord.session_id.in_(session_ids)).delete(synchronize_session=False)
+            ProcessingSession.query.filter(ProcessingSession.id.in_(session_ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+        if missing:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
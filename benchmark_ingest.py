@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark for Email Guardian
+Compares rows/second of the bulk writers against the original ORM session.add path
+
+Usage:
+    python3 benchmark_ingest.py [rows] [chunk_size]
+
+Runs against DATABASE_URL when set, otherwise a throwaway SQLite database.
+"""
+
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# Add current directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///benchmark_ingest.db')
+
+def build_rows(session_id, row_count):
+    """Build synthetic normalized rows in the DataProcessor column order"""
+    from data_processor import DataProcessor
+
+    processor = DataProcessor()
+    columns = ['session_id', 'record_id'] + [processor.field_mapping.get(col, col)
+                                             for col in processor.expected_columns]
+    rows = []
+    for i in range(row_count):
+        values = {
+            'time': f'2025-01-{(i % 28) + 1:02d}t{i % 24:02d}:15:23',
+            'sender': f'user{i % 500}@company.com',
+            'subject': f'quarterly report {i}',
+            'attachments': 'report.pdf' if i % 3 else '',
+            'recipients': f'contact{i % 50}@partner{i % 40}.com',
+            'recipients_email_domain': f'partner{i % 40}.com',
+            'leaver': 'yes' if i % 97 == 0 else 'no',
+            'justification': 'business requirement' if i % 5 == 0 else ''
+        }
+        rows.append((session_id, f'{session_id}_{i}') +
+                    tuple(values.get(col, '') for col in columns[2:]))
+    return columns, rows
+
+def benchmark_writer(writer_name, row_count, chunk_size):
+    """Time one writer and return rows/second"""
+    from app import db
+    from models import ProcessingSession, EmailRecord
+    from bulk_writer import get_bulk_writer
+
+    session_id = str(uuid.uuid4())
+    session = ProcessingSession()
+    session.id = session_id
+    session.filename = f'benchmark_{writer_name}.csv'
+    session.status = 'benchmark'
+    db.session.add(session)
+    db.session.commit()
+
+    columns, rows = build_rows(session_id, row_count)
+    writer = get_bulk_writer(writer_name)
+
+    try:
+        start = time.perf_counter()
+        for offset in range(0, len(rows), chunk_size):
+            writer.write(columns, rows[offset:offset + chunk_size])
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+
+        written = EmailRecord.query.filter_by(session_id=session_id).count()
+        if written != row_count:
+            print(f"  ✗ {writer_name}: expected {row_count} rows, found {written}")
+    finally:
+        EmailRecord.query.filter_by(session_id=session_id).delete()
+        db.session.delete(session)
+        db.session.commit()
+
+    return row_count / elapsed if elapsed > 0 else 0
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    from app import app
+
+    with app.app_context():
+        database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        writers = ['orm', 'insert']
+        if database_uri.startswith(('postgres://', 'postgresql')):
+            writers.append('copy')
+
+        print("=== Email Guardian Ingest Benchmark ===")
+        print(f"Database: {database_uri.split('@')[-1]}")
+        print(f"Rows: {row_count}, chunk size: {chunk_size}")
+        print("-" * 50)
+
+        results = {}
+        for writer_name in writers:
+            results[writer_name] = benchmark_writer(writer_name, row_count, chunk_size)
+            print(f"{writer_name:>8}: {results[writer_name]:>12,.0f} rows/s")
+
+        print("-" * 50)
+        baseline = results['orm']
+        for writer_name in writers[1:]:
+            if baseline > 0:
+                print(f"{writer_name} speedup over ORM: {results[writer_name] / baseline:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Bulk writers for EmailRecord ingest and processing results
+Picks the fastest insert and update paths for the configured database
+"""
+import io
+import logging
+import uuid
+from sqlalchemy import insert, update, bindparam, text
+from models import EmailRecord
+from performance_config import config
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+class BulkWriter:
+    """Base class for bulk writers - writes row tuples into a table"""
+
+    name = 'base'
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else EmailRecord.__table__
+
+    def write(self, columns, rows):
+        """Write rows (tuples in `columns` order) inside the current transaction"""
+        raise NotImplementedError
+
+    def _with_defaults(self, columns, rows):
+        """Append scalar column defaults that the raw insert path would not apply"""
+        default_columns = []
+        default_values = []
+        for column in self.table.columns:
+            if column.name in columns or column.primary_key:
+                continue
+            if column.default is not None and column.default.is_scalar:
+                default_columns.append(column.name)
+                default_values.append(column.default.arg)
+
+        if not default_columns:
+            return list(columns), rows
+
+        default_values = tuple(default_values)
+        return list(columns) + default_columns, [row + default_values for row in rows]
+
+class OrmBulkWriter(BulkWriter):
+    """Original ORM path: one EmailRecord object per row through the unit of work"""
+
+    name = 'orm'
+
+    def write(self, columns, rows):
+        db.session.add_all(EmailRecord(**dict(zip(columns, row))) for row in rows)
+        return len(rows)
+
+class InsertBulkWriter(BulkWriter):
+    """Core insert() executemany - used for SQLite and any other dialect"""
+
+    name = 'insert'
+
+    def write(self, columns, rows):
+        if not rows:
+            return 0
+        db.session.execute(insert(self.table), [dict(zip(columns, row)) for row in rows])
+        return len(rows)
+
+class CopyBulkWriter(BulkWriter):
+    """PostgreSQL COPY FROM STDIN using the text format"""
+
+    name = 'copy'
+
+    def write(self, columns, rows):
+        if not rows:
+            return 0
+
+        columns, rows = self._with_defaults(columns, rows)
+
+        copy_rows(self.table.name, columns, rows)
+        return len(rows)
+
+def copy_rows(table_name, columns, rows):
+    """COPY rows into a table on the session's own connection, so they share its transaction"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_format_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    raw_connection = db.session.connection().connection
+    cursor = raw_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def _format_copy_value(value):
+    """Encode a value for the COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+BULK_WRITERS = {
+    'orm': OrmBulkWriter,
+    'insert': InsertBulkWriter,
+    'copy': CopyBulkWriter
+}
+
+def get_bulk_writer(name=None, table=None):
+    """Return the bulk writer for the configured database
+
+    `name` (or EMAIL_GUARDIAN_BULK_WRITER) forces a writer; 'auto' picks COPY on
+    PostgreSQL and executemany everywhere else.
+    """
+    name = name or config.bulk_writer
+
+    if name == 'auto':
+        database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        name = 'copy' if database_uri.startswith(('postgres://', 'postgresql')) else 'insert'
+
+    if name not in BULK_WRITERS:
+        logger.warning(f"Unknown bulk writer '{name}', falling back to insert")
+        name = 'insert'
+
+    return BULK_WRITERS[name](table)
+
+class BulkUpdater:
+    """Base class for bulk updaters - applies per-row values keyed by primary key
+
+    `update(columns, rows)` takes columns starting with the key column ('id')
+    and row tuples in the same order, e.g. (['id', 'risk_level'], [(1, 'High')]).
+    """
+
+    name = 'base'
+
+    def __init__(self, model=None):
+        self.model = model if model is not None else EmailRecord
+        self.table = self.model.__table__
+
+    def update(self, columns, rows):
+        """Apply rows inside the current transaction, returning the row count"""
+        raise NotImplementedError
+
+class MappingsBulkUpdater(BulkUpdater):
+    """ORM bulk_update_mappings - one executemany UPDATE ... WHERE id = ? per column set"""
+
+    name = 'mappings'
+
+    def update(self, columns, rows):
+        if not rows:
+            return 0
+        db.session.bulk_update_mappings(self.model, [dict(zip(columns, row)) for row in rows])
+        return len(rows)
+
+class ExecutemanyBulkUpdater(BulkUpdater):
+    """Core UPDATE ... WHERE id = ? executemany - same statements as mappings without the ORM overhead"""
+
+    name = 'executemany'
+
+    def update(self, columns, rows):
+        if not rows:
+            return 0
+
+        key = columns[0]
+        statement = (update(self.table)
+                     .where(self.table.c[key] == bindparam('_key'))
+                     .values({column: bindparam(column) for column in columns[1:]}))
+        parameter_names = ['_key'] + list(columns[1:])
+        db.session.execute(statement, [dict(zip(parameter_names, row)) for row in rows])
+        return len(rows)
+
+class TempTableBulkUpdater(BulkUpdater):
+    """PostgreSQL: COPY the rows into a temp table, then one UPDATE ... FROM join"""
+
+    name = 'temp_table'
+
+    def update(self, columns, rows):
+        if not rows:
+            return 0
+
+        key = columns[0]
+        temp_table = f"bulk_update_{uuid.uuid4().hex[:12]}"
+        assignments = ', '.join(f"{column} = source.{column}" for column in columns[1:])
+
+        # The temp table copies the target's column types; dropped at commit at the latest
+        db.session.execute(text(
+            f"CREATE TEMP TABLE {temp_table} ON COMMIT DROP AS "
+            f"SELECT {', '.join(columns)} FROM {self.table.name} WITH NO DATA"
+        ))
+        copy_rows(temp_table, columns, rows)
+        db.session.execute(text(
+            f"UPDATE {self.table.name} AS target SET {assignments} "
+            f"FROM {temp_table} AS source WHERE target.{key} = source.{key}"
+        ))
+        db.session.execute(text(f"DROP TABLE {temp_table}"))
+        return len(rows)
+
+BULK_UPDATERS = {
+    'mappings': MappingsBulkUpdater,
+    'executemany': ExecutemanyBulkUpdater,
+    'temp_table': TempTableBulkUpdater
+}
+
+def get_bulk_updater(name=None, model=None):
+    """Return the bulk updater for the configured database
+
+    `name` (or EMAIL_GUARDIAN_BULK_UPDATER) forces an updater; 'auto' picks the
+    temp table join on PostgreSQL and the Core executemany everywhere else.
+    """
+    name = name or config.bulk_updater
+
+    if name == 'auto':
+        database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        name = 'temp_table' if database_uri.startswith(('postgres://', 'postgresql')) else 'executemany'
+
+    if name not in BULK_UPDATERS:
+        logger.warning(f"Unknown bulk updater '{name}', falling back to executemany")
+        name = 'executemany'
+
+    return BULK_UPDATERS[name](model)
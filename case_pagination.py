@@ -0,0 +1,217 @@
+"""
+Case list pagination for Email Guardian
+Keyset (seek) pagination on (ml_risk_score, id) with a column projection
+limited to what the case list renders
+"""
+import math
+import logging
+from sqlalchemy.orm import load_only
+from models import EmailRecord
+from performance_config import config
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class KeysetPagination:
+    """One page of cases, exposing the Flask-SQLAlchemy Pagination attributes the templates use
+
+    `next_cursor` and `prev_cursor` seek from the last and first row of this
+    page; `page` is carried along for display and numbered links.
+    """
+
+    def __init__(self, items, page, per_page, total, has_prev, has_next,
+                 next_cursor=None, prev_cursor=None, total_is_estimate=False):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def pages(self):
+        if not self.total or not self.per_page:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """Page numbers for the pagination widget, None marking skipped ranges"""
+        pages_end = self.pages + 1
+        if pages_end == 1:
+            return
+
+        left_end = min(1 + left_edge, pages_end)
+        yield from range(1, left_end)
+        if left_end == pages_end:
+            return
+
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, pages_end)
+        if mid_start - left_end > 0:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == pages_end:
+            return
+
+        right_start = max(mid_end, pages_end - right_edge)
+        if right_start - mid_end > 0:
+            yield None
+        yield from range(right_start, pages_end)
+
+class CasePaginator:
+    """Pages case queries in ml_risk_score order without OFFSET
+
+    Rows are ordered by ml_risk_score descending with id as a tie-breaker, so
+    the last row of a page identifies where the next one starts. NULL scores
+    go where the database puts them by default for a descending sort (first on
+    PostgreSQL, last on SQLite), which keeps the order servable straight from
+    the (session_id, ..., ml_risk_score) indexes.
+
+    Numbered page links without a cursor still fall back to OFFSET.
+    """
+
+    # Columns the case list template renders; large text columns such as
+    # recipients, justification and ml_explanation stay unloaded
+    list_columns = [
+        EmailRecord.record_id, EmailRecord.time, EmailRecord.sender, EmailRecord.subject,
+        EmailRecord.attachments, EmailRecord.recipients_email_domain, EmailRecord.leaver,
+        EmailRecord.risk_level, EmailRecord.ml_risk_score, EmailRecord.case_status,
+        EmailRecord.excluded_by_rule, EmailRecord.whitelisted
+    ]
+
+    def __init__(self, per_page=50, estimate_above=None):
+        self.per_page = per_page
+        self.estimate_above = config.cases_estimate_above if estimate_above is None else estimate_above
+
+    def paginate(self, query, after=None, before=None, page=1, total=None):
+        """KeysetPagination for query, seeking from an after/before cursor
+
+        total is the exact row count when the caller already knows it;
+        otherwise it is counted, or bounded for very large results.
+        """
+        try:
+            page = max(page or 1, 1)
+            score = EmailRecord.ml_risk_score
+            nulls_first = self._nulls_first()
+            rows_query = query.options(load_only(*self.list_columns))
+
+            after_key = self.parse_cursor(after)
+            before_key = self.parse_cursor(before) if after_key is None else None
+
+            if before_key is not None:
+                # Walk backwards from the first row of the following page
+                rows = self._seek(rows_query, before_key, False, nulls_first)
+                has_prev = len(rows) > self.per_page
+                items = list(reversed(rows[:self.per_page]))
+                has_next = True
+            elif after_key is not None:
+                rows = self._seek(rows_query, after_key, True, nulls_first)
+                has_prev = True
+                has_next = len(rows) > self.per_page
+                items = rows[:self.per_page]
+            else:
+                # No cursor: a numbered page link, or the first page
+                forward_score = score.desc().nulls_first() if nulls_first else score.desc().nulls_last()
+                rows = rows_query.order_by(forward_score, EmailRecord.id.desc()).offset(
+                    (page - 1) * self.per_page
+                ).limit(self.per_page + 1).all()
+                has_prev = page > 1
+                has_next = len(rows) > self.per_page
+                items = rows[:self.per_page]
+
+            total_is_estimate = False
+            if total is None:
+                total, total_is_estimate = self.count(query)
+
+            return KeysetPagination(
+                items, page, self.per_page, total, has_prev, has_next,
+                next_cursor=self.make_cursor(items[-1]) if items and has_next else None,
+                prev_cursor=self.make_cursor(items[0]) if items and has_prev else None,
+                total_is_estimate=total_is_estimate
+            )
+
+        except Exception as e:
+            logger.error(f"Error paginating cases: {str(e)}")
+            raise
+
+    def count(self, query):
+        """(total, is_estimate) for query
+
+        Results larger than `estimate_above` rows are not counted to the end:
+        the count stops there and is reported as a lower bound.
+        """
+        count_query = query.order_by(None).with_entities(EmailRecord.id)
+        if self.estimate_above:
+            capped = count_query.limit(self.estimate_above + 1).subquery()
+            total = db.session.query(db.func.count()).select_from(capped).scalar()
+            if total > self.estimate_above:
+                return self.estimate_above, True
+            return total, False
+        return count_query.count(), False
+
+    def make_cursor(self, record):
+        """Opaque 'score:id' position of a row"""
+        score = 'null' if record.ml_risk_score is None else repr(float(record.ml_risk_score))
+        return f"{score}:{record.id}"
+
+    def parse_cursor(self, cursor):
+        """(score, id) from a cursor, or None if it is missing or malformed"""
+        if not cursor:
+            return None
+        try:
+            score, record_id = cursor.rsplit(':', 1)
+            return (None if score == 'null' else float(score)), int(record_id)
+        except ValueError:
+            logger.warning(f"Ignoring malformed case cursor {cursor!r}")
+            return None
+
+    def _nulls_first(self):
+        """Whether a descending sort puts NULL scores first on this database"""
+        return db.engine.dialect.name in ('postgresql', 'oracle')
+
+    def _seek(self, query, key, forward, nulls_first):
+        """Up to per_page + 1 rows after (forward) or before key, nearest first
+
+        The order splits into a run of scored rows and a run of NULL scores.
+        Each run is read with its own range condition, which the indexes can
+        seek to directly; an OR across both would scan from the start of the
+        session instead.
+        """
+        score_value, record_id = key
+        score = EmailRecord.ml_risk_score
+        scored_order = [score.desc(), EmailRecord.id.desc()] if forward else [score.asc(), EmailRecord.id.asc()]
+        null_order = [EmailRecord.id.desc()] if forward else [EmailRecord.id.asc()]
+
+        if score_value is None:
+            next_id = EmailRecord.id < record_id if forward else EmailRecord.id > record_id
+            segments = [(db.and_(score.is_(None), next_id), null_order)]
+            # Scored rows follow the NULL run when NULLs sort first, and precede it otherwise
+            if nulls_first == forward:
+                segments.append((score.isnot(None), scored_order))
+        else:
+            if forward:
+                beyond = db.and_(score <= score_value, db.or_(score < score_value, EmailRecord.id < record_id))
+            else:
+                beyond = db.and_(score >= score_value, db.or_(score > score_value, EmailRecord.id > record_id))
+            segments = [(beyond, scored_order)]
+            if nulls_first != forward:
+                segments.append((score.is_(None), null_order))
+
+        rows = []
+        for condition, order in segments:
+            limit = self.per_page + 1 - len(rows)
+            if limit <= 0:
+                break
+            rows += query.filter(condition).order_by(*order).limit(limit).all()
+        return rows
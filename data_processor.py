@@ -1,15 +1,21 @@
 import pandas as pd
-import csv
+import codecs
 import json
 import logging
+import os
 from datetime import datetime
 from models import ProcessingSession, EmailRecord, ProcessingError
 from session_manager import SessionManager
 from rule_engine import RuleEngine
-from domain_manager import DomainManager
+from domain_manager import DomainManager, reverse_domain
 from ml_engine import MLEngine
+from stats_service import StatsService
+from search_index import SearchIndex
+from bulk_writer import get_bulk_writer
+from ingest_pipeline import IngestPipeline
+from workflow_engine import FusedWorkflowEngine
 from performance_config import config
-from app import db
+from app import app, db
 
 logger = logging.getLogger(__name__)
 
@@ -22,8 +28,12 @@ class DataProcessor:
         self.rule_engine = RuleEngine()
         self.domain_manager = DomainManager()
         self.ml_engine = MLEngine()
+        self.stats_service = StatsService()
+        self.search_index = SearchIndex()
+        self.workflow_engine = FusedWorkflowEngine(self.rule_engine, self.domain_manager)
+        self.bulk_writer = get_bulk_writer()
         self.enable_fast_mode = config.fast_mode
-        logger.info(f"DataProcessor initialized with config: {config.get_config_summary()}")
+        logger.info(f"DataProcessor initialized with config: {config.get_config_summary()}, bulk writer: {self.bulk_writer.name}")
         
         # Expected CSV columns (case-insensitive matching)
         self.expected_columns = [
@@ -33,9 +43,23 @@ class DataProcessor:
             'department', 'status', 'user_response', 'final_outcome',
             'justification'
         ]
+        
+        # Bytes read from the start of the file for encoding detection and row size estimation
+        self.sample_size = 64 * 1024
+        
+        # CSV column -> EmailRecord attribute where the names differ
+        self.field_mapping = {'_time': 'time'}
+        
+        # Maximum lengths of bounded EmailRecord columns, used by the validity mask.
+        # SQLite does not enforce VARCHAR lengths, so there long values are stored as before.
+        enforces_lengths = not app.config["SQLALCHEMY_DATABASE_URI"].startswith('sqlite')
+        self.column_lengths = {
+            expected_col: EmailRecord.__table__.columns[self.field_mapping.get(expected_col, expected_col)].type.length
+            for expected_col in self.expected_columns
+        } if enforces_lengths else {}
     
     def process_csv(self, session_id, file_path):
-        """Main CSV processing workflow"""
+        """Main CSV processing workflow - a single streaming pass over the file"""
         try:
             logger.info(f"Starting CSV processing for session {session_id}")
             
@@ -45,41 +69,53 @@ class DataProcessor:
                 session.status = 'processing'
                 db.session.commit()
             
-            # Step 1: Validate CSV structure (quick validation)
-            column_mapping = self._validate_csv_structure(file_path)
-            
-            # Step 2: Count total records (optimized)
-            total_records = self._count_csv_rows(file_path)
+            # Step 1: Detect encoding and estimate row count from a small header sample
+            encoding, avg_row_bytes = self._inspect_csv_sample(file_path)
+            file_size = os.path.getsize(file_path)
+            estimated_total = int(file_size / avg_row_bytes) if avg_row_bytes else 0
             if session:
-                session.total_records = total_records
+                session.total_records = estimated_total
                 db.session.commit()
+            logger.info(f"Estimated {estimated_total} records from file size {file_size} bytes")
             
-            processed_count = 0
-            
-            # Use optimized chunk size for performance
-            chunk_size = self.chunk_size if self.enable_fast_mode else min(500, self.chunk_size)
+            # Step 2: Stream the file once through the parse -> normalize -> write pipeline
+            try:
+                rows_read, processed_count, pipeline_stats = self._ingest_csv(
+                    session, session_id, file_path, encoding, file_size, estimated_total
+                )
+            except UnicodeDecodeError as decode_error:
+                # Bytes past the sample are not valid in the detected encoding; latin-1 decodes any byte
+                logger.warning(f"CSV is not valid {encoding} past the sample ({str(decode_error)}), re-reading as latin-1")
+                self._discard_ingested_records(session_id)
+                encoding = 'latin-1'
+                rows_read, processed_count, pipeline_stats = self._ingest_csv(
+                    session, session_id, file_path, encoding, file_size, estimated_total
+                )
+            logger.info(f"Ingest pipeline stats for session {session_id}: {pipeline_stats}")
+            
+            # Make the new records searchable from the cases page
+            try:
+                self.search_index.index_session(session_id)
+            except Exception as e:
+                logger.warning(f"Could not index session {session_id} for search: {str(e)}")
             
-            # Process file in chunks with proper encoding
-            encoding = getattr(self, '_working_encoding', 'utf-8')
-            for chunk_df in pd.read_csv(file_path, chunksize=chunk_size, encoding=encoding):
-                try:
-                    processed_count += self._process_chunk(session_id, chunk_df, column_mapping, processed_count)
-                    
-                    # Update progress based on configuration
-                    if processed_count % config.progress_update_interval == 0:
-                        if session:
-                            session.processed_records = processed_count
-                            db.session.commit()
-                except Exception as chunk_error:
-                    logger.warning(f"Error processing chunk: {str(chunk_error)}")
-                    continue  # Skip problematic chunks but continue processing
+            # Exclusion, whitelist and security rules were applied while ingesting
+            workflow_stats = dict(self.workflow_engine.stats)
+            logger.info(f"Fused workflow results for session {session_id}: {workflow_stats}")
+            if session:
+                session.exclusion_applied = True
+                session.whitelist_applied = True
+                session.rules_applied = True
+                session.processing_stats = {'ingest_pipeline': pipeline_stats, 'workflow': workflow_stats}
+                db.session.commit()
             
-            # Step 3: Apply 4-step workflow
-            self._apply_workflow(session_id)
+            # Step 3: Apply the remaining batch stage of the workflow
+            self._apply_workflow(session_id, fused=True)
             
-            # Mark as completed
+            # Mark as completed with the exact record count
             if session:
                 session.status = 'completed'
+                session.total_records = rows_read
                 session.processed_records = processed_count
                 db.session.commit()
             
@@ -95,154 +131,201 @@ class DataProcessor:
             db.session.commit()
             raise
     
-    def _validate_csv_structure(self, file_path):
-        """Validate CSV structure and create column mapping with cross-platform support"""
+    def _inspect_csv_sample(self, file_path):
+        """Detect encoding and average row size from the first bytes of the file
+        
+        Only a small sample is read, so this does not add a pass over the data.
+        Returns (encoding, average_row_bytes).
+        """
+        with open(file_path, 'rb') as f:
+            sample = f.read(self.sample_size)
+        
+        if not sample.strip():
+            raise ValueError("Invalid CSV format: file is empty")
+        
+        # Detect file encoding for better Mac compatibility
+        encoding_to_use = 'utf-8'
         try:
-            # Detect file encoding for better Mac compatibility
             import chardet
-            encoding_to_use = 'utf-8'
-            
+            encoding_result = chardet.detect(sample[:10000])  # First 10KB is enough for detection
+            detected_encoding = encoding_result.get('encoding', 'utf-8')
+            if detected_encoding and encoding_result.get('confidence', 0) > 0.7:
+                encoding_to_use = detected_encoding
+            logger.info(f"Detected file encoding: {detected_encoding} (confidence: {encoding_result.get('confidence', 0)})")
+        except Exception as enc_error:
+            logger.warning(f"Encoding detection failed: {str(enc_error)}, using UTF-8")
+        
+        # Try multiple encodings for Mac compatibility against the sample bytes
+        encodings_to_try = [encoding_to_use, 'utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252', 'macroman']
+        
+        working_encoding = None
+        for encoding in encodings_to_try:
             try:
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read(10000)  # Read first 10KB to detect encoding
-                encoding_result = chardet.detect(raw_data)
-                detected_encoding = encoding_result.get('encoding', 'utf-8')
-                if detected_encoding and encoding_result.get('confidence', 0) > 0.7:
-                    encoding_to_use = detected_encoding
-                logger.info(f"Detected file encoding: {detected_encoding} (confidence: {encoding_result.get('confidence', 0)})")
-            except Exception as enc_error:
-                logger.warning(f"Encoding detection failed: {str(enc_error)}, using UTF-8")
-            
-            # Try multiple encodings for Mac compatibility
-            encodings_to_try = [encoding_to_use, 'utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252', 'macroman']
-            
-            sample_df = None
-            for encoding in encodings_to_try:
-                try:
-                    # Read first few rows to check structure
-                    sample_df = pd.read_csv(file_path, nrows=5, encoding=encoding)
-                    logger.info(f"Successfully read CSV with encoding: {encoding}")
-                    # Store the working encoding for later use
-                    self._working_encoding = encoding
-                    break
-                except (UnicodeDecodeError, UnicodeError):
-                    logger.warning(f"Failed to read with encoding {encoding}, trying next...")
-                    continue
-                except Exception as e:
-                    logger.warning(f"Error reading CSV with encoding {encoding}: {str(e)}")
-                    continue
-            
-            if sample_df is None:
-                raise Exception("Could not read CSV file with any supported encoding. The file might be corrupted or in an unsupported format.")
-                
-            actual_columns = [col.lower().strip() for col in sample_df.columns]
-            
-            # Create case-insensitive column mapping
-            column_mapping = {}
-            missing_columns = []
-            
-            for expected_col in self.expected_columns:
-                found = False
-                for actual_col in sample_df.columns:
-                    if actual_col.lower().strip() == expected_col.lower():
-                        column_mapping[expected_col] = actual_col
-                        found = True
-                        break
-                
-                if not found:
-                    missing_columns.append(expected_col)
-            
-            # Log missing columns but don't fail
-            if missing_columns:
-                logger.warning(f"Missing columns: {missing_columns}")
-            
-            logger.info(f"CSV validation successful. Column mapping: {column_mapping}")
-            return column_mapping
-            
-        except Exception as e:
-            logger.error(f"CSV validation failed: {str(e)}")
-            raise ValueError(f"Invalid CSV format: {str(e)}")
+                # Incremental decode tolerates a multi-byte character cut at the sample boundary
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+                working_encoding = encoding
+                logger.info(f"Successfully decoded CSV sample with encoding: {encoding}")
+                break
+            except (UnicodeDecodeError, UnicodeError, LookupError):
+                logger.warning(f"Failed to read with encoding {encoding}, trying next...")
+                continue
+        
+        if working_encoding is None:
+            raise ValueError("Invalid CSV format: Could not read CSV file with any supported encoding. The file might be corrupted or in an unsupported format.")
+        
+        # Average row size from the complete data lines in the sample (header excluded)
+        lines = sample.split(b'\n')
+        if len(sample) == self.sample_size:
+            lines = lines[:-1]  # Last line may be truncated
+        data_lines = [line for line in lines[1:] if line.strip()]
+        if data_lines:
+            avg_row_bytes = sum(len(line) + 1 for line in data_lines) / len(data_lines)
+        else:
+            avg_row_bytes = 0
+        
+        return working_encoding, avg_row_bytes
     
-    def _count_csv_rows(self, file_path):
-        """Count total rows in CSV file with cross-platform encoding support"""
+    def _discard_ingested_records(self, session_id):
+        """Delete the records and errors written by an ingest attempt that has to be restarted"""
         try:
-            # Use the encoding that worked during validation
-            encoding = getattr(self, '_working_encoding', 'utf-8')
-            with open(file_path, 'r', encoding=encoding) as f:
-                reader = csv.reader(f)
-                row_count = sum(1 for row in reader) - 1  # Exclude header
-            return max(0, row_count)
+            EmailRecord.query.filter_by(session_id=session_id).delete(synchronize_session=False)
+            ProcessingError.query.filter_by(session_id=session_id).delete(synchronize_session=False)
+            db.session.commit()
         except Exception as e:
-            logger.error(f"Error counting CSV rows: {str(e)}")
-            # Fallback with encoding detection
+            db.session.rollback()
+            logger.error(f"Error discarding ingested records for session {session_id}: {str(e)}")
+            raise
+    
+    def _create_column_mapping(self, columns):
+        """Create case-insensitive column mapping from the CSV header"""
+        column_mapping = {}
+        missing_columns = []
+        
+        for expected_col in self.expected_columns:
+            found = False
+            for actual_col in columns:
+                if str(actual_col).lower().strip() == expected_col.lower():
+                    column_mapping[expected_col] = actual_col
+                    found = True
+                    break
+            
+            if not found:
+                missing_columns.append(expected_col)
+        
+        # Log missing columns but don't fail
+        if missing_columns:
+            logger.warning(f"Missing columns: {missing_columns}")
+        
+        logger.info(f"CSV validation successful. Column mapping: {column_mapping}")
+        return column_mapping
+    
+    def _ingest_csv(self, session, session_id, file_path, encoding, file_size, estimated_total):
+        """Parse, normalize and write the CSV as overlapping pipeline stages
+        
+        Returns (rows_read, processed_count, pipeline_stats).
+        """
+        # Use optimized chunk size for performance
+        chunk_size = self.chunk_size if self.enable_fast_mode else min(500, self.chunk_size)
+        
+        # Normalizer state - only touched by the normalizer thread
+        normalizer_state = {'column_mapping': None, 'next_index': 0}
+        
+        # Writer state - only touched by the writer (calling) thread
+        progress = {'rows_read': 0, 'processed': 0, 'last_update': 0, 'estimated_total': estimated_total}
+        
+        # Snapshot rules and whitelist here, where the DB session lives
+        self.workflow_engine.load()
+        
+        with open(file_path, 'rb') as csv_file:
             try:
-                import chardet
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read(10000)
-                result = chardet.detect(raw_data)
-                fallback_encoding = result.get('encoding', 'utf-8')
+                reader = pd.read_csv(csv_file, chunksize=chunk_size, encoding=encoding)
+            except pd.errors.EmptyDataError as e:
+                raise ValueError(f"Invalid CSV format: {str(e)}")
+            
+            def parse_chunks():
+                for chunk_df in reader:
+                    yield len(chunk_df), (chunk_df, csv_file.tell())
+            
+            def normalize_chunk(parsed):
+                chunk_df, bytes_read = parsed
+                normalized = {'columns': None, 'rows': [], 'errors': [], 'chunk_error': None,
+                              'rows_read': len(chunk_df), 'bytes_read': bytes_read}
+                
+                # Build the column mapping from the header of the first chunk
+                if normalizer_state['column_mapping'] is None:
+                    normalizer_state['column_mapping'] = self._create_column_mapping(chunk_df.columns)
+                
+                try:
+                    columns, rows, errors = self._normalize_chunk(
+                        session_id, chunk_df, normalizer_state['column_mapping'], normalizer_state['next_index']
+                    )
+                    columns, rows = self.workflow_engine.evaluate_chunk(columns, rows)
+                    normalized.update({'columns': columns, 'rows': rows, 'errors': errors})
+                    normalizer_state['next_index'] += len(rows)
+                except Exception as chunk_error:
+                    logger.warning(f"Error processing chunk: {str(chunk_error)}")
+                    # Recorded by the writer, which owns the database session
+                    normalized['chunk_error'] = str(chunk_error)
+                
+                return len(chunk_df), normalized
+            
+            def write_chunk(normalized):
+                progress['rows_read'] += normalized['rows_read']
+                written = 0
+                if normalized['chunk_error']:
+                    self._record_chunk_error(session_id, normalized['chunk_error'],
+                                             {'rows_read': normalized['rows_read']})
+                elif normalized['columns']:
+                    try:
+                        written = self._write_chunk(session_id, normalized['columns'],
+                                                    normalized['rows'], normalized['errors'])
+                    except Exception as chunk_error:
+                        # Skip the chunk; its record IDs were already assigned, so log the range left unused
+                        logger.warning(f"Error processing chunk: {str(chunk_error)}")
+                        rows = normalized['rows']
+                        self._record_chunk_error(session_id, str(chunk_error), {
+                            'rows_read': normalized['rows_read'],
+                            'skipped_record_ids': [rows[0][1], rows[-1][1]] if rows else []
+                        })
+                progress['processed'] += written
                 
-                with open(file_path, 'r', encoding=fallback_encoding) as f:
-                    reader = csv.reader(f)
-                    row_count = sum(1 for row in reader) - 1
-                return max(0, row_count)
-            except:
-                return 0
+                # Update progress based on configuration, correcting the row estimate as we go
+                if session and progress['processed'] - progress['last_update'] >= config.progress_update_interval:
+                    if normalized['bytes_read']:
+                        progress['estimated_total'] = max(
+                            progress['rows_read'],
+                            int(progress['rows_read'] * file_size / normalized['bytes_read'])
+                        )
+                    session.total_records = progress['estimated_total']
+                    session.processed_records = progress['processed']
+                    db.session.commit()
+                    progress['last_update'] = progress['processed']
+                return written
+            
+            pipeline = IngestPipeline(queue_size=config.pipeline_queue_size)
+            pipeline_stats = pipeline.run(parse_chunks(), normalize_chunk, write_chunk)
+        
+        return progress['rows_read'], progress['processed'], pipeline_stats
     
     def _process_chunk(self, session_id, chunk_df, column_mapping, start_index):
         """Process a chunk of CSV data"""
+        columns, rows, errors = self._normalize_chunk(session_id, chunk_df, column_mapping, start_index)
+        return self._write_chunk(session_id, columns, rows, errors)
+    
+    def _write_chunk(self, session_id, columns, rows, errors):
+        """Write a normalized chunk and its rejected rows in one transaction"""
         try:
-            processed_count = 0
-            
-            for index, row in chunk_df.iterrows():
-                try:
-                    # Create unique record ID
-                    record_id = f"{session_id}_{start_index + processed_count}"
-                    
-                    # Map columns and normalize data
-                    record_data = {}
-                    for expected_col, actual_col in column_mapping.items():
-                        if actual_col in row:
-                            value = row[actual_col]
-                            # Convert to string and normalize
-                            if pd.notna(value):
-                                record_data[expected_col] = str(value).lower().strip()
-                            else:
-                                record_data[expected_col] = ''
-                    
-                    # Create EmailRecord with property assignment
-                    email_record = EmailRecord()
-                    email_record.session_id = session_id
-                    email_record.record_id = record_id
-                    email_record.time = record_data.get('_time', '')
-                    email_record.sender = record_data.get('sender', '')
-                    email_record.subject = record_data.get('subject', '')
-                    email_record.attachments = record_data.get('attachments', '')
-                    email_record.recipients = record_data.get('recipients', '')
-                    email_record.recipients_email_domain = record_data.get('recipients_email_domain', '')
-                    email_record.leaver = record_data.get('leaver', '')
-                    email_record.termination_date = record_data.get('termination_date', '')
-                    email_record.wordlist_attachment = record_data.get('wordlist_attachment', '')
-                    email_record.wordlist_subject = record_data.get('wordlist_subject', '')
-                    email_record.bunit = record_data.get('bunit', '')
-                    email_record.department = record_data.get('department', '')
-                    email_record.status = record_data.get('status', '')
-                    email_record.user_response = record_data.get('user_response', '')
-                    email_record.final_outcome = record_data.get('final_outcome', '')
-                    email_record.justification = record_data.get('justification', '')
-                    
-                    db.session.add(email_record)
-                    processed_count += 1
-                    
-                except Exception as e:
-                    # Log individual record errors with property assignment
-                    error = ProcessingError()
-                    error.session_id = session_id
-                    error.error_type = 'record_processing'
-                    error.error_message = str(e)
-                    error.record_data = str({'index': index, 'data': row.to_dict()})
-                    db.session.add(error)
-                    logger.warning(f"Error processing record at index {index}: {str(e)}")
+            # Write the normalized row tuples in one bulk statement
+            processed_count = self.bulk_writer.write(columns, rows)
+            
+            # Log invalid records captured by the validity mask
+            for error_data in errors:
+                error = ProcessingError()
+                error.session_id = session_id
+                error.error_type = 'record_processing'
+                error.error_message = error_data['error_message']
+                error.record_data = error_data['record_data']
+                db.session.add(error)
             
             # Commit chunk with error handling
             try:
@@ -259,23 +342,104 @@ class DataProcessor:
             logger.error(f"Error processing chunk: {str(e)}")
             raise
     
-    def _apply_workflow(self, session_id):
-        """Apply 4-step processing workflow"""
+    def _normalize_chunk(self, session_id, chunk_df, column_mapping, start_index):
+        """Vectorized normalization of a CSV chunk into row tuples ready for bulk insert
+        
+        Returns (columns, rows, errors) where columns are EmailRecord attribute names,
+        rows is a list of tuples in that column order and errors holds the
+        ProcessingError payloads for rows rejected by the validity mask. Blank
+        rows are kept, as the row-by-row insert did.
+        """
+        # Rename the CSV columns to the expected names
+        rename_map = {actual_col: expected_col for expected_col, actual_col in column_mapping.items()
+                      if actual_col in chunk_df.columns}
+        chunk = chunk_df[list(rename_map)].rename(columns=rename_map)
+        
+        # Normalize whole columns at once, missing columns become empty strings
+        normalized = pd.DataFrame(index=chunk_df.index)
+        for expected_col in self.expected_columns:
+            if expected_col in chunk.columns:
+                normalized[expected_col] = chunk[expected_col].fillna('').astype(str).str.lower().str.strip()
+            else:
+                normalized[expected_col] = ''
+        
+        # Vectorized validity mask: reject values that overflow a length-enforcing column
+        error_messages = pd.Series('', index=normalized.index)
+        for expected_col, max_length in self.column_lengths.items():
+            if not max_length:
+                continue
+            too_long = (normalized[expected_col].str.len() > max_length) & (error_messages == '')
+            if too_long.any():
+                error_messages[too_long] = f"Value too long for column '{expected_col}' (max {max_length} characters)"
+        is_valid = error_messages == ''
+        
+        errors = []
+        for index in error_messages.index[~is_valid]:
+            errors.append({
+                'error_message': error_messages[index],
+                'record_data': str({'index': index, 'data': chunk_df.loc[index].to_dict()})
+            })
+            logger.warning(f"Error processing record at index {index}: {error_messages[index]}")
+        
+        valid = normalized[is_valid] if errors else normalized
+        
+        # Record IDs are assigned sequentially over the valid rows
+        record_ids = [f"{session_id}_{start_index + offset}" for offset in range(len(valid))]
+        
+        # Reversed recipient domains for subdomain whitelist lookups, computed once per distinct domain
+        domains = valid['recipients_email_domain']
+        reversed_domains = domains.map({domain: reverse_domain(domain) for domain in domains.unique()})
+        
+        columns = ['session_id', 'record_id'] + [self.field_mapping.get(col, col) for col in self.expected_columns]
+        columns.append('recipients_domain_reversed')
+        rows = list(zip([session_id] * len(valid), record_ids,
+                        *(valid[col].tolist() for col in self.expected_columns),
+                        reversed_domains.tolist()))
+        
+        return columns, rows, errors
+    
+    def _record_chunk_error(self, session_id, message, record_data):
+        """Store a ProcessingError for a chunk that could not be normalized or written"""
+        try:
+            error = ProcessingError()
+            error.session_id = session_id
+            error.error_type = 'chunk_processing'
+            error.error_message = message
+            error.record_data = str(record_data)
+            db.session.add(error)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error recording chunk failure for session {session_id}: {str(e)}")
+    
+    def _apply_workflow(self, session_id, fused=False):
+        """Apply 4-step processing workflow
+        
+        With fused=True steps 1-3 already ran on the ingested chunks and only
+        the ML batch stage is left.
+        """
         try:
             logger.info(f"Applying workflow for session {session_id}")
             
-            # Step 1: Apply Exclusion Rules
-            self._apply_exclusion_rules(session_id)
-            
-            # Step 2: Apply Whitelist Filtering
-            self._apply_whitelist_filtering(session_id)
-            
-            # Step 3: Apply Security Rules
-            self._apply_security_rules(session_id)
+            if not fused:
+                # Step 1: Apply Exclusion Rules
+                self._apply_exclusion_rules(session_id)
+                
+                # Step 2: Apply Whitelist Filtering
+                self._apply_whitelist_filtering(session_id)
+                
+                # Step 3: Apply Security Rules
+                self._apply_security_rules(session_id)
             
             # Step 4: Apply ML Analysis
             self._apply_ml_analysis(session_id)
             
+            # Materialize the dashboard counters now that the records are final
+            try:
+                self.stats_service.refresh_summary(session_id)
+            except Exception as e:
+                logger.warning(f"Could not refresh summary for session {session_id}: {str(e)}")
+            
             logger.info(f"Workflow completed for session {session_id}")
             
         except Exception as e:
@@ -351,7 +515,10 @@ class DataProcessor:
             session = ProcessingSession.query.get(session_id)
             if session:
                 session.ml_applied = True
-                session.processing_stats = analysis_results.get('processing_stats', {})
+                # Keep the ingest statistics recorded before the workflow ran
+                processing_stats = dict(session.processing_stats or {})
+                processing_stats.update(analysis_results.get('processing_stats', {}))
+                session.processing_stats = processing_stats
                 db.session.commit()
             
             logger.info(f"ML analysis completed for session {session_id}")
@@ -400,13 +567,31 @@ class DataProcessor:
                     'ml_explanation': None
                 })
             
+            # The stored summary is stale until the workflow finishes again. Leaving
+            # 'completed' for the duration keeps get_summary_counts from storing the
+            # partial counts as a fresh summary.
+            self.stats_service.invalidate_summary(session_id)
+            previous_status = session.status if session else None
+            if session:
+                session.status = 'processing'
+            
             db.session.commit()
             
-            # Apply workflow again
+            # Apply workflow again; it ends by storing the summary under a new data_version
             self._apply_workflow(session_id)
             
+            if session:
+                session.status = previous_status
+                db.session.commit()
+            
             logger.info(f"Session {session_id} reprocessed successfully")
             
         except Exception as e:
             logger.error(f"Error reprocessing session {session_id}: {str(e)}")
+            db.session.rollback()
+            session = ProcessingSession.query.get(session_id)
+            if session:
+                session.status = 'error'
+                session.error_message = str(e)
+                db.session.commit()
             raise
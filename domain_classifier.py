@@ -0,0 +1,111 @@
+"""
+Domain classification for Email Guardian
+Matches domains against the category patterns with a suffix trie and one
+compiled regex per category, memoizing results per domain
+"""
+import re
+import logging
+from functools import lru_cache
+import numpy as np
+from performance_config import config
+
+logger = logging.getLogger(__name__)
+
+# Regex metacharacters; a pattern body without any (once '\.' is removed) is a plain literal
+_REGEX_META = set('.^$*+?{}[]|()\\')
+
+class DomainClassifier:
+    """Classifies domains by ordered category patterns, first matching category wins
+
+    Patterns that are a literal suffix ('gmail\\.com$') go into a trie over the
+    reversed characters of the suffix, so one walk of the domain finds every
+    suffix pattern it ends with. The few others ('temp.*\\.com$',
+    'mailinator\\.') are compiled into one alternation per category. Matching
+    is on characters, not labels, exactly as `re.search` did: 'gmail\\.com$'
+    also matches 'mygmail.com'.
+
+    Domains matching no pattern get the keyword and label-count fallback.
+    Results are memoized per lowercased domain in an LRU of `cache_size`.
+    """
+
+    def __init__(self, domain_patterns, cache_size=None):
+        self.categories = [category.title() for category in domain_patterns]
+        self._trie = {}
+        self._regexes = []
+
+        for index, patterns in enumerate(domain_patterns.values()):
+            others = []
+            for pattern in patterns:
+                suffix = self._literal_suffix(pattern)
+                if suffix:
+                    self._add_suffix(suffix, index)
+                else:
+                    others.append(pattern)
+            self._regexes.append(re.compile('|'.join(f'(?:{p})' for p in others)) if others else None)
+
+        cache_size = config.domain_class_cache_size if cache_size is None else cache_size
+        self._classify_cached = lru_cache(maxsize=cache_size)(self._classify_lower)
+        logger.debug(f"Built domain classifier: {sum(1 for r in self._regexes if r)} category regexes over {len(self.categories)} categories")
+
+    def classify(self, domain):
+        """Category of a domain, 'Unknown' when there is none"""
+        if not domain:
+            return 'Unknown'
+        return self._classify_cached(domain.lower())
+
+    def classify_many(self, domains):
+        """Object array of categories, one per domain; repeated domains are classified once"""
+        seen = {}
+        categories = np.empty(len(domains), dtype=object)
+        for position, domain in enumerate(domains):
+            category = seen.get(domain)
+            if category is None:
+                category = seen[domain] = self.classify(domain)
+            categories[position] = category
+        return categories
+
+    def cache_info(self):
+        return self._classify_cached.cache_info()
+
+    def _classify_lower(self, domain_lower):
+        # Earliest category among the suffix patterns the domain ends with
+        best = len(self.categories)
+        node = self._trie
+        # '$' also matches before a trailing newline
+        for char in reversed(domain_lower[:-1] if domain_lower.endswith('\n') else domain_lower):
+            node = node.get(char)
+            if node is None:
+                break
+            best = min(best, node.get(None, best))
+
+        # Earlier categories can still win through their other patterns
+        for index in range(best):
+            regex = self._regexes[index]
+            if regex is not None and regex.search(domain_lower):
+                return self.categories[index]
+        if best < len(self.categories):
+            return self.categories[best]
+
+        # Default classification logic
+        if any(corp in domain_lower for corp in ['company', 'corp', 'enterprise', 'business']):
+            return 'Corporate'
+        elif len(domain_lower.split('.')) == 2 and not domain_lower.endswith(('.com', '.org', '.net')):
+            return 'Suspicious'
+        else:
+            return 'Corporate'
+
+    def _literal_suffix(self, pattern):
+        """'gmail.com' for 'gmail\\.com$', None for patterns that are not a literal suffix"""
+        if not pattern.endswith('$') or pattern.endswith('\\$'):
+            return None
+        body = pattern[:-1]
+        if not body or set(body.replace('\\.', '')) & _REGEX_META:
+            return None
+        return body.replace('\\.', '.')
+
+    def _add_suffix(self, suffix, index):
+        node = self._trie
+        for char in reversed(suffix):
+            node = node.setdefault(char, {})
+        # The None key holds the earliest category ending here
+        node[None] = min(node.get(None, index), index)
@@ -1,12 +1,17 @@
 import logging
-import re
 from collections import defaultdict, Counter
 from datetime import datetime
 from models import WhitelistDomain, EmailRecord, ProcessingSession
+from bulk_writer import get_bulk_updater
+from domain_classifier import DomainClassifier
 from app import db
 
 logger = logging.getLogger(__name__)
 
+def reverse_domain(domain):
+    """Domain labels in reverse order, lowercased: mail.partner.com -> com.partner.mail"""
+    return '.'.join(reversed(domain.strip().lower().split('.'))) if domain else domain
+
 class DomainManager:
     """Domain classification and whitelist management system"""
     
@@ -29,6 +34,7 @@ class DomainManager:
                 r'10minutemail\.', r'guerrillamail\.', r'mailinator\.'
             ]
         }
+        self.classifier = DomainClassifier(self.domain_patterns)
         
         # Free email domains that should be excluded from whitelist recommendations
         self.free_email_domains = {
@@ -46,34 +52,62 @@ class DomainManager:
             'domain_reputation': 0.1
         }
     
+    def get_whitelist_set(self):
+        """Lowercased set of active whitelist domains"""
+        whitelist_domains = WhitelistDomain.query.filter_by(is_active=True).all()
+        return set(domain.domain.lower() for domain in whitelist_domains)
+    
+    def get_whitelist_suffixes(self, whitelist_set=None):
+        """Subdomain suffixes ('.partner.com') for wildcard entries like *.partner.com or .partner.com"""
+        whitelist_set = self.get_whitelist_set() if whitelist_set is None else whitelist_set
+        suffixes = set()
+        for domain in whitelist_set:
+            if domain.startswith('*.'):
+                domain = domain[1:]
+            if domain.startswith('.') and len(domain) > 1:
+                suffixes.add(domain)
+        return tuple(sorted(suffixes))
+    
     def apply_whitelist_filtering(self, session_id):
-        """Apply whitelist filtering to session records"""
+        """Apply whitelist filtering to session records
+        
+        Runs as one UPDATE in the database: exact entries match
+        lower(recipients_email_domain) against the whitelist table, wildcard
+        entries match a prefix range on recipients_domain_reversed. Both are
+        served by the per-session domain indexes.
+        """
         try:
             logger.info(f"Applying whitelist filtering for session {session_id}")
             
             # Get active whitelist domains
-            whitelist_domains = WhitelistDomain.query.filter_by(is_active=True).all()
-            whitelist_set = set(domain.domain.lower() for domain in whitelist_domains)
+            whitelist_set = self.get_whitelist_set()
             
             if not whitelist_set:
                 logger.info("No whitelist domains found")
                 return 0
             
-            # Get non-excluded records
-            records = EmailRecord.query.filter(
+            # Exact domains straight from the whitelist table
+            whitelist_domains = db.session.query(db.func.lower(WhitelistDomain.domain)).filter(
+                WhitelistDomain.is_active == True
+            )
+            matches = [db.func.lower(EmailRecord.recipients_email_domain).in_(whitelist_domains.scalar_subquery())]
+            
+            # Wildcard entries: 'com.partner.' <= reversed domain < 'com.partner/'
+            suffixes = self.get_whitelist_suffixes(whitelist_set)
+            if suffixes:
+                self.backfill_reversed_domains(session_id)
+                for suffix in suffixes:
+                    prefix = reverse_domain(suffix[1:]) + '.'
+                    matches.append(db.and_(
+                        EmailRecord.recipients_domain_reversed >= prefix,
+                        EmailRecord.recipients_domain_reversed < prefix[:-1] + '/'
+                    ))
+            
+            whitelisted_count = EmailRecord.query.filter(
                 EmailRecord.session_id == session_id,
-                EmailRecord.excluded_by_rule.is_(None)
-            ).all()
-            
-            whitelisted_count = 0
-            
-            for record in records:
-                if record.recipients_email_domain:
-                    domain = record.recipients_email_domain.lower()
-                    if domain in whitelist_set:
-                        record.whitelisted = True
-                        whitelisted_count += 1
-                        logger.debug(f"Record {record.record_id} whitelisted for domain: {domain}")
+                EmailRecord.excluded_by_rule.is_(None),
+                db.or_(*matches)
+            ).update({'whitelisted': True}, synchronize_session=False)
             
             db.session.commit()
             logger.info(f"Whitelist filtering applied: {whitelisted_count} records whitelisted")
@@ -84,26 +118,34 @@ class DomainManager:
             db.session.rollback()
             raise
     
+    def backfill_reversed_domains(self, session_id=None, batch_size=5000):
+        """Fill recipients_domain_reversed for records stored without it, in id-ordered batches"""
+        records = EmailRecord.query.filter(
+            EmailRecord.recipients_domain_reversed.is_(None),
+            EmailRecord.recipients_email_domain.isnot(None)
+        ).with_entities(EmailRecord.id, EmailRecord.recipients_email_domain)
+        if session_id is not None:
+            records = records.filter(EmailRecord.session_id == session_id)
+        
+        updater = get_bulk_updater()
+        backfilled = 0
+        last_id = 0
+        while True:
+            rows = records.filter(EmailRecord.id > last_id).order_by(EmailRecord.id).limit(batch_size).all()
+            if not rows:
+                break
+            updater.update(['id', 'recipients_domain_reversed'],
+                           [(record_id, reverse_domain(domain)) for record_id, domain in rows])
+            backfilled += len(rows)
+            last_id = rows[-1][0]
+        
+        if backfilled:
+            logger.info(f"Backfilled reversed domains for {backfilled} records")
+        return backfilled
+    
     def classify_domain(self, domain):
         """Classify a domain into categories"""
-        if not domain:
-            return 'Unknown'
-        
-        domain_lower = domain.lower()
-        
-        # Check against patterns
-        for category, patterns in self.domain_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, domain_lower):
-                    return category.title()
-        
-        # Default classification logic
-        if any(corp in domain_lower for corp in ['company', 'corp', 'enterprise', 'business']):
-            return 'Corporate'
-        elif len(domain_lower.split('.')) == 2 and not domain_lower.endswith(('.com', '.org', '.net')):
-            return 'Suspicious'
-        else:
-            return 'Corporate'
+        return self.classifier.classify(domain)
     
     def calculate_domain_trust_score(self, domain, session_records=None):
         """Calculate trust score for a domain (0-100)"""
@@ -111,70 +153,71 @@ class DomainManager:
             if not domain:
                 return 0
             
-            score_components = {
-                'base_score': 50,  # Start with neutral score
-                'frequency_bonus': 0,
-                'risk_penalty': 0,
-                'business_bonus': 0,
-                'reputation_modifier': 0
-            }
-            
             # Get records for this domain
             if session_records:
-                domain_records = [r for r in session_records 
-                                if r.recipients_email_domain and r.recipients_email_domain.lower() == domain.lower()]
+                aggregates = self._aggregate_domains(
+                    r for r in session_records
+                    if r.recipients_email_domain and r.recipients_email_domain.lower() == domain.lower()
+                )
             else:
-                domain_records = EmailRecord.query.filter(
+                aggregates = self._aggregate_domains(EmailRecord.query.filter(
                     db.func.lower(EmailRecord.recipients_email_domain) == domain.lower()
-                ).all()
-            
-            if not domain_records:
-                return score_components['base_score']
-            
-            # Communication frequency bonus (more communications = more trust)
-            frequency_count = len(domain_records)
-            if frequency_count > 10:
-                score_components['frequency_bonus'] = min(20, frequency_count)
-            elif frequency_count > 5:
-                score_components['frequency_bonus'] = 10
-            elif frequency_count > 2:
-                score_components['frequency_bonus'] = 5
-            
-            # Risk score penalty
-            risk_scores = [r.ml_risk_score for r in domain_records if r.ml_risk_score is not None]
-            if risk_scores:
-                avg_risk = sum(risk_scores) / len(risk_scores)
-                score_components['risk_penalty'] = -int(avg_risk * 40)  # Higher risk = lower trust
-            
-            # Business context bonus
-            business_indicators = ['business', 'corporate', 'official', 'legitimate']
-            justifications = [r.justification or '' for r in domain_records]
-            business_mentions = sum(1 for just in justifications 
-                                  for indicator in business_indicators 
-                                  if indicator in just.lower())
-            
-            if business_mentions > 0:
-                score_components['business_bonus'] = min(15, business_mentions * 3)
-            
-            # Domain reputation modifier based on classification
-            domain_class = self.classify_domain(domain)
-            if domain_class == 'Corporate':
-                score_components['reputation_modifier'] = 10
-            elif domain_class == 'Personal':
-                score_components['reputation_modifier'] = -5
-            elif domain_class == 'Suspicious':
-                score_components['reputation_modifier'] = -25
-            
-            # Calculate final score
-            final_score = sum(score_components.values())
-            final_score = max(0, min(100, final_score))  # Clamp between 0-100
-            
-            return int(final_score)
+                ).all())
             
+            return self._trust_score_from_aggregate(domain, aggregates.get(domain.lower()))
+        
         except Exception as e:
             logger.error(f"Error calculating trust score for domain {domain}: {str(e)}")
             return 50  # Return neutral score on error
     
+    def _trust_score_from_aggregate(self, domain, aggregate, domain_class=None):
+        """Trust score (0-100) from a domain's _aggregate_domains entry"""
+        score_components = {
+            'base_score': 50,  # Start with neutral score
+            'frequency_bonus': 0,
+            'risk_penalty': 0,
+            'business_bonus': 0,
+            'reputation_modifier': 0
+        }
+        
+        if not aggregate:
+            return score_components['base_score']
+        
+        # Communication frequency bonus (more communications = more trust)
+        frequency_count = aggregate['communication_count']
+        if frequency_count > 10:
+            score_components['frequency_bonus'] = min(20, frequency_count)
+        elif frequency_count > 5:
+            score_components['frequency_bonus'] = 10
+        elif frequency_count > 2:
+            score_components['frequency_bonus'] = 5
+        
+        # Risk score penalty
+        if aggregate['risk_scores']:
+            avg_risk = aggregate['risk_sum'] / len(aggregate['risk_scores'])
+            score_components['risk_penalty'] = -int(avg_risk * 40)  # Higher risk = lower trust
+        
+        # Business context bonus
+        business_mentions = aggregate['business_mentions']
+        if business_mentions > 0:
+            score_components['business_bonus'] = min(15, business_mentions * 3)
+        
+        # Domain reputation modifier based on classification
+        if domain_class is None:
+            domain_class = self.classify_domain(domain)
+        if domain_class == 'Corporate':
+            score_components['reputation_modifier'] = 10
+        elif domain_class == 'Personal':
+            score_components['reputation_modifier'] = -5
+        elif domain_class == 'Suspicious':
+            score_components['reputation_modifier'] = -25
+        
+        # Calculate final score
+        final_score = sum(score_components.values())
+        final_score = max(0, min(100, final_score))  # Clamp between 0-100
+        
+        return int(final_score)
+    
     def analyze_whitelist_recommendations(self, session_id):
         """Analyze and recommend domains for whitelisting"""
         try:
@@ -186,17 +229,20 @@ class DomainManager:
             if not records:
                 return {'error': 'No records found for session'}
             
+            # Per-domain aggregates from a single pass over the records
+            aggregates = self._aggregate_domains(records)
+            
             # Analyze domain patterns
-            domain_stats = self._analyze_domain_communication_patterns(records)
+            domain_stats = self._analyze_domain_communication_patterns(aggregates)
             
             # Generate recommendations
-            recommendations = self._generate_domain_recommendations(domain_stats, records)
+            recommendations = self._generate_domain_recommendations(domain_stats, len(records))
             
             # Analyze current whitelist effectiveness
             whitelist_effectiveness = self._analyze_whitelist_effectiveness(session_id)
             
             # BAU pattern analysis
-            bau_patterns = self._analyze_bau_communication_patterns(records)
+            bau_patterns = self._analyze_bau_communication_patterns(records, aggregates)
             
             analysis = {
                 'total_unique_domains': len(domain_stats),
@@ -213,65 +259,88 @@ class DomainManager:
             logger.error(f"Error analyzing whitelist recommendations: {str(e)}")
             return {'error': str(e)}
     
-    def _analyze_domain_communication_patterns(self, records):
-        """Analyze communication patterns for each domain"""
-        domain_stats = defaultdict(lambda: {
-            'communication_count': 0,
-            'unique_senders': set(),
-            'risk_scores': [],
-            'high_risk_count': 0,
-            'justifications': [],
-            'time_patterns': [],
-            'attachment_count': 0,
-            'classification': 'Unknown',
-            'trust_score': 0
-        })
+    def _aggregate_domains(self, records):
+        """Group records by lowercased recipient domain in one pass
+        
+        Each domain gets its communication count, senders, risk scores and
+        their sum, high-risk count, justifications with their business keyword
+        hits, times and attachment count. Trust scores and whitelist impact
+        are derived from these alone.
+        """
+        business_indicators = ['business', 'corporate', 'official', 'legitimate']
+        aggregates = {}
         
         for record in records:
             if not record.recipients_email_domain:
                 continue
             
             domain = record.recipients_email_domain.lower()
-            stats = domain_stats[domain]
+            aggregate = aggregates.get(domain)
+            if aggregate is None:
+                aggregate = aggregates[domain] = {
+                    'communication_count': 0,
+                    'unique_senders': set(),
+                    'risk_scores': [],
+                    'risk_sum': 0,
+                    'high_risk_count': 0,
+                    'justifications': [],
+                    'business_mentions': 0,
+                    'time_patterns': [],
+                    'attachment_count': 0
+                }
             
-            stats['communication_count'] += 1
+            aggregate['communication_count'] += 1
             if record.sender:
-                stats['unique_senders'].add(record.sender.lower())
+                aggregate['unique_senders'].add(record.sender.lower())
             
             if record.ml_risk_score is not None:
-                stats['risk_scores'].append(record.ml_risk_score)
+                aggregate['risk_scores'].append(record.ml_risk_score)
+                aggregate['risk_sum'] += record.ml_risk_score
                 if record.ml_risk_score > 0.6:
-                    stats['high_risk_count'] += 1
+                    aggregate['high_risk_count'] += 1
             
             if record.justification:
-                stats['justifications'].append(record.justification)
+                aggregate['justifications'].append(record.justification)
+                justification_lower = record.justification.lower()
+                aggregate['business_mentions'] += sum(1 for indicator in business_indicators
+                                                      if indicator in justification_lower)
             
             if record.time:
-                stats['time_patterns'].append(record.time)
+                aggregate['time_patterns'].append(record.time)
             
             if record.attachments:
-                stats['attachment_count'] += 1
+                aggregate['attachment_count'] += 1
         
-        # Post-process statistics
+        return aggregates
+    
+    def _analyze_domain_communication_patterns(self, aggregates):
+        """Analyze communication patterns for each domain"""
         processed_stats = {}
-        for domain, stats in domain_stats.items():
-            stats['unique_senders'] = list(stats['unique_senders'])
-            stats['avg_risk_score'] = sum(stats['risk_scores']) / len(stats['risk_scores']) if stats['risk_scores'] else 0
-            stats['classification'] = self.classify_domain(domain)
-            stats['trust_score'] = self.calculate_domain_trust_score(domain, records)
-            stats['high_risk_ratio'] = stats['high_risk_count'] / stats['communication_count'] if stats['communication_count'] > 0 else 0
-            
-            processed_stats[domain] = dict(stats)
+        classifications = self.classifier.classify_many(list(aggregates))
+        for (domain, aggregate), classification in zip(aggregates.items(), classifications):
+            risk_scores = aggregate['risk_scores']
+            processed_stats[domain] = {
+                'communication_count': aggregate['communication_count'],
+                'unique_senders': list(aggregate['unique_senders']),
+                'risk_scores': risk_scores,
+                'high_risk_count': aggregate['high_risk_count'],
+                'justifications': aggregate['justifications'],
+                'time_patterns': aggregate['time_patterns'],
+                'attachment_count': aggregate['attachment_count'],
+                'classification': classification,
+                'trust_score': self._trust_score_from_aggregate(domain, aggregate, classification),
+                'avg_risk_score': aggregate['risk_sum'] / len(risk_scores) if risk_scores else 0,
+                'high_risk_ratio': aggregate['high_risk_count'] / aggregate['communication_count']
+            }
         
         return processed_stats
     
-    def _generate_domain_recommendations(self, domain_stats, records):
+    def _generate_domain_recommendations(self, domain_stats, total_records):
         """Generate whitelist recommendations based on domain analysis"""
         recommendations = []
         
         # Get currently whitelisted domains
-        current_whitelist = set(domain.domain.lower() for domain in 
-                              WhitelistDomain.query.filter_by(is_active=True).all())
+        current_whitelist = self.get_whitelist_set()
         
         # Sort domains by communication frequency and trust score
         sorted_domains = sorted(domain_stats.items(), 
@@ -311,7 +380,7 @@ class DomainManager:
                     'classification': stats['classification'],
                     'confidence_level': confidence_level,
                     'recommendation_reason': self._generate_recommendation_reason(stats),
-                    'potential_impact': self._calculate_whitelist_impact(domain, records)
+                    'potential_impact': self._calculate_whitelist_impact(stats['communication_count'], total_records)
                 }
                 
                 recommendations.append(recommendation)
@@ -339,14 +408,8 @@ class DomainManager:
         
         return "; ".join(reasons) if reasons else "Meets standard whitelist criteria"
     
-    def _calculate_whitelist_impact(self, domain, records):
+    def _calculate_whitelist_impact(self, domain_count, total_records):
         """Calculate the potential impact of whitelisting a domain"""
-        domain_records = [r for r in records 
-                         if r.recipients_email_domain and r.recipients_email_domain.lower() == domain.lower()]
-        
-        total_records = len(records)
-        domain_count = len(domain_records)
-        
         return {
             'records_affected': domain_count,
             'percentage_of_total': round((domain_count / total_records * 100), 2) if total_records > 0 else 0,
@@ -401,7 +464,7 @@ class DomainManager:
             logger.error(f"Error analyzing whitelist effectiveness: {str(e)}")
             return {'error': str(e)}
     
-    def _analyze_bau_communication_patterns(self, records):
+    def _analyze_bau_communication_patterns(self, records, aggregates):
         """Analyze Business As Usual communication patterns"""
         bau_patterns = {
             'high_frequency_domains': [],
@@ -411,15 +474,13 @@ class DomainManager:
         }
         
         # Domain frequency analysis
-        domain_frequency = Counter(r.recipients_email_domain.lower() 
-                                 for r in records if r.recipients_email_domain)
+        domain_frequency = Counter({domain: aggregate['communication_count']
+                                    for domain, aggregate in aggregates.items()})
         
         # High frequency domains (potential BAU)
         for domain, count in domain_frequency.most_common(10):
             if count >= 5:  # Threshold for high frequency
-                domain_records = [r for r in records 
-                                if r.recipients_email_domain and r.recipients_email_domain.lower() == domain]
-                avg_risk = sum(r.ml_risk_score for r in domain_records if r.ml_risk_score) / len(domain_records)
+                avg_risk = aggregates[domain]['risk_sum'] / count
                 
                 bau_patterns['high_frequency_domains'].append({
                     'domain': domain,
@@ -0,0 +1,183 @@
+"""
+Pipelined CSV ingest for Email Guardian
+Overlaps CSV parsing, normalization and database writes across threads
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_END = object()
+
+class PipelineStage:
+    """Throughput counters for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.chunks = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def record(self, rows, seconds):
+        self.chunks += 1
+        self.rows += rows
+        self.busy_seconds += seconds
+
+    def summary(self):
+        return {
+            'chunks': self.chunks,
+            'rows': self.rows,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'wait_seconds': round(self.wait_seconds, 3),
+            'rows_per_second': round(self.rows / self.busy_seconds, 1) if self.busy_seconds > 0 else 0
+        }
+
+class _StageFailure:
+    """Carries an exception from a worker thread to the writer"""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+class IngestPipeline:
+    """Bounded producer/consumer pipeline: parser -> normalizer -> writer
+
+    The parser and normalizer run on worker threads; the writer runs on the
+    calling thread so it keeps the caller's Flask app context and DB session.
+    Bounded queues provide backpressure, so at most `queue_size` chunks wait
+    between any two stages and memory stays flat regardless of file size.
+
+    Stage callables exchange (row_count, payload) tuples:
+      source    - iterator yielding (row_count, payload)
+      normalize - fn(payload) -> (row_count, payload), or None to drop the chunk
+      write     - fn(payload) -> rows written
+    """
+
+    def __init__(self, queue_size=2):
+        self.queue_size = max(1, queue_size)
+        self.stages = {
+            'parser': PipelineStage('parser'),
+            'normalizer': PipelineStage('normalizer'),
+            'writer': PipelineStage('writer')
+        }
+        self._stop = threading.Event()
+
+    def run(self, source, normalize, write):
+        """Run the pipeline to completion and return per-stage statistics"""
+        parsed_queue = queue.Queue(maxsize=self.queue_size)
+        normalized_queue = queue.Queue(maxsize=self.queue_size)
+        started = time.perf_counter()
+
+        threads = [
+            threading.Thread(target=self._parse, args=(source, parsed_queue),
+                             name='ingest-parser', daemon=True),
+            threading.Thread(target=self._normalize, args=(normalize, parsed_queue, normalized_queue),
+                             name='ingest-normalizer', daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._write(write, normalized_queue)
+        finally:
+            # Unblock the workers if the writer stopped early
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        return self.get_stats(time.perf_counter() - started)
+
+    def get_stats(self, elapsed_seconds):
+        """Per-stage throughput plus the stage that limited the run"""
+        stage_stats = {name: stage.summary() for name, stage in self.stages.items()}
+        bottleneck = max(self.stages.values(), key=lambda stage: stage.busy_seconds)
+        return {
+            'elapsed_seconds': round(elapsed_seconds, 3),
+            'queue_size': self.queue_size,
+            'stages': stage_stats,
+            'bottleneck': bottleneck.name
+        }
+
+    def _put(self, stage, target_queue, item):
+        """Blocking put that gives up when the pipeline is stopping"""
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.wait_seconds += time.perf_counter() - started
+        return not self._stop.is_set()
+
+    def _get(self, stage, source_queue):
+        """Blocking get that returns the end marker when the pipeline is stopping"""
+        started = time.perf_counter()
+        item = _END
+        while not self._stop.is_set():
+            try:
+                item = source_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stage.wait_seconds += time.perf_counter() - started
+        return item
+
+    def _parse(self, source, parsed_queue):
+        stage = self.stages['parser']
+        try:
+            iterator = iter(source)
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                try:
+                    row_count, payload = next(iterator)
+                except StopIteration:
+                    break
+                stage.record(row_count, time.perf_counter() - started)
+                if not self._put(stage, parsed_queue, payload):
+                    return
+        except Exception as e:
+            logger.error(f"Ingest parser stage failed: {str(e)}")
+            self._put(stage, parsed_queue, _StageFailure('parser', e))
+            return
+        self._put(stage, parsed_queue, _END)
+
+    def _normalize(self, normalize, parsed_queue, normalized_queue):
+        stage = self.stages['normalizer']
+        while True:
+            payload = self._get(stage, parsed_queue)
+            if payload is _END or isinstance(payload, _StageFailure):
+                self._put(stage, normalized_queue, payload)
+                return
+
+            started = time.perf_counter()
+            try:
+                result = normalize(payload)
+            except Exception as e:
+                logger.error(f"Ingest normalizer stage failed: {str(e)}")
+                self._put(stage, normalized_queue, _StageFailure('normalizer', e))
+                return
+
+            if result is None:
+                continue
+            row_count, normalized = result
+            stage.record(row_count, time.perf_counter() - started)
+            if not self._put(stage, normalized_queue, normalized):
+                return
+
+    def _write(self, write, normalized_queue):
+        stage = self.stages['writer']
+        while True:
+            payload = self._get(stage, normalized_queue)
+            if payload is _END:
+                return
+            if isinstance(payload, _StageFailure):
+                raise payload.error
+
+            started = time.perf_counter()
+            written = write(payload)
+            stage.record(written, time.perf_counter() - started)
@@ -0,0 +1,133 @@
+"""
+Multi-pattern keyword matching for Email Guardian
+Finds every keyword that occurs in a text with a single scan (Aho-Corasick)
+"""
+import logging
+import threading
+from collections import deque, OrderedDict
+
+try:
+    import ahocorasick  # Optional: pyahocorasick C implementation
+except ImportError:
+    ahocorasick = None
+
+from performance_config import config
+
+logger = logging.getLogger(__name__)
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over a fixed set of lowercase keywords
+
+    find_all(text) returns the set of keywords that occur anywhere in text,
+    i.e. every k for which `k in text` is true, including overlapping and
+    nested keywords ('.doc' and '.docx'). Uses pyahocorasick when installed,
+    otherwise a pure-Python automaton; small keyword sets without the C
+    extension fall back to plain substring checks, which are faster there.
+    """
+
+    # Below this many keywords the pure-Python automaton is slower than `in` checks
+    scan_threshold = 64
+
+    def __init__(self, patterns):
+        # Unique, non-empty patterns in their original order
+        self.patterns = tuple(dict.fromkeys(pattern for pattern in patterns if pattern))
+
+        if ahocorasick is not None and self.patterns:
+            self.backend = 'pyahocorasick'
+            self._automaton = ahocorasick.Automaton()
+            for pattern in self.patterns:
+                self._automaton.add_word(pattern, pattern)
+            self._automaton.make_automaton()
+        elif len(self.patterns) >= self.scan_threshold:
+            self.backend = 'python'
+            self._build()
+        else:
+            self.backend = 'scan'
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def find_all(self, text):
+        """Set of keywords occurring in text"""
+        if not text or not self.patterns:
+            return set()
+
+        if self.backend == 'pyahocorasick':
+            return {pattern for _, pattern in self._automaton.iter(text)}
+
+        if self.backend == 'scan':
+            return {pattern for pattern in self.patterns if pattern in text}
+
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def _build(self):
+        """Build goto/fail/output tables for the pure-Python automaton"""
+        goto = [{}]
+        output = [()]
+        for pattern in self.patterns:
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(())
+                state = next_state
+            output[state] = output[state] + (pattern,)
+
+        # Breadth-first fail links; each state inherits the outputs of its fail state
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in goto[state].items():
+                pending.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                output[next_state] = output[next_state] + output[fail[next_state]]
+
+        self._goto, self._fail, self._output = goto, fail, output
+
+# Shared automata keyed by their pattern tuple, least recently used first
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+def get_matcher(patterns):
+    """Shared KeywordMatcher for a pattern list, built on first use
+
+    At most keyword_matcher_cache_size automata are kept, so the one-off
+    pattern sets of rule previews do not accumulate in a long-running server.
+    """
+    key = tuple(patterns)
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is not None:
+            _matchers.move_to_end(key)
+            return matcher
+
+        matcher = KeywordMatcher(key)
+        logger.debug(f"Built {matcher.backend} keyword matcher for {len(matcher)} patterns")
+        _matchers[key] = matcher
+        while len(_matchers) > max(config.keyword_matcher_cache_size, 1):
+            _matchers.popitem(last=False)
+    return matcher
+
+def clear_matchers():
+    """Drop all cached automata - call when the keyword set changes"""
+    with _matchers_lock:
+        _matchers.clear()
+    logger.info("Keyword matchers cleared")
@@ -153,6 +153,43 @@ def initialize_with_flask():
         print(f"✗ Flask initialization failed: {e}")
         return False
 
+def migrate_email_record_indexes():
+    """Add the reversed-domain column and the email_records indexes to an existing database"""
+    try:
+        from sqlalchemy import inspect, text
+        from sqlalchemy.schema import CreateIndex
+        from app import app, db
+        from models import EmailRecord
+        from domain_manager import DomainManager
+        
+        with app.app_context():
+            columns = [column['name'] for column in inspect(db.engine).get_columns('email_records')]
+            if 'recipients_domain_reversed' not in columns:
+                print("Adding recipients_domain_reversed column to email_records table...")
+                db.session.execute(text("ALTER TABLE email_records ADD COLUMN recipients_domain_reversed VARCHAR(255)"))
+                db.session.commit()
+                print("✓ Added recipients_domain_reversed column")
+            else:
+                print("✓ recipients_domain_reversed column already exists")
+            
+            # create_all skips indexes on tables that already exist; reflection can't see expression indexes
+            for index in EmailRecord.__table__.indexes:
+                db.session.execute(CreateIndex(index, if_not_exists=True))
+            
+            # Refresh planner statistics so the new indexes get picked
+            db.session.execute(text("ANALYZE email_records"))
+            db.session.commit()
+            print(f"✓ {len(EmailRecord.__table__.indexes)} email_records indexes ready")
+            
+            backfilled = DomainManager().backfill_reversed_domains()
+            db.session.commit()
+            print(f"✓ Backfilled reversed domains for {backfilled} records")
+        
+        return True
+    except Exception as e:
+        print(f"✗ email_records index migration failed: {e}")
+        return False
+
 def main():
     """Main migration function"""
     print("=== Email Guardian Local Database Migration ===")
@@ -160,6 +197,8 @@ def main():
     
     # Try Flask-SQLAlchemy approach first (recommended)
     if initialize_with_flask():
+        if not migrate_email_record_indexes():
+            sys.exit(1)
         print("Database is ready for local development!")
         return
     
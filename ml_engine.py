@@ -2,17 +2,58 @@ import numpy as np
 import pandas as pd
 import json
 import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from sklearn.ensemble import IsolationForest
 from sklearn.cluster import DBSCAN
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 from models import EmailRecord, AttachmentKeyword
+from keyword_matcher import get_matcher, clear_matchers
+from model_registry import ModelRegistry
+from bulk_writer import get_bulk_updater
+from stats_service import StatsService
 from performance_config import config
-from app import db
+from app import app, db
 
 logger = logging.getLogger(__name__)
 
+# Version of the AttachmentKeyword table contents, shared by all MLEngine instances
+_keyword_version = 0
+
+def invalidate_attachment_keywords():
+    """Mark cached attachment keywords stale - call after adding or removing keywords"""
+    global _keyword_version
+    _keyword_version += 1
+    clear_matchers()
+
+# MLEngine used by a scoring worker process, set by _init_scoring_worker
+_worker_engine = None
+
+def _init_scoring_worker(attachment_keywords, model=None):
+    """Process pool initializer: an MLEngine with the parent's attachment keywords
+    
+    model is the fitted (scaler, forest) pair, shipped once per worker rather
+    than with every batch.
+    """
+    global _worker_engine
+    # Forked workers must not reuse the parent's database connections
+    with app.app_context():
+        db.engine.dispose(close=False)
+    
+    _worker_engine = MLEngine()
+    _worker_engine._attachment_keywords = attachment_keywords
+    _worker_engine._attachment_keywords_version = _keyword_version
+    if model is not None:
+        _worker_engine.scaler, _worker_engine.isolation_forest = model
+
+def _run_scoring_worker(method, df, *args):
+    """Run one MLEngine batch method in a worker process"""
+    return getattr(_worker_engine, method)(df, *args)
+
 class MLEngine:
     """Machine learning engine for anomaly detection and risk scoring"""
     
@@ -31,60 +72,129 @@ class MLEngine:
             'medium': 0.4,
             'low': 0.0
         }
+        
+        # Attachment risk patterns
+        self.high_risk_extensions = ['.exe', '.scr', '.bat', '.cmd', '.com', '.pif', '.vbs', '.js']
+        self.medium_risk_extensions = ['.zip', '.rar', '.7z', '.doc', '.docx', '.xls', '.xlsx', '.pdf']
+        self.suspicious_patterns = ['double extension', 'hidden', 'confidential', 'urgent', 'invoice']
+        
+        # Record columns loaded for analysis, in _records_to_dataframe order
+        self.ml_columns = [
+            'record_id', 'sender', 'subject', 'attachments', 'recipients', 'recipients_email_domain',
+            'wordlist_attachment', 'wordlist_subject', 'justification', 'time', 'leaver',
+            'department', 'bunit'
+        ]
+        
+        # Columns of the _engineer_features matrix, in order
+        self.feature_names = [
+            'subject_length', 'has_attachments', 'has_wordlist_match', 'is_external',
+            'is_public_domain', 'is_weekend', 'is_after_hours', 'is_leaver',
+            'attachment_risk', 'justification_length', 'has_justification'
+        ]
+        
+        # Fitted anomaly models shared across sessions
+        self.model_registry = ModelRegistry() if config.ml_model_registry else None
+        self.model_name = 'email_anomaly'
+        
+        # Columns written back per record, key first
+        self.ml_result_columns = ['id', 'ml_anomaly_score', 'ml_risk_score', 'risk_level', 'ml_explanation']
+        
+        # Smallest batch worth shipping to a scoring worker process
+        self.min_parallel_batch = 500
+        
+        # Active attachment keywords as (keyword_lower, keyword, category, risk_score), loaded per version
+        self._attachment_keywords = None
+        self._attachment_keywords_version = None
     
     def analyze_session(self, session_id):
-        """Perform comprehensive ML analysis on session data"""
+        """Perform comprehensive ML analysis on session data
+        
+        The anomaly model is fit on a stratified sample of at most
+        max_ml_records rows, then every eligible record is scored in batches
+        of ml_batch_size, so memory stays bounded and no record is left unscored.
+        """
         try:
             logger.info(f"Starting ML analysis for session {session_id}")
             
             # Get non-excluded, non-whitelisted records
-            records = EmailRecord.query.filter(
+            records_query = EmailRecord.query.filter(
                 EmailRecord.session_id == session_id,
                 EmailRecord.excluded_by_rule.is_(None),
                 EmailRecord.whitelisted == False
-            ).all()
-            
-            if len(records) < 3:  # Reduced minimum for faster processing
-                logger.warning(f"Too few records ({len(records)}) for ML analysis")
-                return {'processing_stats': {'ml_records_analyzed': len(records)}}
-            
-            # Fast mode: limit records for processing speed
-            if self.fast_mode and len(records) > config.max_ml_records:
-                logger.info(f"Fast mode: Processing sample of {config.max_ml_records} records out of {len(records)}")
-                records = records[:config.max_ml_records]
-            
-            # Convert to DataFrame for analysis
-            df = self._records_to_dataframe(records)
+            )
+            total_records = records_query.count()
             
-            # Feature engineering
-            features = self._engineer_features(df)
+            if total_records < 3:  # Reduced minimum for faster processing
+                logger.warning(f"Too few records ({total_records}) for ML analysis")
+                return {'processing_stats': {'ml_records_analyzed': total_records}}
             
-            # Anomaly detection
-            anomaly_scores = self._detect_anomalies(features)
+            # Load keywords once for the run
+            self.load_attachment_keywords(force=True)
             
-            # Risk scoring
-            risk_scores = self._calculate_risk_scores(df, anomaly_scores)
+            # Shard across worker processes when configured; results come back in record order
+            workers = self._ml_workers()
+            batch_size = config.ml_batch_size
+            parallel = workers > 1 and total_records >= 2 * self.min_parallel_batch
+            if parallel:
+                batch_size = max(self.min_parallel_batch, min(batch_size, -(-total_records // workers)))
+                logger.info(f"Scoring with {workers} worker processes in batches of {batch_size}")
             
-            # Update records with ML results
-            self._update_records_with_ml_results(records, anomaly_scores, risk_scores)
+            # Pass 1: fit the anomaly model on a stratified sample, or reuse a stored one
+            executor = self._scoring_executor(workers) if parallel else None
+            try:
+                feature_batches = self._map_batches('_engineer_features', self._batch_args(records_query, batch_size), executor, workers)
+                sample_features = self._sample_features((features for _, _, features in feature_batches), config.max_ml_records)
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+            model_source = self._prepare_anomaly_model(sample_features, session_id)
+            
+            # Later passes use a pool whose workers were handed the fitted model at startup
+            executor = self._scoring_executor(workers, (self.scaler, self.isolation_forest)) if parallel else None
+            try:
+                # Pass 2: raw anomaly scores for every record, normalized over the whole session
+                raw_batches = self._map_batches('_batch_raw_scores', self._batch_args(records_query, batch_size), executor, workers)
+                raw_scores = [raw for _, _, raw in raw_batches]
+                raw_scores = np.concatenate(raw_scores) if raw_scores else np.zeros(0)
+                anomaly_scores = self._normalize_anomaly_scores(raw_scores)
+                
+                # Pass 3: risk scores, explanations and insights, written back batch by batch
+                insight_totals = self._new_insight_totals()
+                offset = 0
+                result_batches = self._map_batches('_batch_results', self._batch_args(records_query, batch_size, anomaly_scores=anomaly_scores), executor, workers)
+                for record_ids, df, (risk_scores, explanations) in result_batches:
+                    batch_anomaly_scores = anomaly_scores[offset:offset + len(df)]
+                    offset += len(df)
+                    
+                    # Update records with ML results
+                    self._write_ml_results(record_ids, batch_anomaly_scores, risk_scores, explanations)
+                    
+                    self._accumulate_insights(insight_totals, df, batch_anomaly_scores, risk_scores)
+                    logger.info(f"ML scored {offset} of {total_records} records")
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
             
             # Generate analysis insights
-            insights = self._generate_insights(df, anomaly_scores, risk_scores)
+            insights = self._finalize_insights(insight_totals)
             
             logger.info(f"ML analysis completed for session {session_id}")
             
             return {
                 'processing_stats': {
-                    'ml_records_analyzed': len(records),
-                    'anomalies_detected': sum(1 for score in anomaly_scores if score > 0.5),
-                    'critical_cases': sum(1 for score in risk_scores if score > self.risk_thresholds['critical']),
-                    'high_risk_cases': sum(1 for score in risk_scores if score > self.risk_thresholds['high'])
+                    'ml_records_analyzed': insight_totals['total'],
+                    'ml_model_sample_size': len(sample_features),
+                    'ml_model_source': model_source,
+                    'anomalies_detected': insight_totals['anomalies'],
+                    'critical_cases': insight_totals['critical'],
+                    'high_risk_cases': insight_totals['high_or_above']
                 },
                 'insights': insights
             }
             
         except Exception as e:
             logger.error(f"Error in ML analysis for session {session_id}: {str(e)}")
+            db.session.rollback()
             raise
     
     def _records_to_dataframe(self, records):
@@ -109,62 +219,281 @@ class MLEngine:
         
         return pd.DataFrame(data)
     
+    def _iter_record_batches(self, records_query, batch_size=None):
+        """Yield (record_ids, df) in id order using keyset pagination
+        
+        Only the columns the analysis needs are loaded; df has the same shape as
+        _records_to_dataframe.
+        """
+        batch_size = batch_size or config.ml_batch_size
+        columns = [getattr(EmailRecord, column) for column in self.ml_columns]
+        last_id = None
+        
+        while True:
+            batch_query = records_query.with_entities(EmailRecord.id, *columns)
+            if last_id is not None:
+                batch_query = batch_query.filter(EmailRecord.id > last_id)
+            rows = batch_query.order_by(EmailRecord.id).limit(batch_size).all()
+            if not rows:
+                return
+            
+            last_id = rows[-1][0]
+            record_ids = [row[0] for row in rows]
+            df = pd.DataFrame([row[1:] for row in rows], columns=self.ml_columns, dtype=object).fillna('')
+            yield record_ids, df
+    
+    def _batch_args(self, records_query, batch_size, *args, anomaly_scores=None):
+        """(record_ids, df, args) per batch; anomaly_scores are sliced to each batch"""
+        offset = 0
+        for record_ids, df in self._iter_record_batches(records_query, batch_size):
+            if anomaly_scores is None:
+                yield record_ids, df, args
+            else:
+                yield record_ids, df, args + (anomaly_scores[offset:offset + len(df)],)
+            offset += len(df)
+    
+    def _map_batches(self, method, batch_args, executor=None, workers=1):
+        """Yield (record_ids, df, result) in batch order, where result is method(df, *args)
+        
+        With an executor the method runs in the worker processes; at most two
+        batches per worker are in flight so memory stays bounded.
+        """
+        if executor is None:
+            for record_ids, df, args in batch_args:
+                yield record_ids, df, getattr(self, method)(df, *args)
+            return
+        
+        pending = deque()
+        for record_ids, df, args in batch_args:
+            pending.append((record_ids, df, executor.submit(_run_scoring_worker, method, df, *args)))
+            if len(pending) >= 2 * workers:
+                record_ids, df, future = pending.popleft()
+                yield record_ids, df, future.result()
+        
+        while pending:
+            record_ids, df, future = pending.popleft()
+            yield record_ids, df, future.result()
+    
+    def _scoring_executor(self, workers, model=None):
+        """Process pool of scoring workers initialized with the keywords and, once fitted, the model"""
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_scoring_worker,
+            initargs=(self._attachment_keywords, model)
+        )
+    
+    def _ml_workers(self):
+        """Scoring worker processes from config; 0 means one per CPU"""
+        return config.ml_workers if config.ml_workers > 0 else (os.cpu_count() or 1)
+    
+    def _batch_raw_scores(self, df):
+        """Raw anomaly scores for one batch against the fitted scaler and forest"""
+        return self._raw_anomaly_scores(self._engineer_features(df))
+    
+    def _batch_results(self, df, anomaly_scores):
+        """(risk_scores, explanations) for one batch of normalized anomaly scores"""
+        attachment_results = self._score_attachments(df['attachments'])
+        df['attachment_risk'] = [risk for risk, _ in attachment_results]
+        
+        # Risk scoring
+        risk_scores = self._calculate_risk_scores(df, anomaly_scores)
+        
+        explanations = [
+            self._generate_explanation(record, anomaly_scores[i], risk_scores[i], attachment_results[i])
+            for i, record in enumerate(df.itertuples(index=False))
+        ]
+        return risk_scores, explanations
+    
+    def _sample_features(self, feature_batches, sample_size):
+        """Feature rows for fitting: a stratified random sample of at most sample_size rows
+        
+        Strata are (leaver, has attachments, external, public domain). Each
+        stratum keeps the rows with the smallest random keys (a bottom-k sample),
+        and strata get slots in proportion to their size. Sessions that fit in
+        the sample are used whole, in record order.
+        """
+        rng = np.random.default_rng(42)
+        strata_samples = {}
+        strata_counts = {}
+        position = 0
+        
+        for features in feature_batches:
+            positions = np.arange(position, position + len(features))
+            position += len(features)
+            keys = rng.random(len(features))
+            
+            # Stratum label from the leaver, has_attachments, is_external and is_public_domain features
+            strata = (features[:, 7] > 0) * 8 + (features[:, 1] > 0) * 4 + (features[:, 3] > 0) * 2 + (features[:, 4] > 0)
+            for stratum in np.unique(strata):
+                in_stratum = strata == stratum
+                strata_counts[stratum] = strata_counts.get(stratum, 0) + int(in_stratum.sum())
+                
+                kept = strata_samples.get(stratum)
+                candidate_keys = keys[in_stratum]
+                candidate_positions = positions[in_stratum]
+                candidate_features = features[in_stratum]
+                if kept is not None:
+                    candidate_keys = np.concatenate([kept[0], candidate_keys])
+                    candidate_positions = np.concatenate([kept[1], candidate_positions])
+                    candidate_features = np.concatenate([kept[2], candidate_features])
+                
+                if len(candidate_keys) > sample_size:
+                    smallest = np.argpartition(candidate_keys, sample_size)[:sample_size]
+                    candidate_keys = candidate_keys[smallest]
+                    candidate_positions = candidate_positions[smallest]
+                    candidate_features = candidate_features[smallest]
+                strata_samples[stratum] = (candidate_keys, candidate_positions, candidate_features)
+        
+        if not strata_samples:
+            return np.zeros((0, 11), dtype=np.float32)
+        
+        quotas = self._stratum_quotas(strata_counts, sample_size)
+        selected_positions = []
+        selected_features = []
+        for stratum, (keys, positions, features) in strata_samples.items():
+            order = np.argsort(keys)[:quotas[stratum]]
+            selected_positions.append(positions[order])
+            selected_features.append(features[order])
+        
+        # Keep record order so a whole-session sample fits exactly like before
+        positions = np.concatenate(selected_positions)
+        features = np.concatenate(selected_features)
+        return features[np.argsort(positions, kind='stable')]
+    
+    def _stratum_quotas(self, strata_counts, sample_size):
+        """Rows to take from each stratum, summing to at most sample_size
+        
+        Slots are shared in proportion to stratum size by largest remainder.
+        Every stratum gets at least one row when there are no more strata than
+        slots; those rows come out of the largest quotas.
+        """
+        total = sum(strata_counts.values())
+        if total <= sample_size:
+            return dict(strata_counts)
+        
+        strata = list(strata_counts)
+        shares = np.array([sample_size * strata_counts[stratum] / total for stratum in strata])
+        quotas = np.floor(shares).astype(int)
+        remainder = sample_size - int(quotas.sum())
+        quotas[np.argsort(-(shares - quotas), kind='stable')[:remainder]] += 1
+        
+        if len(strata) <= sample_size:
+            for index in np.flatnonzero(quotas == 0):
+                quotas[np.argmax(quotas)] -= 1
+                quotas[index] = 1
+        return dict(zip(strata, quotas.tolist()))
+    
     def _engineer_features(self, df):
-        """Engineer features for ML analysis"""
-        features = []
+        """Engineer features for ML analysis as a float32 matrix, one column at a time"""
+        if len(df) == 0:
+            return np.zeros((0, 11), dtype=np.float32)
         
-        for _, row in df.iterrows():
-            feature_vector = []
-            
-            # Text-based features
-            subject_len = len(row['subject'])
-            has_attachments = 1 if row['attachments'] else 0
-            has_wordlist_match = 1 if (row['wordlist_attachment'] or row['wordlist_subject']) else 0
-            
-            # Domain features
-            domain = row['recipients_email_domain'].lower()
-            is_external = 1 if domain and not any(corp in domain for corp in ['company.com', 'corp.com']) else 0
-            is_public_domain = 1 if any(pub in domain for pub in ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']) else 0
-            
-            # Temporal features (if time parsing is possible)
-            is_weekend = 0
-            is_after_hours = 0
+        # Text-based features
+        subject_len = df['subject'].str.len()
+        has_attachments = df['attachments'] != ''
+        has_wordlist_match = (df['wordlist_attachment'] != '') | (df['wordlist_subject'] != '')
+        
+        # Domain features
+        domain = df['recipients_email_domain'].str.lower()
+        is_external = (domain != '') & ~domain.str.contains(self._any_of(['company.com', 'corp.com']))
+        is_public_domain = domain.str.contains(self._any_of(['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']))
+        
+        # Temporal features from parsed timestamps
+        is_weekend, is_after_hours = self._temporal_features(df['time'])
+        
+        # Leaver status
+        is_leaver = df['leaver'].str.lower().isin(['yes', 'true', '1'])
+        
+        # Attachment risk features
+        if 'attachment_risk' in df:
+            attachment_risk = df['attachment_risk']
+        else:
+            attachment_risk = pd.Series([risk for risk, _ in self._score_attachments(df['attachments'])], index=df.index)
+        
+        # Justification sentiment (basic)
+        justification_len = df['justification'].str.len()
+        has_justification = justification_len > 0
+        
+        columns = [
+            subject_len,
+            has_attachments,
+            has_wordlist_match,
+            is_external,
+            is_public_domain,
+            is_weekend,
+            is_after_hours,
+            is_leaver,
+            attachment_risk,
+            justification_len,
+            has_justification
+        ]
+        
+        features = np.empty((len(df), len(columns)), dtype=np.float32)
+        for i, column in enumerate(columns):
+            features[:, i] = np.asarray(column, dtype=np.float32)
+        return features
+    
+    def _any_of(self, substrings):
+        """Regex matching any of the literal substrings"""
+        return '|'.join(re.escape(substring) for substring in substrings)
+    
+    def _temporal_features(self, times):
+        """(is_weekend, is_after_hours) boolean arrays from the raw time strings
+        
+        The leading 'YYYY-MM-DDTHH:MM:SS' is parsed as ISO 8601, which drops any
+        fraction or offset so the sender's wall-clock hour is used. Other formats
+        go through the flexible parser; values that still don't parse fall back
+        to the original substring checks.
+        """
+        times = times.astype(str)
+        parsed = pd.to_datetime(times.str.slice(0, 19).str.upper(), errors='coerce', format='ISO8601', utc=True)
+        
+        retry = parsed.isna() & (times != '')
+        if retry.any():
+            wall_clock = times[retry].str.replace(
+                r'(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:z|[+-]\d{2}:?\d{2})$', r'\1', regex=True, case=False
+            )
             try:
-                # Basic time analysis - can be enhanced
-                if 'weekend' in row['time'].lower():
-                    is_weekend = 1
-                if any(hour in row['time'] for hour in ['22:', '23:', '00:', '01:', '02:', '03:', '04:', '05:']):
-                    is_after_hours = 1
-            except:
-                pass
-            
-            # Leaver status
-            is_leaver = 1 if row['leaver'].lower() in ['yes', 'true', '1'] else 0
-            
-            # Attachment risk features
-            attachment_risk = self._calculate_attachment_risk(row['attachments'])
-            
-            # Justification sentiment (basic)
-            justification_len = len(row['justification'])
-            has_justification = 1 if justification_len > 0 else 0
-            
-            feature_vector = [
-                subject_len,
-                has_attachments,
-                has_wordlist_match,
-                is_external,
-                is_public_domain,
-                is_weekend,
-                is_after_hours,
-                is_leaver,
-                attachment_risk,
-                justification_len,
-                has_justification
-            ]
-            
-            features.append(feature_vector)
+                parsed[retry] = pd.to_datetime(wall_clock, errors='coerce', format='mixed', utc=True)
+            except (ValueError, TypeError) as e:
+                logger.debug(f"Flexible time parsing failed: {str(e)}")
+        
+        hours = parsed.dt.hour.to_numpy()
+        is_weekend = (parsed.dt.dayofweek >= 5).to_numpy()
+        is_after_hours = (hours >= 22) | (hours <= 5)
         
-        return np.array(features)
+        # Unparseable times keep the original substring checks
+        unparsed = parsed.isna().to_numpy()
+        if unparsed.any():
+            raw = times[unparsed]
+            is_weekend[unparsed] = raw.str.lower().str.contains('weekend', regex=False).to_numpy()
+            is_after_hours[unparsed] = raw.str.contains(
+                self._any_of(['22:', '23:', '00:', '01:', '02:', '03:', '04:', '05:'])
+            ).to_numpy()
+        return is_weekend.astype(bool), is_after_hours.astype(bool)
+    
+    def load_attachment_keywords(self, force=False):
+        """Active attachment keywords, re-queried only when forced or invalidated"""
+        if force or self._attachment_keywords is None or self._attachment_keywords_version != _keyword_version:
+            version = _keyword_version
+            keywords = AttachmentKeyword.query.filter_by(is_active=True).all()
+            self._attachment_keywords = [
+                (keyword.keyword.lower(), keyword.keyword, keyword.category, keyword.risk_score)
+                for keyword in keywords
+            ]
+            self._attachment_keywords_version = version
+            logger.debug(f"Loaded {len(self._attachment_keywords)} attachment keywords (version {version})")
+        return self._attachment_keywords
+    
+    def _score_attachments(self, attachments_list):
+        """(risk, detected_keywords) per attachment string, computed once per distinct string"""
+        results = {}
+        scored = []
+        for attachments in attachments_list:
+            if attachments not in results:
+                results[attachments] = self._calculate_attachment_risk_with_keywords(attachments)
+            scored.append(results[attachments])
+        return scored
     
     def _calculate_attachment_risk(self, attachments):
         """Calculate risk score for attachments"""
@@ -180,47 +509,88 @@ class MLEngine:
         risk_score = 0.0
         detected_keywords = []
         
+        # Attachment keywords from the versioned cache
+        keyword_entries = self.load_attachment_keywords()
+        
+        # One scan finds every extension, pattern and keyword in the attachment names
+        matcher = get_matcher(self.high_risk_extensions + self.medium_risk_extensions +
+                              self.suspicious_patterns + [entry[0] for entry in keyword_entries])
+        found = matcher.find_all(attachments_lower)
+        
         # High-risk extensions
-        high_risk_extensions = ['.exe', '.scr', '.bat', '.cmd', '.com', '.pif', '.vbs', '.js']
-        for ext in high_risk_extensions:
-            if ext in attachments_lower:
+        for ext in self.high_risk_extensions:
+            if ext in found:
                 risk_score += 0.8
                 detected_keywords.append(f"high-risk file: {ext}")
         
         # Medium-risk extensions
-        medium_risk_extensions = ['.zip', '.rar', '.7z', '.doc', '.docx', '.xls', '.xlsx', '.pdf']
-        for ext in medium_risk_extensions:
-            if ext in attachments_lower:
+        for ext in self.medium_risk_extensions:
+            if ext in found:
                 risk_score += 0.3
                 detected_keywords.append(f"medium-risk file: {ext}")
         
         # Suspicious patterns
-        suspicious_patterns = ['double extension', 'hidden', 'confidential', 'urgent', 'invoice']
-        for pattern in suspicious_patterns:
-            if pattern in attachments_lower:
+        for pattern in self.suspicious_patterns:
+            if pattern in found:
                 risk_score += 0.2
                 detected_keywords.append(f"suspicious pattern: {pattern}")
         
-        # Get attachment keywords from database
-        keywords = AttachmentKeyword.query.filter_by(is_active=True).all()
-        for keyword in keywords:
-            if keyword.keyword.lower() in attachments_lower:
-                detected_keywords.append(f"{keyword.category.lower()} keyword: {keyword.keyword}")
-                if keyword.category == 'Suspicious':
-                    risk_score += keyword.risk_score * 0.1
-                elif keyword.category == 'Personal':
-                    risk_score += keyword.risk_score * 0.05
+        for keyword_text, keyword, category, keyword_risk in keyword_entries:
+            if keyword_text in found or not keyword_text:
+                detected_keywords.append(f"{category.lower()} keyword: {keyword}")
+                if category == 'Suspicious':
+                    risk_score += keyword_risk * 0.1
+                elif category == 'Personal':
+                    risk_score += keyword_risk * 0.05
         
         return min(risk_score, 1.0), detected_keywords  # Cap at 1.0
     
     def _detect_anomalies(self, features):
         """Detect anomalies using Isolation Forest"""
+        try:
+            self._fit_anomaly_model(features)
+            return self._normalize_anomaly_scores(self._raw_anomaly_scores(features))
+            
+        except Exception as e:
+            logger.error(f"Error in anomaly detection: {str(e)}")
+            return np.zeros(len(features))
+    
+    def _prepare_anomaly_model(self, features, session_id=None):
+        """Use the stored model when the sample has not drifted from it, otherwise fit and store a new one
+        
+        Returns 'registry' or 'fitted'.
+        """
+        if self.model_registry is None or len(features) < 10:
+            logger.info(f"Fitting anomaly model on {len(features)} sampled records")
+            self._fit_anomaly_model(features)
+            return 'fitted'
+        
+        schema = self.model_registry.schema(self.feature_names, contamination=0.1, n_estimators=config.ml_estimators)
+        entry = self.model_registry.load(self.model_name)
+        refit, reason = self.model_registry.needs_refit(entry, schema, features)
+        
+        if not refit:
+            logger.info(f"Scoring with stored anomaly model from {entry['trained_at']} ({reason})")
+            self.scaler = entry['scaler']
+            self.isolation_forest = entry['forest']
+            return 'registry'
+        
+        logger.info(f"Fitting anomaly model on {len(features)} sampled records ({reason})")
+        self._fit_anomaly_model(features)
+        if self.isolation_forest is not None:
+            self.model_registry.save(self.model_name, self.scaler, self.isolation_forest, schema, features, session_id)
+        return 'fitted'
+    
+    def _fit_anomaly_model(self, features):
+        """Fit the scaler and Isolation Forest; too few samples leave no model"""
+        self.isolation_forest = None
         try:
             if len(features) < 10:
                 # Too few samples for meaningful anomaly detection
-                return np.zeros(len(features))
+                return
             
-            # Normalize features
+            # Normalize features (a fresh scaler, the previous one may belong to a stored model)
+            self.scaler = StandardScaler()
             features_scaled = self.scaler.fit_transform(features)
             
             # Train Isolation Forest (optimized for speed)
@@ -230,101 +600,101 @@ class MLEngine:
                 n_estimators=config.ml_estimators,
                 n_jobs=1 if self.fast_mode else -1  # Single core in fast mode for stability
             )
-            
-            # Fit and predict
-            anomaly_labels = self.isolation_forest.fit_predict(features_scaled)
-            anomaly_scores = self.isolation_forest.decision_function(features_scaled)
-            
-            # Convert to 0-1 scale (higher = more anomalous)
-            anomaly_scores_normalized = np.interp(anomaly_scores, 
-                                                (anomaly_scores.min(), anomaly_scores.max()), 
-                                                (0, 1))
-            
-            # Invert so higher scores mean more anomalous
-            anomaly_scores_normalized = 1 - anomaly_scores_normalized
-            
-            return anomaly_scores_normalized
+            self.isolation_forest.fit(features_scaled)
             
         except Exception as e:
             logger.error(f"Error in anomaly detection: {str(e)}")
-            return np.zeros(len(features))
+            self.isolation_forest = None
+    
+    def _raw_anomaly_scores(self, features):
+        """Isolation Forest decision function (lower = more anomalous); all NaN without a model or if scoring fails"""
+        if self.isolation_forest is None or len(features) == 0:
+            return np.full(len(features), np.nan)
+        try:
+            return self.isolation_forest.decision_function(self.scaler.transform(features))
+        except Exception as e:
+            logger.error(f"Error in anomaly detection: {str(e)}")
+            return np.full(len(features), np.nan)
+    
+    def _normalize_anomaly_scores(self, anomaly_scores):
+        """Convert decision scores to 0-1 over the whole session (higher = more anomalous)"""
+        if len(anomaly_scores) == 0 or np.isnan(anomaly_scores).any():
+            return np.zeros(len(anomaly_scores))
+        
+        # Convert to 0-1 scale (higher = more anomalous)
+        anomaly_scores_normalized = np.interp(anomaly_scores, 
+                                            (anomaly_scores.min(), anomaly_scores.max()), 
+                                            (0, 1))
+        
+        # Invert so higher scores mean more anomalous
+        return 1 - anomaly_scores_normalized
     
     def _calculate_risk_scores(self, df, anomaly_scores):
         """Calculate comprehensive risk scores"""
-        risk_scores = []
+        if len(df) == 0:
+            return []
         
-        for i, (_, row) in enumerate(df.iterrows()):
-            base_risk = 0.0
-            
-            # Anomaly contribution (40% of score)
-            anomaly_contribution = anomaly_scores[i] * 0.4
-            
-            # Rule-based risk factors (60% of score)
-            rule_risk = 0.0
-            
-            # High-risk indicators
-            if row['leaver'].lower() in ['yes', 'true', '1']:
-                rule_risk += 0.3
-            
-            # External domain risk
-            domain = row['recipients_email_domain'].lower()
-            if any(pub in domain for pub in ['gmail.com', 'yahoo.com', 'hotmail.com']):
-                rule_risk += 0.2
-            
-            # Attachment risk
-            attachment_risk = self._calculate_attachment_risk(row['attachments'])
-            rule_risk += attachment_risk * 0.3
-            
-            # Wordlist matches
-            if row['wordlist_attachment'] or row['wordlist_subject']:
-                rule_risk += 0.2
-            
-            # Time-based risk (basic implementation)
-            if 'weekend' in row['time'].lower():
-                rule_risk += 0.1
-            
-            # Justification analysis (basic sentiment)
-            justification = row['justification'].lower()
-            suspicious_justification_terms = ['urgent', 'confidential', 'personal', 'mistake', 'wrong']
-            if any(term in justification for term in suspicious_justification_terms):
-                rule_risk += 0.1
-            
-            # Combine scores
-            total_risk = anomaly_contribution + (rule_risk * 0.6)
-            risk_scores.append(min(total_risk, 1.0))  # Cap at 1.0
+        # Anomaly contribution (40% of score)
+        anomaly_contribution = np.asarray(anomaly_scores, dtype=float) * 0.4
+        
+        # Rule-based risk factors (60% of score), added in a fixed order
+        rule_risk = np.zeros(len(df))
+        
+        # High-risk indicators
+        rule_risk += np.where(df['leaver'].str.lower().isin(['yes', 'true', '1']), 0.3, 0.0)
+        
+        # External domain risk
+        domain = df['recipients_email_domain'].str.lower()
+        rule_risk += np.where(domain.str.contains(self._any_of(['gmail.com', 'yahoo.com', 'hotmail.com'])), 0.2, 0.0)
+        
+        # Attachment risk
+        if 'attachment_risk' in df:
+            attachment_risk = df['attachment_risk'].to_numpy(dtype=float)
+        else:
+            attachment_risk = np.array([risk for risk, _ in self._score_attachments(df['attachments'])], dtype=float)
+        rule_risk += attachment_risk * 0.3
+        
+        # Wordlist matches
+        rule_risk += np.where((df['wordlist_attachment'] != '') | (df['wordlist_subject'] != ''), 0.2, 0.0)
+        
+        # Time-based risk (basic implementation)
+        rule_risk += np.where(df['time'].str.lower().str.contains('weekend', regex=False), 0.1, 0.0)
+        
+        # Justification analysis (basic sentiment)
+        suspicious_justification_terms = ['urgent', 'confidential', 'personal', 'mistake', 'wrong']
+        justification = df['justification'].str.lower()
+        rule_risk += np.where(justification.str.contains(self._any_of(suspicious_justification_terms)), 0.1, 0.0)
         
-        return risk_scores
+        # Combine scores
+        total_risk = anomaly_contribution + (rule_risk * 0.6)
+        return np.minimum(total_risk, 1.0).tolist()  # Cap at 1.0
     
-    def _update_records_with_ml_results(self, records, anomaly_scores, risk_scores):
-        """Update database records with ML results"""
+    def _risk_level(self, risk_score):
+        """Map a risk score to its risk level"""
+        if risk_score >= self.risk_thresholds['critical']:
+            return 'Critical'
+        elif risk_score >= self.risk_thresholds['high']:
+            return 'High'
+        elif risk_score >= self.risk_thresholds['medium']:
+            return 'Medium'
+        return 'Low'
+    
+    def _write_ml_results(self, record_ids, anomaly_scores, risk_scores, explanations):
+        """Write one batch of ML results with a bulk UPDATE by primary key"""
         try:
-            for i, record in enumerate(records):
-                record.ml_anomaly_score = float(anomaly_scores[i])
-                record.ml_risk_score = float(risk_scores[i])
-                
-                # Assign risk level
-                risk_score = risk_scores[i]
-                if risk_score >= self.risk_thresholds['critical']:
-                    record.risk_level = 'Critical'
-                elif risk_score >= self.risk_thresholds['high']:
-                    record.risk_level = 'High'
-                elif risk_score >= self.risk_thresholds['medium']:
-                    record.risk_level = 'Medium'
-                else:
-                    record.risk_level = 'Low'
-                
-                # Generate explanation
-                record.ml_explanation = self._generate_explanation(records[i], anomaly_scores[i], risk_scores[i])
-            
+            rows = [
+                (record_id, float(anomaly_scores[i]), float(risk_scores[i]), self._risk_level(risk_scores[i]), explanations[i])
+                for i, record_id in enumerate(record_ids)
+            ]
+            get_bulk_updater().update(self.ml_result_columns, rows)
             db.session.commit()
-            logger.info(f"Updated {len(records)} records with ML results")
             
         except Exception as e:
             logger.error(f"Error updating records with ML results: {str(e)}")
             db.session.rollback()
             raise
     
-    def _generate_explanation(self, record, anomaly_score, risk_score):
+    def _generate_explanation(self, record, anomaly_score, risk_score, attachment_result=None):
         """Generate human-readable explanation for ML scoring"""
         explanations = []
         detected_keywords = []
@@ -340,7 +710,7 @@ class MLEngine:
             explanations.append("Email sent to public domain")
         
         if record.attachments:
-            attachment_risk, keywords_found = self._calculate_attachment_risk_with_keywords(record.attachments)
+            attachment_risk, keywords_found = attachment_result or self._calculate_attachment_risk_with_keywords(record.attachments)
             if attachment_risk > 0.5:
                 explanations.append("High-risk attachments detected")
             if keywords_found:
@@ -366,36 +736,70 @@ class MLEngine:
     
     def _generate_insights(self, df, anomaly_scores, risk_scores):
         """Generate session-level insights"""
+        insight_totals = self._new_insight_totals()
+        self._accumulate_insights(insight_totals, df, anomaly_scores, risk_scores)
+        return self._finalize_insights(insight_totals)
+    
+    def _new_insight_totals(self):
+        """Running counts for insights accumulated over scoring batches"""
+        return {
+            'total': 0, 'anomalies': 0, 'risk_sum': 0.0,
+            'critical': 0, 'high_or_above': 0, 'high': 0, 'medium': 0, 'low': 0,
+            'external': 0, 'high_risk_leavers': 0, 'high_risk_external': 0, 'high_risk_attachments': 0
+        }
+    
+    def _accumulate_insights(self, totals, df, anomaly_scores, risk_scores):
+        """Add one batch to the insight totals"""
+        anomaly_scores = np.asarray(anomaly_scores, dtype=float)
+        risk_scores = np.asarray(risk_scores, dtype=float)
+        
+        totals['total'] += len(df)
+        totals['anomalies'] += int((anomaly_scores > 0.5).sum())
+        totals['risk_sum'] += float(risk_scores.sum())
+        totals['critical'] += int((risk_scores > self.risk_thresholds['critical']).sum())
+        totals['high_or_above'] += int((risk_scores > self.risk_thresholds['high']).sum())
+        totals['high'] += int(((risk_scores > self.risk_thresholds['high']) & (risk_scores <= self.risk_thresholds['critical'])).sum())
+        totals['medium'] += int(((risk_scores > self.risk_thresholds['medium']) & (risk_scores <= self.risk_thresholds['high'])).sum())
+        totals['low'] += int((risk_scores <= self.risk_thresholds['medium']).sum())
+        
+        external = df['recipients_email_domain'].str.contains('gmail|yahoo|hotmail', na=False).to_numpy(dtype=bool)
+        totals['external'] += int(external.sum())
+        
+        # Patterns among high-risk cases
+        high_risk = risk_scores > 0.6
+        if high_risk.any():
+            totals['high_risk_leavers'] += int(df['leaver'].str.lower().isin(['yes', 'true', '1']).to_numpy()[high_risk].sum())
+            totals['high_risk_external'] += int(external[high_risk].sum())
+            totals['high_risk_attachments'] += int((df['attachments'] != '').to_numpy()[high_risk].sum())
+    
+    def _finalize_insights(self, totals):
+        """Insights dictionary from the accumulated totals"""
+        total = totals['total']
         insights = {
-            'total_analyzed': len(df),
-            'anomaly_rate': float(np.mean(anomaly_scores > 0.5)),
-            'average_risk_score': float(np.mean(risk_scores)),
+            'total_analyzed': total,
+            'anomaly_rate': float(totals['anomalies'] / total) if total else float('nan'),
+            'average_risk_score': float(totals['risk_sum'] / total) if total else float('nan'),
             'risk_distribution': {
-                'critical': int(sum(1 for score in risk_scores if score > self.risk_thresholds['critical'])),
-                'high': int(sum(1 for score in risk_scores if score > self.risk_thresholds['high'] and score <= self.risk_thresholds['critical'])),
-                'medium': int(sum(1 for score in risk_scores if score > self.risk_thresholds['medium'] and score <= self.risk_thresholds['high'])),
-                'low': int(sum(1 for score in risk_scores if score <= self.risk_thresholds['medium']))
+                'critical': totals['critical'],
+                'high': totals['high'],
+                'medium': totals['medium'],
+                'low': totals['low']
             },
-            'top_risk_factors': self._identify_top_risk_factors(df, risk_scores),
-            'recommendations': self._generate_recommendations(df, risk_scores)
+            'top_risk_factors': self._identify_top_risk_factors(totals),
+            'recommendations': self._generate_recommendations(totals)
         }
         
         return insights
     
-    def _identify_top_risk_factors(self, df, risk_scores):
+    def _identify_top_risk_factors(self, totals):
         """Identify top contributing risk factors"""
         risk_factors = []
+        high_risk_count = totals['high_or_above']
         
-        # Analyze high-risk cases
-        high_risk_indices = [i for i, score in enumerate(risk_scores) if score > 0.6]
-        
-        if high_risk_indices:
-            high_risk_df = df.iloc[high_risk_indices]
-            
-            # Check common patterns
-            leaver_rate = (high_risk_df['leaver'].str.lower().isin(['yes', 'true', '1'])).mean()
-            external_rate = high_risk_df['recipients_email_domain'].str.contains('gmail|yahoo|hotmail', na=False).mean()
-            attachment_rate = (high_risk_df['attachments'] != '').mean()
+        if high_risk_count:
+            leaver_rate = totals['high_risk_leavers'] / high_risk_count
+            external_rate = totals['high_risk_external'] / high_risk_count
+            attachment_rate = totals['high_risk_attachments'] / high_risk_count
             
             if leaver_rate > 0.3:
                 risk_factors.append(f"Leaver communications ({leaver_rate:.1%} of high-risk cases)")
@@ -406,31 +810,34 @@ class MLEngine:
         
         return risk_factors
     
-    def _generate_recommendations(self, df, risk_scores):
+    def _generate_recommendations(self, totals):
         """Generate actionable recommendations"""
         recommendations = []
         
-        critical_count = sum(1 for score in risk_scores if score > self.risk_thresholds['critical'])
+        critical_count = totals['critical']
         if critical_count > 0:
             recommendations.append(f"Immediately review {critical_count} critical risk cases")
         
-        high_count = sum(1 for score in risk_scores if score > self.risk_thresholds['high'])
+        high_count = totals['high_or_above']
         if high_count > 5:
             recommendations.append(f"Schedule review of {high_count} high-risk cases within 24 hours")
         
         # Domain-specific recommendations
-        external_domains = df[df['recipients_email_domain'].str.contains('gmail|yahoo|hotmail', na=False)]
-        if len(external_domains) > len(df) * 0.2:
+        if totals['external'] > totals['total'] * 0.2:
             recommendations.append("Consider updating domain whitelist policies - high volume of external communications")
         
         return recommendations
     
-    def get_insights(self, session_id):
-        """Get ML insights for dashboard display"""
+    def get_insights(self, session_id, counts=None):
+        """Get ML insights for dashboard display
+        
+        counts is a StatsService.get_session_counts result the caller already has.
+        """
         try:
-            session_records = EmailRecord.query.filter_by(session_id=session_id).all()
+            if counts is None:
+                counts = StatsService().get_session_counts(session_id)
             
-            if not session_records:
+            if not counts['total']:
                 return {
                     'total_records': 0,
                     'analyzed_records': 0,
@@ -441,20 +848,17 @@ class MLEngine:
                 }
             
             # Calculate statistics
-            total_records = len(session_records)
-            analyzed_records = len([r for r in session_records if r.ml_risk_score is not None])
+            total_records = counts['total']
+            analyzed_records = counts['analyzed']
             
             # Initialize risk distribution with default values
             risk_distribution = {'Critical': 0, 'High': 0, 'Medium': 0, 'Low': 0}
             avg_risk_score = 0.0
             
             if analyzed_records > 0:
-                risk_levels = [r.risk_level for r in session_records if r.risk_level]
                 for level in ['Critical', 'High', 'Medium', 'Low']:
-                    risk_distribution[level] = risk_levels.count(level)
-                
-                risk_scores = [r.ml_risk_score for r in session_records if r.ml_risk_score is not None]
-                avg_risk_score = float(np.mean(risk_scores)) if risk_scores else 0.0
+                    risk_distribution[level] = counts[f'risk_{level}']
+                avg_risk_score = counts['average_risk_score']
             
             insights = {
                 'total_records': total_records,
@@ -0,0 +1,131 @@
+"""
+Anomaly model registry for Email Guardian
+Persists fitted scaler and Isolation Forest pairs so later sessions can be
+scored against a warm model instead of refitting every time
+"""
+import os
+import logging
+import threading
+from datetime import datetime
+import joblib
+import numpy as np
+import sklearn
+from performance_config import config
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Stores fitted anomaly models under data/models/ with their feature schema and training stats
+
+    Each model is one joblib file holding the scaler, the forest, the schema it
+    was trained on and per-feature means and standard deviations of the
+    training sample. `needs_refit()` decides whether a new session can reuse it:
+    the schema must match and no feature mean may drift by more than
+    `drift_threshold` training standard deviations.
+    """
+
+    def __init__(self, model_dir=None, drift_threshold=None):
+        self.model_dir = model_dir or config.ml_model_dir
+        self.drift_threshold = config.ml_drift_threshold if drift_threshold is None else drift_threshold
+        self._cache = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.model_dir, exist_ok=True)
+
+    def model_path(self, name):
+        return os.path.join(self.model_dir, f"{name}.joblib")
+
+    def load(self, name):
+        """Stored model entry for name, or None if there is none or it cannot be read"""
+        path = self.model_path(name)
+        try:
+            if not os.path.exists(path):
+                return None
+
+            # Reuse the deserialized entry until the file changes
+            mtime = os.path.getmtime(path)
+            cached = self._cache.get(name)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+            entry = joblib.load(path)
+            self._cache[name] = (mtime, entry)
+            return entry
+
+        except Exception as e:
+            logger.error(f"Error loading model {name}: {str(e)}")
+            return None
+
+    def save(self, name, scaler, forest, schema, features, session_id=None):
+        """Persist a fitted scaler/forest pair with its schema and training stats"""
+        entry = {
+            'scaler': scaler,
+            'forest': forest,
+            'schema': schema,
+            'training_stats': self.training_stats(features),
+            'session_id': session_id,
+            'trained_at': datetime.utcnow().isoformat()
+        }
+        path = self.model_path(name)
+        try:
+            # Write to a temporary file first so readers never see a partial model
+            with self._lock:
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                joblib.dump(entry, temp_path)
+                os.replace(temp_path, path)
+                self._cache[name] = (os.path.getmtime(path), entry)
+            logger.info(f"Saved model {name} trained on {len(features)} samples")
+            return entry
+
+        except Exception as e:
+            logger.error(f"Error saving model {name}: {str(e)}")
+            return None
+
+    def delete(self, name):
+        """Remove a stored model so the next session refits"""
+        with self._lock:
+            self._cache.pop(name, None)
+            if os.path.exists(self.model_path(name)):
+                os.remove(self.model_path(name))
+                return True
+        return False
+
+    def training_stats(self, features):
+        """Sample size and per-feature mean and standard deviation"""
+        features = np.asarray(features, dtype=np.float64)
+        return {
+            'samples': int(len(features)),
+            'means': features.mean(axis=0).tolist() if len(features) else [],
+            'stds': features.std(axis=0).tolist() if len(features) else []
+        }
+
+    def feature_drift(self, entry, features):
+        """Largest shift of a feature mean, in training standard deviations"""
+        stats = entry['training_stats']
+        if not len(features) or not stats['means']:
+            return float('inf')
+
+        means = np.asarray(features, dtype=np.float64).mean(axis=0)
+        train_means = np.asarray(stats['means'])
+        # Constant training features drift as soon as their value changes at all
+        train_stds = np.maximum(np.asarray(stats['stds']), 1e-6)
+        return float(np.max(np.abs(means - train_means) / train_stds))
+
+    def needs_refit(self, entry, schema, features):
+        """(refit, reason) for scoring features against a stored entry"""
+        if entry is None:
+            return True, 'no stored model'
+        if entry.get('schema') != schema:
+            return True, 'feature schema changed'
+
+        drift = self.feature_drift(entry, features)
+        if drift > self.drift_threshold:
+            return True, f"feature drift {drift:.3f} above {self.drift_threshold}"
+        return False, f"feature drift {drift:.3f}"
+
+    def schema(self, feature_names, **params):
+        """Schema a model must match to be reused: feature names, model params and sklearn version"""
+        return {
+            'features': list(feature_names),
+            'params': params,
+            'sklearn_version': sklearn.__version__
+        }
@@ -26,6 +26,19 @@ class ProcessingSession(db.Model):
     def __repr__(self):
         return f'<ProcessingSession {self.id}>'
 
+class SessionSummary(db.Model):
+    __tablename__ = 'session_summaries'
+
+    session_id = db.Column(db.String(36), db.ForeignKey('processing_sessions.id'), primary_key=True)
+    data_version = db.Column(db.Integer, default=1)  # Bumped on every rebuild or incremental adjustment
+    counts = db.Column(JSON)  # StatsService.get_session_counts result, distributions as [value, count] pairs
+    top_domains = db.Column(JSON)  # [[domain, count], ...]
+    top_senders = db.Column(JSON)  # [[sender, count], ...]
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SessionSummary {self.session_id} v{self.data_version}>'
+
 class EmailRecord(db.Model):
     __tablename__ = 'email_records'
     
@@ -40,6 +53,7 @@ class EmailRecord(db.Model):
     attachments = db.Column(Text)
     recipients = db.Column(Text)
     recipients_email_domain = db.Column(db.String(255))
+    recipients_domain_reversed = db.Column(db.String(255))  # Labels reversed (com.partner.mail) for subdomain whitelist lookups
     leaver = db.Column(db.String(10))
     termination_date = db.Column(db.String(100))
     wordlist_attachment = db.Column(Text)
@@ -67,6 +81,28 @@ class EmailRecord(db.Model):
     escalated_at = db.Column(db.DateTime)
     resolved_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        # Whitelist filtering: exact domain matches and subdomain prefix ranges per session
+        db.Index('ix_email_records_session_domain_lower', session_id, db.func.lower(recipients_email_domain)),
+        db.Index('ix_email_records_session_domain_reversed', session_id, recipients_domain_reversed),
+        
+        # Case lookups, dashboard counts and case list filters per session
+        db.Index('ix_email_records_session_record', session_id, record_id),
+        db.Index('ix_email_records_session_whitelisted', session_id, whitelisted),
+        db.Index('ix_email_records_session_excluded', session_id, excluded_by_rule),
+        db.Index('ix_email_records_session_risk_level', session_id, risk_level, ml_risk_score),
+        db.Index('ix_email_records_session_case_status', session_id, case_status, escalated_at),
+        
+        # Records with rule matches, without indexing the JSON text itself
+        db.Index('ix_email_records_session_rule_matches', session_id,
+                 sqlite_where=rule_matches.isnot(None), postgresql_where=rule_matches.isnot(None)),
+        
+        # Default case view: active (not whitelisted, not excluded) records by risk score
+        db.Index('ix_email_records_active_cases', session_id, ml_risk_score,
+                 sqlite_where=db.and_(whitelisted != True, excluded_by_rule.is_(None)),
+                 postgresql_where=db.and_(whitelisted != True, excluded_by_rule.is_(None))),
+    )
+    
     def __repr__(self):
         return f'<EmailRecord {self.record_id}>'
 
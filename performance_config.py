@@ -13,16 +13,39 @@ class PerformanceConfig:
         
         # Processing parameters
         self.chunk_size = int(os.environ.get('EMAIL_GUARDIAN_CHUNK_SIZE', '1000' if self.fast_mode else '500'))
-        self.max_ml_records = int(os.environ.get('EMAIL_GUARDIAN_MAX_ML_RECORDS', '5000' if self.fast_mode else '15000'))
+        self.max_ml_records = int(os.environ.get('EMAIL_GUARDIAN_MAX_ML_RECORDS', '5000' if self.fast_mode else '15000'))  # Rows sampled to fit the anomaly model
+        self.ml_batch_size = int(os.environ.get('EMAIL_GUARDIAN_ML_BATCH_SIZE', '5000'))  # Rows scored per batch
         self.ml_estimators = int(os.environ.get('EMAIL_GUARDIAN_ML_ESTIMATORS', '50' if self.fast_mode else '100'))
+        self.ml_workers = int(os.environ.get('EMAIL_GUARDIAN_ML_WORKERS', '1'))  # Scoring processes, 0 = one per CPU
+        self.ml_model_registry = os.environ.get('EMAIL_GUARDIAN_ML_MODEL_REGISTRY', 'true').lower() == 'true'  # Reuse fitted models across sessions
+        self.ml_model_dir = os.environ.get('EMAIL_GUARDIAN_ML_MODEL_DIR', os.path.join('data', 'models'))
+        self.ml_drift_threshold = float(os.environ.get('EMAIL_GUARDIAN_ML_DRIFT_THRESHOLD', '0.25'))  # Feature mean shift (in training stds) that forces a refit
         self.progress_update_interval = int(os.environ.get('EMAIL_GUARDIAN_PROGRESS_INTERVAL', '500' if self.fast_mode else '100'))
         
         # Feature engineering settings
         self.tfidf_max_features = int(os.environ.get('EMAIL_GUARDIAN_TFIDF_FEATURES', '500' if self.fast_mode else '1000'))
         self.skip_advanced_analysis = os.environ.get('EMAIL_GUARDIAN_SKIP_ADVANCED', 'true' if self.fast_mode else 'false').lower() == 'true'
         
+        # Rule evaluation settings
+        self.rule_batch_mode = os.environ.get('EMAIL_GUARDIAN_RULE_BATCH_MODE', 'true').lower() == 'true'  # Vectorized rule masks for stored sessions
+        self.keyword_matcher_cache_size = int(os.environ.get('EMAIL_GUARDIAN_KEYWORD_MATCHER_CACHE_SIZE', '32'))  # Keyword automata kept in memory, least recently used dropped first
+        
         # Database settings
         self.batch_commit_size = int(os.environ.get('EMAIL_GUARDIAN_BATCH_SIZE', '100' if self.fast_mode else '50'))
+        self.pipeline_queue_size = int(os.environ.get('EMAIL_GUARDIAN_PIPELINE_QUEUE_SIZE', '2'))  # Chunks buffered between ingest stages
+        self.bulk_writer = os.environ.get('EMAIL_GUARDIAN_BULK_WRITER', 'auto').lower()  # auto, insert, copy, orm
+        self.bulk_updater = os.environ.get('EMAIL_GUARDIAN_BULK_UPDATER', 'auto').lower()  # auto, executemany, mappings, temp_table
+        
+        # Case list settings
+        self.cases_estimate_above = int(os.environ.get('EMAIL_GUARDIAN_CASES_ESTIMATE_ABOVE', '100000'))  # Filtered case counts stop here, 0 = always exact
+        
+        # Analytics settings
+        self.snapshot_cache_size = int(os.environ.get('EMAIL_GUARDIAN_SNAPSHOT_CACHE_SIZE', '4'))  # Session snapshots kept in memory for the analytics
+        self.result_cache_entries = int(os.environ.get('EMAIL_GUARDIAN_RESULT_CACHE_ENTRIES', '128'))  # Analysis results kept per process, 0 = off
+        self.result_cache_max_bytes = int(os.environ.get('EMAIL_GUARDIAN_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        self.result_cache_path = os.environ.get('EMAIL_GUARDIAN_RESULT_CACHE_PATH', '')  # SQLite file shared by all workers, empty = per process only
+        self.result_cache_disk_bytes = int(os.environ.get('EMAIL_GUARDIAN_RESULT_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+        self.domain_class_cache_size = int(os.environ.get('EMAIL_GUARDIAN_DOMAIN_CLASS_CACHE_SIZE', '65536'))  # Memoized domain classifications
     
     def get_config_summary(self):
         """Return configuration summary for logging"""
@@ -30,11 +53,28 @@ class PerformanceConfig:
             'fast_mode': self.fast_mode,
             'chunk_size': self.chunk_size,
             'max_ml_records': self.max_ml_records,
+            'ml_batch_size': self.ml_batch_size,
             'ml_estimators': self.ml_estimators,
+            'ml_workers': self.ml_workers,
+            'ml_model_registry': self.ml_model_registry,
+            'ml_model_dir': self.ml_model_dir,
+            'ml_drift_threshold': self.ml_drift_threshold,
             'progress_update_interval': self.progress_update_interval,
             'tfidf_max_features': self.tfidf_max_features,
             'skip_advanced_analysis': self.skip_advanced_analysis,
-            'batch_commit_size': self.batch_commit_size
+            'rule_batch_mode': self.rule_batch_mode,
+            'keyword_matcher_cache_size': self.keyword_matcher_cache_size,
+            'batch_commit_size': self.batch_commit_size,
+            'pipeline_queue_size': self.pipeline_queue_size,
+            'bulk_writer': self.bulk_writer,
+            'bulk_updater': self.bulk_updater,
+            'cases_estimate_above': self.cases_estimate_above,
+            'snapshot_cache_size': self.snapshot_cache_size,
+            'result_cache_entries': self.result_cache_entries,
+            'result_cache_max_bytes': self.result_cache_max_bytes,
+            'result_cache_path': self.result_cache_path,
+            'result_cache_disk_bytes': self.result_cache_disk_bytes,
+            'domain_class_cache_size': self.domain_class_cache_size
         }
 
 # Global configuration instance
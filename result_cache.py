@@ -0,0 +1,208 @@
+"""
+Analytics result cache for Email Guardian
+Bounded LRU cache of AdvancedMLEngine results keyed by session data version,
+optionally backed by a SQLite file shared by every worker process
+"""
+import os
+import json
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from performance_config import config
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Pickled analysis results, evicted least recently used first
+
+    Keys name the analysis, the session and the session's data_version, so a
+    workflow run, reprocess or case edit (which all bump the version) makes
+    older results unreachable instead of needing explicit invalidation.
+
+    The in-process tier is bounded by `max_entries` and `max_bytes`. With a
+    `path`, results are also written to a SQLite file bounded by `disk_bytes`,
+    so a result computed by one gunicorn worker is served to the others.
+    Cached values are returned as fresh copies; callers may modify them.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, path=None, disk_bytes=None):
+        self.max_entries = config.result_cache_entries if max_entries is None else max_entries
+        self.max_bytes = config.result_cache_max_bytes if max_bytes is None else max_bytes
+        self.path = config.result_cache_path if path is None else path
+        self.disk_bytes = config.result_cache_disk_bytes if disk_bytes is None else disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self.path:
+            self._ensure_disk()
+
+    def make_key(self, name, session_id, data_version, *context):
+        """Cache key for an analysis, or None when the session has no data version to key on"""
+        if data_version is None:
+            return None
+        return json.dumps([name, session_id, data_version] + list(context))
+
+    def get(self, key):
+        """Cached value for key, or None on a miss"""
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        payload = entry[1] if entry is not None else None
+
+        if payload is None and self.path:
+            session_id, payload = self._disk_get(key)
+            if payload is not None:
+                self._remember(key, session_id, payload)
+
+        if payload is None:
+            return None
+        try:
+            return pickle.loads(payload)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached result: {str(e)}")
+            self.delete(key)
+            return None
+
+    def set(self, key, value, session_id=None):
+        """Store value under key; values that cannot be pickled are not cached"""
+        if key is None:
+            return
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Result not cached: {str(e)}")
+            return
+
+        self._remember(key, session_id, payload)
+        if self.path:
+            self._disk_set(key, session_id, payload)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[1])
+        if self.path:
+            self._disk_execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def invalidate_session(self, session_id):
+        """Drop every result cached for a session"""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[0] == session_id]:
+                self._size -= len(self._entries.pop(key)[1])
+        if self.path:
+            self._disk_execute("DELETE FROM results WHERE session_id = ?", (session_id,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.path:
+            self._disk_execute("DELETE FROM results")
+
+    def stats(self):
+        """Entry count and bytes held in process"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size}
+
+    def _remember(self, key, session_id, payload):
+        """Add payload to the in-process tier and evict down to the limits"""
+        if self.max_entries <= 0 or len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (session_id, payload)
+            self._size += len(payload)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[1])
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _ensure_disk(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, session_id TEXT, "
+                    "value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_results_accessed ON results (accessed)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_results_session ON results (session_id)")
+            conn.close()
+        except Exception as e:
+            logger.error(f"Shared result cache at {self.path} unavailable, caching in process only: {str(e)}")
+            self.path = None
+
+    def _disk_execute(self, sql, params=()):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(sql, params)
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Shared result cache write failed: {str(e)}")
+
+    def _disk_get(self, key):
+        try:
+            conn = self._connect()
+            with conn:
+                row = conn.execute("SELECT session_id, value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            conn.close()
+            return row if row else (None, None)
+        except Exception as e:
+            logger.warning(f"Shared result cache read failed: {str(e)}")
+            return None, None
+
+    def _disk_set(self, key, session_id, payload):
+        if len(payload) > self.disk_bytes:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, session_id, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, session_id, payload, len(payload), time.time())
+                )
+                # Evict least recently read results until the file is back under its byte budget
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                if total > self.disk_bytes:
+                    freed = 0
+                    evict = []
+                    for row_key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+                        if total - freed <= self.disk_bytes:
+                            break
+                        evict.append((row_key,))
+                        freed += size
+                    conn.executemany("DELETE FROM results WHERE key = ?", evict)
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Shared result cache write failed: {str(e)}")
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Process-wide ResultCache built from the performance config"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -3,11 +3,14 @@ from app import app, db
 from models import ProcessingSession, EmailRecord, Rule, WhitelistDomain, AttachmentKeyword, ProcessingError
 from session_manager import SessionManager
 from data_processor import DataProcessor
-from ml_engine import MLEngine
+from ml_engine import MLEngine, invalidate_attachment_keywords
 from advanced_ml_engine import AdvancedMLEngine
 from performance_config import config
 from rule_engine import RuleEngine
 from domain_manager import DomainManager
+from stats_service import StatsService
+from case_pagination import CasePaginator
+from search_index import SearchIndex
 import uuid
 import os
 import json
@@ -23,6 +26,9 @@ ml_engine = MLEngine()
 advanced_ml_engine = AdvancedMLEngine()
 rule_engine = RuleEngine()
 domain_manager = DomainManager()
+stats_service = StatsService()
+case_paginator = CasePaginator(per_page=50)
+search_index = SearchIndex()
 
 @app.route('/')
 def index():
@@ -146,36 +152,8 @@ def processing_status(session_id):
     workflow_stats = {}
     if session.status in ['processing', 'completed']:
         try:
-            # Count excluded records
-            excluded_count = EmailRecord.query.filter(
-                EmailRecord.session_id == session_id,
-                EmailRecord.excluded_by_rule.isnot(None)
-            ).count()
-
-            # Count whitelisted records  
-            whitelisted_count = EmailRecord.query.filter_by(
-                session_id=session_id,
-                whitelisted=True
-            ).count()
-
-            # Count records with rule matches
-            rules_matched_count = EmailRecord.query.filter(
-                EmailRecord.session_id == session_id,
-                EmailRecord.rule_matches.isnot(None)
-            ).count()
-
-            # Count critical cases
-            critical_cases_count = EmailRecord.query.filter_by(
-                session_id=session_id,
-                risk_level='Critical'
-            ).count()
-
-            workflow_stats = {
-                'excluded_count': excluded_count,
-                'whitelisted_count': whitelisted_count,
-                'rules_matched_count': rules_matched_count,
-                'critical_cases_count': critical_cases_count
-            }
+            # Excluded, whitelisted, rule matched and critical counts in one aggregate, or the stored summary
+            workflow_stats = stats_service.workflow_stats(stats_service.get_summary_counts(session_id))
         except Exception as e:
             logger.warning(f"Could not get workflow stats: {str(e)}")
 
@@ -192,21 +170,14 @@ def processing_status(session_id):
 def dashboard_stats(session_id):
     """Get real-time dashboard statistics for animations"""
     try:
-        # Get basic stats
-        stats = session_manager.get_processing_stats(session_id)
-        ml_insights = ml_engine.get_insights(session_id)
-
-        # Get real-time counts
-        total_records = EmailRecord.query.filter_by(session_id=session_id).count()
-        critical_cases = EmailRecord.query.filter_by(
-            session_id=session_id, 
-            risk_level='Critical'
-        ).filter(EmailRecord.whitelisted != True).count()
-
-        whitelisted_records = EmailRecord.query.filter_by(
-            session_id=session_id,
-            whitelisted=True
-        ).count()
+        # Get counts (stored summary once completed), shared by the basic stats and ML insights
+        counts = stats_service.get_summary_counts(session_id)
+        stats = session_manager.get_processing_stats(session_id, counts)
+        ml_insights = ml_engine.get_insights(session_id, counts)
+
+        total_records = counts['total']
+        critical_cases = counts['critical_active']
+        whitelisted_records = counts['whitelisted']
 
         return jsonify({
             'total_records': total_records,
@@ -230,16 +201,23 @@ def dashboard(session_id):
     if session.status in ['uploaded', 'processing']:
         return render_template('processing.html', session=session)
 
+    # Session counters from the stored summary, shared by the sections below
+    try:
+        counts = stats_service.get_summary_counts(session_id)
+    except Exception as e:
+        logger.warning(f"Could not get session counts: {str(e)}")
+        counts = None
+
     # Get processing statistics
     try:
-        stats = session_manager.get_processing_stats(session_id)
+        stats = session_manager.get_processing_stats(session_id, counts)
     except Exception as e:
         logger.warning(f"Could not get processing stats: {str(e)}")
         stats = {}
 
     # Get ML insights
     try:
-        ml_insights = ml_engine.get_insights(session_id)
+        ml_insights = ml_engine.get_insights(session_id, counts)
     except Exception as e:
         logger.warning(f"Could not get ML insights: {str(e)}")
         ml_insights = {}
@@ -308,36 +286,7 @@ def dashboard(session_id):
     # Get workflow statistics for the dashboard
     workflow_stats = {}
     try:
-        # Count excluded records
-        excluded_count = EmailRecord.query.filter(
-            EmailRecord.session_id == session_id,
-            EmailRecord.excluded_by_rule.isnot(None)
-        ).count()
-
-        # Count whitelisted records  
-        whitelisted_count = EmailRecord.query.filter_by(
-            session_id=session_id,
-            whitelisted=True
-        ).count()
-
-        # Count records with rule matches
-        rules_matched_count = EmailRecord.query.filter(
-            EmailRecord.session_id == session_id,
-            EmailRecord.rule_matches.isnot(None)
-        ).count()
-
-        # Count critical cases
-        critical_cases_count = EmailRecord.query.filter_by(
-            session_id=session_id,
-            risk_level='Critical'
-        ).count()
-
-        workflow_stats = {
-            'excluded_count': excluded_count,
-            'whitelisted_count': whitelisted_count,
-            'rules_matched_count': rules_matched_count,
-            'critical_cases_count': critical_cases_count
-        }
+        workflow_stats = stats_service.workflow_stats(counts or stats_service.get_summary_counts(session_id))
     except Exception as e:
         logger.warning(f"Could not get workflow stats for dashboard: {str(e)}")
 
@@ -356,6 +305,8 @@ def cases(session_id):
 
     # Get filter parameters
     page = request.args.get('page', 1, type=int)
+    after = request.args.get('after', '')
+    before = request.args.get('before', '')
     risk_level = request.args.get('risk_level', '')
     case_status = request.args.get('case_status', '')
     search = request.args.get('search', '')
@@ -383,37 +334,26 @@ def cases(session_id):
     if case_status:
         query = query.filter(EmailRecord.case_status == case_status)
     if search:
-        query = query.filter(
-            db.or_(
-                EmailRecord.sender.contains(search),
-                EmailRecord.subject.contains(search),
-                EmailRecord.recipients_email_domain.contains(search)
-            )
-        )
+        # Full-text match on sender, subject, attachments, justification and domain
+        query = search_index.apply(query, search)
 
-    # Apply sorting and pagination
-    cases_pagination = query.order_by(EmailRecord.ml_risk_score.desc()).paginate(
-        page=page, per_page=50, error_out=False
-    )
+    # Get comprehensive data breakdown statistics from the session summary
+    counts = stats_service.get_summary_counts(session_id)
 
-    # Get comprehensive data breakdown statistics
-    total_records = EmailRecord.query.filter_by(session_id=session_id).count()
+    # Unfiltered views already have their size in the summary; filtered ones are counted
+    view_totals = {'active': 'cases_shown', 'whitelisted': 'whitelisted', 'excluded': 'excluded', 'all': 'total'}
+    known_total = None
+    if view_type in view_totals and not (risk_level or case_status or search):
+        known_total = counts[view_totals[view_type]]
 
-    total_whitelisted = EmailRecord.query.filter_by(session_id=session_id).filter(
-        EmailRecord.whitelisted == True
-    ).count()
-
-    total_excluded = EmailRecord.query.filter(
-        EmailRecord.session_id == session_id,
-        EmailRecord.excluded_by_rule.isnot(None)
-    ).count()
+    # Seek pagination in risk score order, loading only the listed columns
+    cases_pagination = case_paginator.paginate(query, after=after, before=before, page=page, total=known_total)
+    total_records = counts['total']
+    total_whitelisted = counts['whitelisted']
+    total_excluded = counts['excluded']
 
     # Cases shown (non-whitelisted, non-excluded)
-    cases_shown = EmailRecord.query.filter(
-        EmailRecord.session_id == session_id,
-        EmailRecord.whitelisted != True,
-        EmailRecord.excluded_by_rule.is_(None)
-    ).count()
+    cases_shown = counts['cases_shown']
 
     active_whitelist_domains = WhitelistDomain.query.filter_by(is_active=True).count()
 
@@ -835,6 +775,9 @@ def api_attachment_keywords():
             db.session.add(new_keyword)
             db.session.commit()
 
+            # Reload keywords and rebuild keyword automata on next use
+            invalidate_attachment_keywords()
+
             return jsonify({'success': True, 'message': 'Keyword added successfully'})
 
         except Exception as e:
@@ -850,6 +793,9 @@ def api_delete_attachment_keyword(keyword_id):
         keyword.is_active = False  # Soft delete
         db.session.commit()
 
+        # Reload keywords and rebuild keyword automata on next use
+        invalidate_attachment_keywords()
+
         return jsonify({'success': True, 'message': 'Keyword deleted successfully'})
 
     except Exception as e:
@@ -1097,7 +1043,10 @@ def update_case_status(session_id, record_id):
         case = EmailRecord.query.filter_by(session_id=session_id, record_id=record_id).first_or_404()
         data = request.get_json()
 
+        # Keep the session summary's case status counts in step with this edit
+        old_status = case.case_status
         case.case_status = data.get('status', case.case_status)
+        stats_service.adjust_case_status(session_id, old_status, case.case_status)
         case.notes = data.get('notes', case.notes)
 
         if data.get('status') == 'Escalated':
@@ -1212,13 +1161,8 @@ def api_processing_errors(session_id):
 def api_sender_details(session_id, sender_email):
     """Get detailed sender information"""
     try:
-        # Get sender analysis
-        analysis = advanced_ml_engine.analyze_sender_behavior(session_id)
-
-        if not analysis or 'sender_profiles' not in analysis:
-            return jsonify({'error': 'No sender analysis available'}), 404
-
-        sender_data = analysis['sender_profiles'].get(sender_email)
+        # Profile just this sender, any sender in the session rather than only the top risky ones
+        sender_data = advanced_ml_engine.get_sender_details(session_id, sender_email)
 
         if not sender_data:
             return jsonify({'error': 'Sender not found in analysis'}), 404
@@ -1264,6 +1208,7 @@ def delete_session(session_id):
 
         # Delete associated email records
         EmailRecord.query.filter_by(session_id=session_id).delete()
+        stats_service.delete_summary(session_id)
 
         # Delete processing errors
         ProcessingError.query.filter_by(session_id=session_id).delete()
@@ -1308,6 +1253,7 @@ def cleanup_old_sessions():
                 # Delete associated records
                 EmailRecord.query.filter_by(session_id=session.id).delete()
                 ProcessingError.query.filter_by(session_id=session.id).delete()
+                stats_service.delete_summary(session.id)
 
                 # Delete files
                 if session.data_path and os.path.exists(session.data_path):
@@ -1421,6 +1367,7 @@ def populate_default_keywords():
             db.session.add(keyword)
 
         db.session.commit()
+        invalidate_attachment_keywords()
 
         logger.info(f"Added {len(default_keywords)} default keywords to database")
         return jsonify({
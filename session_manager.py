@@ -4,6 +4,7 @@ import gzip
 import logging
 from datetime import datetime
 from models import ProcessingSession, EmailRecord
+from stats_service import StatsService
 from app import db
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ class SessionManager:
     
     def __init__(self):
         self.data_dir = 'data'
+        self.stats_service = StatsService()
         os.makedirs(self.data_dir, exist_ok=True)
     
     def save_session_data(self, session_id, data):
@@ -71,24 +73,20 @@ class SessionManager:
             logger.error(f"Error loading session data for {session_id}: {str(e)}")
             return None
     
-    def get_processing_stats(self, session_id):
-        """Get comprehensive processing statistics for a session"""
+    def get_processing_stats(self, session_id, counts=None):
+        """Get comprehensive processing statistics for a session
+        
+        counts is a StatsService.get_session_counts or get_summary_counts result
+        the caller already has; top domains and senders come with the latter.
+        """
         try:
             session = ProcessingSession.query.get(session_id)
             if not session:
                 return {}
             
-            # Get record counts by risk level
-            risk_counts = db.session.query(
-                EmailRecord.risk_level,
-                db.func.count(EmailRecord.id)
-            ).filter_by(session_id=session_id).group_by(EmailRecord.risk_level).all()
-            
-            # Get case status counts
-            status_counts = db.session.query(
-                EmailRecord.case_status,
-                db.func.count(EmailRecord.id)
-            ).filter_by(session_id=session_id).group_by(EmailRecord.case_status).all()
+            # Record counts by risk level and case status from the shared aggregate
+            if counts is None:
+                counts = self.stats_service.get_session_counts(session_id)
             
             # Get workflow stage completion
             workflow_stats = {
@@ -113,8 +111,10 @@ class SessionManager:
                     'processed_records': processed_records,
                     'processing_efficiency': round(processing_efficiency, 2)
                 },
-                'risk_distribution': {level: count for level, count in risk_counts},
-                'case_status_distribution': {status: count for status, count in status_counts},
+                'risk_distribution': counts['risk_distribution'],
+                'case_status_distribution': counts['case_status_distribution'],
+                'top_domains': counts.get('top_domains', []),
+                'top_senders': counts.get('top_senders', []),
                 'workflow_stages': workflow_stats,
                 'processing_stats': session.processing_stats or {}
             }
@@ -188,6 +188,7 @@ class SessionManager:
                 
                 # Remove database records
                 EmailRecord.query.filter_by(session_id=session_id).delete()
+                self.stats_service.delete_summary(session_id)
                 db.session.delete(session)
                 db.session.commit()
                 
@@ -0,0 +1,138 @@
+"""
+Session snapshots for Email Guardian
+Read-only columnar copies of a session's records, loaded once and shared by
+the advanced analytics instead of each loading the session as ORM objects
+"""
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from models import EmailRecord
+from stats_service import StatsService
+from performance_config import config
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class SessionSnapshot:
+    """Immutable NumPy arrays of the record columns the analytics read
+
+    Text columns are object arrays holding the stored values (None included);
+    ml_risk_score is a float64 array with NaN for unscored records. Rows are
+    in id order. Arrays are read-only; values derived from them are built once
+    per snapshot with `derive()`.
+    """
+
+    columns = ['id', 'record_id', 'sender', 'recipients_email_domain', 'attachments', 'time',
+               'leaver', 'justification', 'risk_level', 'ml_risk_score']
+
+    def __init__(self, session_id, data_version, arrays):
+        self.session_id = session_id
+        self.data_version = data_version
+        self._arrays = {}
+        for name, values in arrays.items():
+            values.flags.writeable = False
+            self._arrays[name] = values
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._arrays['id'])
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def to_list(self, name):
+        """Column as Python values, with None for missing scores"""
+        values = self._arrays[name].tolist()
+        if self._arrays[name].dtype.kind == 'f':
+            values = [None if value != value else value for value in values]
+        return values
+
+    def iter_rows(self, *names):
+        """Row tuples of the named columns, as Python values"""
+        return zip(*(self.to_list(name) for name in names))
+
+    def present(self, name):
+        """Boolean mask of rows whose column value is truthy (not None or empty)"""
+        return self.derive(f'{name}:present', lambda: np.fromiter(
+            (bool(value) for value in self._arrays[name]), dtype=bool, count=len(self)
+        ))
+
+    def derive(self, key, build):
+        """Value built from this snapshot once and shared by later callers; arrays become read-only"""
+        value = self._derived.get(key)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = build()
+                    if isinstance(value, np.ndarray):
+                        value.flags.writeable = False
+                    self._derived[key] = value
+        return value
+
+def load_session_snapshot(session_id, data_version=None):
+    """Read a session's records into a new SessionSnapshot with one column query"""
+    try:
+        columns = [getattr(EmailRecord, name) for name in SessionSnapshot.columns]
+        rows = db.session.query(*columns).filter(
+            EmailRecord.session_id == session_id
+        ).order_by(EmailRecord.id).all()
+
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        arrays = {}
+        for name, column_values in zip(SessionSnapshot.columns, values):
+            if name == 'id':
+                arrays[name] = np.array(column_values, dtype=np.int64)
+            elif name == 'ml_risk_score':
+                arrays[name] = np.array([np.nan if value is None else value for value in column_values],
+                                        dtype=np.float64)
+            else:
+                array = np.empty(len(column_values), dtype=object)
+                array[:] = column_values
+                arrays[name] = array
+
+        logger.info(f"Loaded snapshot of session {session_id} (version {data_version}): {len(rows)} records")
+        return SessionSnapshot(session_id, data_version, arrays)
+
+    except Exception as e:
+        logger.error(f"Error loading snapshot for session {session_id}: {str(e)}")
+        raise
+
+# Snapshots of completed sessions by (session_id, data_version), least recently used first
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+def get_session_snapshot(session_id):
+    """Shared snapshot of a session, reloaded only when its data_version changes
+
+    Sessions without a current summary (still processing or being
+    reprocessed) are loaded fresh on every call and not cached.
+    """
+    data_version = StatsService().get_data_version(session_id)
+    if data_version is None:
+        return load_session_snapshot(session_id)
+
+    key = (session_id, data_version)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is not None:
+            _snapshots.move_to_end(key)
+            return snapshot
+
+    snapshot = load_session_snapshot(session_id, data_version)
+    with _snapshots_lock:
+        # Older versions of this session can never be asked for again
+        for stale in [k for k in _snapshots if k[0] == session_id and k != key]:
+            del _snapshots[stale]
+        _snapshots[key] = snapshot
+        while len(_snapshots) > max(config.snapshot_cache_size, 1):
+            _snapshots.popitem(last=False)
+    return snapshot
+
+def clear_session_snapshots(session_id=None):
+    """Drop cached snapshots, for one session or all of them"""
+    with _snapshots_lock:
+        for key in [k for k in _snapshots if session_id is None or k[0] == session_id]:
+            del _snapshots[key]
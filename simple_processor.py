@@ -7,6 +7,7 @@ import pandas as pd
 import logging
 from datetime import datetime
 from models import ProcessingSession, EmailRecord
+from search_index import SearchIndex
 from app import db
 
 logger = logging.getLogger(__name__)
@@ -46,6 +47,12 @@ class SimpleProcessor:
                     db.session.commit()
                     logger.info(f"Simple processing: {processed_count}/{total_records} records")
             
+            # Make the new records searchable from the cases page
+            try:
+                SearchIndex().index_session(session_id)
+            except Exception as e:
+                logger.warning(f"Could not index session {session_id} for search: {str(e)}")
+            
             # Apply basic analysis only
             self._apply_basic_analysis(session_id)
             
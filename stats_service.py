@@ -0,0 +1,216 @@
+"""
+Session statistics service for Email Guardian
+Computes every per-session counter the dashboards use in one aggregate query
+and keeps a materialized summary of them for completed sessions
+"""
+import logging
+from models import ProcessingSession, EmailRecord, SessionSummary
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class StatsService:
+    """Per-session record counters from a single SUM(CASE WHEN ...) aggregate
+
+    `get_session_counts()` returns one flat dict that the status, dashboard and
+    case routes, SessionManager.get_processing_stats and MLEngine.get_insights
+    all read from, so a page needs one scan of the session's records instead of
+    one COUNT(*) per counter.
+
+    Completed sessions keep those counters, plus their top domains and
+    senders, in the session_summaries table. `refresh_summary()` rebuilds it at
+    the end of the workflow and `adjust_case_status()` keeps it current on case
+    edits, so `get_summary_counts()` is a primary key lookup.
+    """
+
+    risk_levels = ['Critical', 'High', 'Medium', 'Low']
+    case_statuses = ['Active', 'Cleared', 'Escalated']
+    distribution_keys = ['risk_distribution', 'case_status_distribution']
+    top_limit = 10
+
+    def get_session_counts(self, session_id):
+        """All counters for a session"""
+        try:
+            not_whitelisted = EmailRecord.whitelisted != True
+            not_excluded = EmailRecord.excluded_by_rule.is_(None)
+
+            conditions = {
+                'excluded': EmailRecord.excluded_by_rule.isnot(None),
+                'whitelisted': EmailRecord.whitelisted == True,
+                'rules_matched': EmailRecord.rule_matches.isnot(None),
+                'critical': EmailRecord.risk_level == 'Critical',
+                'critical_active': db.and_(EmailRecord.risk_level == 'Critical', not_whitelisted),
+                'cases_shown': db.and_(not_whitelisted, not_excluded),
+                'risk_none': EmailRecord.risk_level.is_(None),
+                'status_none': EmailRecord.case_status.is_(None)
+            }
+            for level in self.risk_levels:
+                conditions[f'risk_{level}'] = EmailRecord.risk_level == level
+            for status in self.case_statuses:
+                conditions[f'status_{status}'] = EmailRecord.case_status == status
+
+            columns = [db.func.count(EmailRecord.id).label('total'),
+                       db.func.count(EmailRecord.ml_risk_score).label('analyzed'),
+                       db.func.avg(EmailRecord.ml_risk_score).label('average_risk_score')]
+            columns += [db.func.sum(db.case((condition, 1), else_=0)).label(name)
+                        for name, condition in conditions.items()]
+
+            row = db.session.query(*columns).filter(EmailRecord.session_id == session_id).one()
+            counts = {name: int(value or 0) for name, value in row._asdict().items() if name != 'average_risk_score'}
+            counts['average_risk_score'] = float(row.average_risk_score or 0.0)
+
+            counts['risk_distribution'] = self._distribution(
+                session_id, EmailRecord.risk_level, counts, 'risk', self.risk_levels)
+            counts['case_status_distribution'] = self._distribution(
+                session_id, EmailRecord.case_status, counts, 'status', self.case_statuses)
+            return counts
+
+        except Exception as e:
+            logger.error(f"Error getting session counts for {session_id}: {str(e)}")
+            raise
+
+    def workflow_stats(self, counts):
+        """Workflow counters in the shape the status API and dashboard expect"""
+        return {
+            'excluded_count': counts['excluded'],
+            'whitelisted_count': counts['whitelisted'],
+            'rules_matched_count': counts['rules_matched'],
+            'critical_cases_count': counts['critical']
+        }
+
+    def _distribution(self, session_id, column, counts, prefix, values):
+        """{value: count} for the values present, like GROUP BY column
+
+        Built from the aggregate; values outside the known set fall back to a
+        GROUP BY query.
+        """
+        distribution = {value: counts[f'{prefix}_{value}'] for value in values if counts[f'{prefix}_{value}']}
+        if counts[f'{prefix}_none']:
+            distribution[None] = counts[f'{prefix}_none']
+
+        if sum(distribution.values()) != counts['total']:
+            grouped = db.session.query(column, db.func.count(EmailRecord.id)).filter(
+                EmailRecord.session_id == session_id
+            ).group_by(column).all()
+            distribution = {value: count for value, count in grouped}
+        return distribution
+
+    def get_summary_counts(self, session_id):
+        """Counters for a session, from its summary once the session has completed
+
+        Completed sessions without a summary yet (processed before summaries
+        existed) get one built here. Other sessions are still changing and are
+        counted live.
+        """
+        summary = SessionSummary.query.get(session_id)
+        if summary is not None and summary.counts is not None:
+            return self._summary_counts(summary)
+
+        session = ProcessingSession.query.get(session_id)
+        if session is None or session.status != 'completed':
+            return self.get_session_counts(session_id)
+
+        try:
+            return self._summary_counts(self.refresh_summary(session_id))
+        except Exception as e:
+            # E.g. another request built it first; count live this time
+            logger.warning(f"Could not build summary for {session_id}: {str(e)}")
+            return self.get_session_counts(session_id)
+
+    def refresh_summary(self, session_id):
+        """Recompute and store the summary for a session"""
+        try:
+            counts = self.get_session_counts(session_id)
+            for key in self.distribution_keys:
+                counts[key] = [[value, count] for value, count in counts[key].items()]
+
+            summary = SessionSummary.query.get(session_id)
+            if summary is None:
+                summary = SessionSummary()
+                summary.session_id = session_id
+                summary.data_version = 0
+                db.session.add(summary)
+
+            summary.counts = counts
+            summary.top_domains = self._top_values(session_id, EmailRecord.recipients_email_domain)
+            summary.top_senders = self._top_values(session_id, EmailRecord.sender)
+            summary.data_version = (summary.data_version or 0) + 1
+            db.session.commit()
+
+            logger.info(f"Refreshed summary for session {session_id} (version {summary.data_version})")
+            return summary
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing summary for {session_id}: {str(e)}")
+            raise
+
+    def adjust_case_status(self, session_id, old_status, new_status):
+        """Move one record between case status counters in the stored summary
+
+        Runs in the caller's transaction, so the summary commits together with
+        the case update. Sessions without a summary are left alone.
+        """
+        if old_status == new_status:
+            return
+
+        summary = SessionSummary.query.filter_by(session_id=session_id).with_for_update().first()
+        if summary is None:
+            return
+        summary.data_version = (summary.data_version or 0) + 1
+        if summary.counts is None:
+            return
+
+        # Assign a new dict so SQLAlchemy sees the JSON column change
+        counts = dict(summary.counts)
+        distribution = dict(counts['case_status_distribution'])
+        for status, delta in ((old_status, -1), (new_status, 1)):
+            key = f'status_{status}' if status in self.case_statuses else 'status_none' if status is None else None
+            if key:
+                counts[key] = counts.get(key, 0) + delta
+            distribution[status] = distribution.get(status, 0) + delta
+
+        counts['case_status_distribution'] = [[status, count] for status, count in distribution.items() if count > 0]
+        summary.counts = counts
+
+    def invalidate_summary(self, session_id):
+        """Mark a session's summary stale, e.g. before it is reprocessed
+
+        The row is kept so data_version keeps increasing: caches keyed on
+        (session_id, data_version) never see an old version number again.
+        Runs in the caller's transaction.
+        """
+        SessionSummary.query.filter_by(session_id=session_id).update({
+            'counts': db.null(),
+            'data_version': SessionSummary.data_version + 1
+        }, synchronize_session=False)
+
+    def get_data_version(self, session_id):
+        """Current data_version of a session's summary, or None while it has none or it is stale"""
+        return db.session.query(SessionSummary.data_version).filter(
+            SessionSummary.session_id == session_id,
+            SessionSummary.counts.isnot(None)
+        ).scalar()
+
+    def delete_summary(self, session_id):
+        """Drop a session's summary when the session is deleted"""
+        SessionSummary.query.filter_by(session_id=session_id).delete(synchronize_session=False)
+
+    def _summary_counts(self, summary):
+        """Stored summary in the get_session_counts shape, with top lists and version"""
+        counts = dict(summary.counts)
+        for key in self.distribution_keys:
+            counts[key] = {value: count for value, count in counts[key]}
+        counts['top_domains'] = summary.top_domains or []
+        counts['top_senders'] = summary.top_senders or []
+        counts['data_version'] = summary.data_version
+        return counts
+
+    def _top_values(self, session_id, column):
+        """[[value, count], ...] for the most frequent values of column"""
+        count = db.func.count(EmailRecord.id)
+        rows = db.session.query(column, count).filter(
+            EmailRecord.session_id == session_id,
+            column.isnot(None)
+        ).group_by(column).order_by(count.desc(), column).limit(self.top_limit).all()
+        return [[value, total] for value, total in rows]